@@ -0,0 +1,39 @@
+import 基准测试 as bench
+import 文本处理核心 as core
+
+def test_sampled_percentiles_are_exact():
+    stats = core.StageStats(keep_samples=True)
+    for n in range(1, 101):
+        stats.add(n / 100000)
+    
+    # 0.01 ~ 1 ms 全部落在直方图的前三个桶中，按样本计算仍能区分
+    assert round(stats.percentile(0.5), 6) == 0.5
+    assert round(stats.percentile(0.95), 6) == 0.95
+    assert core.StageStats().percentile(0.5) == 0.0
+
+def test_summary_marks_bucket_bound_percentiles():
+    exact = core.RunStats(keep_samples=True)
+    bounded = core.RunStats()
+    for seconds in (0.00001, 0.00001, 0.00001, 0.000072):
+        exact.add("read", seconds)
+        bounded.add("read", seconds)
+    
+    read = exact.summary()['stages']['read']
+    assert read['percentiles'] == "exact"
+    assert read['p50_ms'] == 0.01
+    assert read['p50_ms'] <= read['mean_ms'] <= read['max_ms']
+    assert bounded.summary()['stages']['read']['percentiles'] == "bucket_bound"
+    assert "p50 ≤" in bounded.format_summary()
+    assert "p50 ≤" not in exact.format_summary()
+
+def test_detect_scenario_counts_failures(tmp_path, monkeypatch):
+    def failing_backend(raw_data):
+        raise ImportError("no backend")
+    monkeypatch.setitem(core.DETECTION_BACKENDS, 'chardet', failing_backend)
+    path = tmp_path / "a.txt"
+    path.write_bytes("中文".encode("gbk"))
+    files = [{'path': str(path), 'size': path.stat().st_size}]
+    
+    result = bench.scenario_detect(str(tmp_path), files, str(tmp_path), {})
+    
+    assert (result['success'], result['failed']) == (0, 1)
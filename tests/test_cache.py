@@ -0,0 +1,38 @@
+import sqlite3
+from types import SimpleNamespace
+
+import 文本处理核心 as core
+
+def fake_stat(inode):
+    return SimpleNamespace(st_dev=1, st_ino=inode, st_size=100, st_mtime_ns=inode)
+
+def test_results_are_kept_per_detector_settings(tmp_path, monkeypatch):
+    monkeypatch.setitem(core.DETECTION_BACKENDS, 'chardet', lambda raw_data: ('gb18030', 0.9))
+    monkeypatch.setitem(core.DETECTION_BACKENDS, 'universal', lambda raw_data: ('big5', 0.9))
+    path = tmp_path / "a.txt"
+    path.write_bytes("中文内容\n".encode("gbk") * 10)
+    cache = core.EncodingCache(str(tmp_path / "cache.sqlite3"))
+    
+    assert core.EncodingDetector(cache).detect(str(path)) == ("gb18030", 0.9)
+    detector = core.EncodingDetector(cache, 'universal')
+    assert detector.detect(str(path)) == ("big5", 0.9)
+    assert detector.stats['cache'][0] == 0
+    
+    detector = core.EncodingDetector(cache)
+    assert detector.detect(str(path)) == ("gb18030", 0.9)
+    assert detector.stats['cache'][0] == 1
+    cache.close()
+
+def test_eviction_keeps_recently_used_entries(tmp_path):
+    db_path = tmp_path / "cache.sqlite3"
+    cache = core.EncodingCache(str(db_path), max_entries=10)
+    for inode in range(20):
+        cache.put(fake_stat(inode), "utf-8", 1.0)
+    cache.flush()
+    # 调整使用时间：inode 越大越近使用过
+    cache.conn.execute("UPDATE detections SET last_used = CAST(SUBSTR(file_id, 3) AS INTEGER)")
+    cache.close()
+    
+    with sqlite3.connect(db_path) as conn:
+        kept = sorted(int(row[0].split(":")[1]) for row in conn.execute("SELECT file_id FROM detections"))
+    assert kept == list(range(11, 20))
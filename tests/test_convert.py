@@ -0,0 +1,69 @@
+import codecs
+
+import 文本处理核心 as core
+
+def run_convert(records, target_enc, source_enc=None, settings=None, on_file_updated=None):
+    settings = settings or core.OutputSettings()
+    names = core.OutputNameIndex(settings.output_dir)
+    task = core.make_convert_task(settings, target_enc, names, source_enc)
+    results = []
+    runner = core.BatchRunner([record.info() for record in records], task, on_result=results.append,
+                              on_file_updated=on_file_updated, finish=names.finish)
+    runner.run()
+    return results
+
+def test_in_place_conversion_updates_record_encoding(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes("中文\n".encode("gbk"))
+    registry = core.FileRegistry()
+    records = registry.create_records([str(path)])
+    registry.append(records)
+    records[0].encoding = "gbk"
+    
+    results = run_convert(records, "utf-8", on_file_updated=registry.rename)
+    
+    assert [result.status for result in results] == ["ok"]
+    assert records[0].encoding == "utf-8"
+    # 第二次转换按新的编码读取，内容保持不变
+    run_convert(records, "gbk", on_file_updated=registry.rename)
+    assert path.read_bytes() == "中文\n".encode("gbk")
+
+def test_repeated_utf16_conversion_is_unchanged(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("中文\n", encoding="utf-8")
+    registry = core.FileRegistry()
+    records = registry.create_records([str(path)])
+    registry.append(records)
+    records[0].encoding = "utf-8"
+    
+    run_convert(records, "utf-16", on_file_updated=registry.rename)
+    converted = path.read_bytes()
+    results = run_convert(records, "utf-16", on_file_updated=registry.rename)
+    
+    assert [result.status for result in results] == ["unchanged"]
+    assert path.read_bytes() == converted
+    assert converted.count(codecs.BOM_UTF16_LE) == 1
+
+def test_byte_order_change_writes_single_bom(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(codecs.BOM_UTF16_BE + "中文".encode("utf-16-be"))
+    
+    core.stream_convert_file(str(path), str(path), "utf-16-be", "utf-16-le")
+    
+    assert path.read_bytes() == codecs.BOM_UTF16_LE + "中文".encode("utf-16-le")
+
+def test_incremental_conversion_replaces_previous_output(tmp_path):
+    source_dir = tmp_path / "src"
+    source_dir.mkdir()
+    path = source_dir / "a.txt"
+    output_dir = tmp_path / "out"
+    args = ["convert", "--to", "utf-16", "--from", "utf-8", "--output-dir", str(output_dir),
+            "--incremental", "--manifest", str(tmp_path / "manifest.sqlite3"), str(path)]
+    
+    for line in ("one\n", "two\n", "three\n"):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+        assert core.cli_main(args) == 0
+    
+    assert [entry.name for entry in output_dir.iterdir()] == ["a.txt"]
+    assert (output_dir / "a.txt").read_text(encoding="utf-16") == "one\ntwo\nthree\n"
@@ -0,0 +1,63 @@
+import 文本处理核心 as core
+from test_convert import run_convert
+
+def failing_backend(raw_data):
+    raise ImportError("No module named 'chardet'")
+
+def test_backend_failure_blocks_conversion(tmp_path, monkeypatch):
+    monkeypatch.setitem(core.DETECTION_BACKENDS, 'chardet', failing_backend)
+    path = tmp_path / "gbk.txt"
+    data = "中文内容\n".encode("gbk") * 10
+    path.write_bytes(data)
+    
+    assert core.EncodingDetector().detect(str(path)) == (None, 0.0)
+    
+    registry = core.FileRegistry()
+    records = registry.create_records([str(path)])
+    results = run_convert(records, "utf-8")
+    assert [result.status for result in results] == ["failed"]
+    assert path.read_bytes() == data
+
+def mixed_file(tmp_path, filler):
+    """头部、中部、尾部为ASCII，其余为 filler 的大文件"""
+    ascii_block = b"plain ascii line\n" * 1024
+    data = ascii_block + filler + ascii_block + filler + ascii_block
+    path = tmp_path / "mixed.txt"
+    path.write_bytes(data)
+    return path
+
+def sample_backend(raw_data):
+    """统计检测的替身：样本中有非ASCII字节时报告 gb18030"""
+    return ('ascii', 1.0) if raw_data.isascii() else ('gb18030', 0.99)
+
+def test_ascii_windows_are_confirmed_over_whole_file(tmp_path, monkeypatch):
+    monkeypatch.setitem(core.DETECTION_BACKENDS, 'chardet', sample_backend)
+    path = mixed_file(tmp_path, "中文内容\n".encode("gbk") * 7000)
+    detector = core.EncodingDetector()
+    
+    assert detector.detect(str(path)) == ("gb18030", 0.99)
+    assert detector.stats['statistical'][0] == 1
+
+def test_utf8_windows_are_confirmed_over_whole_file(tmp_path, monkeypatch):
+    monkeypatch.setitem(core.DETECTION_BACKENDS, 'chardet', sample_backend)
+    path = mixed_file(tmp_path, "中文内容\n".encode("utf-8") * 5000 + "中文\n".encode("gbk"))
+    assert core.EncodingDetector().detect(str(path)) == ("gb18030", 0.99)
+
+def test_whole_file_ascii_is_detected_without_statistics(tmp_path):
+    path = mixed_file(tmp_path, b"more ascii\n" * 10000)
+    detector = core.EncodingDetector()
+    assert detector.detect(str(path)) == ("ascii", 1.0)
+    assert detector.stats['statistical'][0] == 0
+
+def test_large_files_are_confirmed_by_sampling(tmp_path, monkeypatch):
+    monkeypatch.setitem(core.DETECTION_BACKENDS, 'chardet', sample_backend)
+    monkeypatch.setattr(core.EncodingDetector, 'FULL_CONFIRM_SIZE', 64 * 1024)
+    path = mixed_file(tmp_path, b"more ascii\n" * 10000)
+    
+    # 抽查通过只能说明大概率是ASCII，置信度降低
+    assert core.EncodingDetector().detect(str(path)) == ("ascii", core.EncodingDetector.SAMPLED_CONFIDENCE)
+    
+    path = mixed_file(tmp_path, "中文内容\n".encode("gbk") * 7000)
+    detector = core.EncodingDetector()
+    assert detector.detect(str(path)) == ("gb18030", 0.99)
+    assert detector.stats['statistical'][0] == 1
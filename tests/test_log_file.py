@@ -0,0 +1,28 @@
+import json
+
+import 文本处理核心 as core
+
+def test_rotation_keeps_backups(tmp_path):
+    path = tmp_path / "run.log"
+    log_file = core.LogFile(str(path), max_bytes=100, backups=2)
+    for index in range(20):
+        log_file.write(f"line {index:02}")
+    log_file.close()
+    
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ["run.log", "run.log.1", "run.log.2"]
+    assert all(entry.stat().st_size <= 100 for entry in tmp_path.iterdir())
+    # 最新的日志在当前文件中，较早的依次轮转到 .1、.2，超出保留个数的最旧日志被删除
+    lines = [line.rsplit(" ", 1)[-1] for name in ("run.log.2", "run.log.1", "run.log")
+             for line in (tmp_path / name).read_text().splitlines()]
+    assert lines == [f"{index:02}" for index in range(20 - len(lines), 20)]
+
+def test_level_change_applies_to_later_records(tmp_path):
+    path = tmp_path / "run.jsonl"
+    log_file = core.LogFile(str(path), level="warning")
+    log_file.write_many([("hidden", "info", 1.0), ("shown", "error", 2.0)])
+    log_file.set_level("debug")
+    log_file.write("details", "debug")
+    log_file.close()
+    
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(record['message'], record['level']) for record in records] == [("shown", "error"), ("details", "debug")]
@@ -0,0 +1,34 @@
+import os
+
+import 文本处理核心 as core
+
+def test_allocation_numbers_duplicates(tmp_path):
+    (tmp_path / "a.txt").write_text("old")
+    names = core.OutputNameIndex(str(tmp_path))
+    
+    paths = [names.allocate("a.txt") for _ in range(3)] + [names.allocate("b_1.txt"), names.allocate("b_1.txt")]
+    
+    assert [os.path.basename(path) for path in paths] == ["a_1.txt", "a_2.txt", "a_3.txt", "b_1.txt", "b_2.txt"]
+    # 分配到的名称立即以空的占位文件占用
+    assert all((tmp_path / name).read_bytes() == b"" for name in ("a_1.txt", "b_2.txt"))
+
+def test_file_created_after_listing_is_not_overwritten(tmp_path):
+    names = core.OutputNameIndex(str(tmp_path))
+    names.load()
+    # 其他进程在列举目录之后写入了同名文件
+    (tmp_path / "a.txt").write_text("other")
+    
+    assert names.allocate("a.txt") == str(tmp_path / "a_1.txt")
+    assert (tmp_path / "a.txt").read_text() == "other"
+
+def test_finish_removes_unwritten_placeholders(tmp_path):
+    names = core.OutputNameIndex(str(tmp_path))
+    written = names.allocate("a.txt")
+    names.allocate("b.txt")
+    with open(written, "w") as f:
+        f.write("content")
+    names.written(written)
+    
+    names.finish()
+    
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ["a.txt"]
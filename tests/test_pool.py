@@ -0,0 +1,25 @@
+import os
+
+import 文本处理核心 as core
+
+def crash_on_three(value):
+    if value == 3:
+        # 模拟编解码器段错误或内存不足导致的进程退出
+        os._exit(1)
+    return "ok", value * 10
+
+def test_worker_crash_only_fails_its_own_file():
+    results = {}
+    
+    def task(runner, index, item):
+        def done(result):
+            # 崩溃的文件得到与 convert_file_worker 相同格式的失败结果
+            results[item] = result[:2]
+            return result[0] == "ok", 0
+        return runner.submit(crash_on_three, (item,), done)
+    
+    runner = core.BatchRunner(list(range(8)), task, workers=2)
+    success, canceled = runner.run()
+    
+    assert (success, canceled) == (7, False)
+    assert results == {item: ("failed", 0) if item == 3 else ("ok", item * 10) for item in range(8)}
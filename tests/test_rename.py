@@ -0,0 +1,61 @@
+import os
+
+import 文本处理核心 as core
+
+def test_replace_onto_source_keeps_content(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("content\n")
+    
+    code = core.cli_main(["rename", "--output-dir", str(tmp_path), "--replace", "zzz", "y",
+                          "--on-conflict", "replace", str(path)])
+    
+    assert code == 0
+    assert path.read_text() == "content\n"
+
+def test_replace_over_hardlinked_output_keeps_content(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("content\n")
+    output_dir = tmp_path / "out"
+    args = ["rename", "--output-dir", str(output_dir), "--replace", "a", "b", "--on-conflict", "replace", str(path)]
+    
+    assert core.cli_main(args + ["--materialize", "hardlink"]) == 0
+    # 再次生成时目标与源文件共用同一个 inode
+    assert core.cli_main(args + ["--materialize", "copy"]) == 0
+    
+    assert path.read_text() == "content\n"
+    assert (output_dir / "b.txt").read_text() == "content\n"
+
+def test_replace_over_copied_output_does_not_touch_other_links(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("new\n")
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    (output_dir / "b.txt").write_text("old\n")
+    os.link(output_dir / "b.txt", tmp_path / "keep.txt")
+    
+    assert core.cli_main(["rename", "--output-dir", str(output_dir), "--replace", "a", "b", "--materialize", "copy",
+                          "--on-conflict", "replace", str(path)]) == 0
+    
+    assert (output_dir / "b.txt").read_text() == "new\n"
+    assert (tmp_path / "keep.txt").read_text() == "old\n"
+
+def test_template_encoding_field_uses_detected_encoding(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("中文内容\n", encoding="utf-8")
+    
+    code = core.cli_main(["rename", "--template", "{stem}_{encoding}{ext}", str(path)])
+    
+    assert code == 0
+    assert (tmp_path / "a_utf-8.txt").read_text(encoding="utf-8") == "中文内容\n"
+
+def test_template_encoding_field_detects_cancelled_files(tmp_path):
+    from concurrent.futures import Future
+    path = tmp_path / "a.txt"
+    path.write_text("中文内容\n", encoding="utf-8")
+    detection = Future()
+    detection.cancel()
+    files = [{'id': 0, 'name': "a.txt", 'path': str(path), 'encoding': None, 'detection': detection}]
+    
+    plan = core.RenamePlan(files, core.template_rule("{stem}_{encoding}{ext}"), core.OutputSettings())
+    
+    assert [change.new_name for change in plan.changes] == ["a_utf-8.txt"]
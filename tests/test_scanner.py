@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import 文本处理核心 as core
+
+def scan(root, **options):
+    return [path for batch in core.FolderScanner(**options).iter_batches(str(root)) for path in batch]
+
+def relative(root, paths):
+    return sorted(os.path.relpath(path, root).replace(os.sep, "/") for path in paths)
+
+def make_tree(root):
+    for name in ("a.txt", "b.md", "sub/c.txt", "sub/deep/d.txt", ".git/e.txt", "node_modules/f.txt"):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+
+def test_include_and_exclude_patterns(tmp_path):
+    make_tree(tmp_path)
+    
+    assert relative(tmp_path, scan(tmp_path)) == ["a.txt", "sub/c.txt", "sub/deep/d.txt"]
+    assert relative(tmp_path, scan(tmp_path, include=("*.txt", "*.md"), exclude=core.FolderScanner.DEFAULT_EXCLUDE + ("deep",))) == \
+        ["a.txt", "b.md", "sub/c.txt"]
+
+def test_max_depth(tmp_path):
+    make_tree(tmp_path)
+    
+    assert relative(tmp_path, scan(tmp_path, max_depth=0)) == ["a.txt"]
+    assert relative(tmp_path, scan(tmp_path, max_depth=1)) == ["a.txt", "sub/c.txt"]
+
+def test_symlink_loops_are_visited_once(tmp_path):
+    make_tree(tmp_path)
+    try:
+        os.symlink(tmp_path, tmp_path / "sub" / "loop", target_is_directory=True)
+    except OSError:
+        pytest.skip("不支持符号链接")
+    
+    assert relative(tmp_path, scan(tmp_path)) == ["a.txt", "sub/c.txt", "sub/deep/d.txt"]
+
+def test_results_arrive_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.FolderScanner, "BATCH_SIZE", 5)
+    for folder in range(5):
+        for index in range(5):
+            path = tmp_path / f"d{folder}" / f"{index}.txt"
+            path.parent.mkdir(exist_ok=True)
+            path.write_text("")
+    
+    batches = list(core.FolderScanner().iter_batches(str(tmp_path)))
+    
+    # 每个目录的结果凑满一批就交付，同一目录内按名称排序
+    assert len(batches) == 5
+    assert all([os.path.basename(path) for path in batch] == [f"{index}.txt" for index in range(5)]
+               for batch in batches)
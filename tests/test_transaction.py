@@ -0,0 +1,79 @@
+import os
+
+import 文本处理核心 as core
+
+def make_files(tmp_path, names):
+    files = []
+    for index, name in enumerate(names):
+        path = tmp_path / name
+        path.write_text(name)
+        files.append({'id': index, 'name': name, 'path': str(path), 'encoding': None, 'detection': None})
+    return files
+
+def run_rename(files, name_func, policy="skip"):
+    plan = core.RenamePlan(files, name_func, core.OutputSettings())
+    transaction = core.RenameTransaction(plan, core.ConflictResolver(policy))
+    results = []
+    runner = core.BatchRunner(transaction.changes, transaction.execute, on_result=results.append,
+                              prepare=transaction.prepare, finish=transaction.finish)
+    runner.run()
+    return [result.status for result in results]
+
+def contents(tmp_path):
+    return {entry.name: entry.read_text() for entry in tmp_path.iterdir()}
+
+def test_swap(tmp_path):
+    files = make_files(tmp_path, ["a.txt", "b.txt"])
+    
+    assert run_rename(files, lambda name, index: ["b.txt", "a.txt"][index]) == ["ok", "ok"]
+    assert contents(tmp_path) == {"a.txt": "b.txt", "b.txt": "a.txt"}
+
+def test_cycle(tmp_path):
+    files = make_files(tmp_path, ["a.txt", "b.txt", "c.txt"])
+    
+    assert run_rename(files, lambda name, index: ["b.txt", "c.txt", "a.txt"][index]) == ["ok"] * 3
+    assert contents(tmp_path) == {"a.txt": "c.txt", "b.txt": "a.txt", "c.txt": "b.txt"}
+
+def test_shift_numbered_names(tmp_path):
+    files = make_files(tmp_path, ["x.txt", "001.txt", "002.txt", "003.txt"])
+    
+    assert run_rename(files, core.sequence_rule(1, 3, True)) == ["ok"] * 4
+    assert contents(tmp_path) == {"001.txt": "x.txt", "002.txt": "001.txt", "003.txt": "002.txt", "004.txt": "003.txt"}
+
+def test_conflict_with_other_file_is_skipped(tmp_path):
+    files = make_files(tmp_path, ["a.txt", "b.txt"])[:1]
+    
+    assert run_rename(files, lambda name, index: "b.txt") == ["skipped"]
+    assert contents(tmp_path) == {"a.txt": "a.txt", "b.txt": "b.txt"}
+
+def test_failed_step_keeps_every_file(tmp_path, monkeypatch):
+    files = make_files(tmp_path, ["a.txt", "b.txt"])
+    rename = os.rename
+    
+    def failing_rename(source, target):
+        # 第二个文件改为最终名称时失败
+        if ".renaming" in str(source) and os.path.basename(target) == "a.txt":
+            raise PermissionError("denied")
+        rename(source, target)
+    monkeypatch.setattr(core.os, "rename", failing_rename)
+    
+    assert run_rename(files, lambda name, index: ["b.txt", "a.txt"][index]) == ["ok", "failed"]
+    # 原名已被第一个文件占用，失败的文件保留临时名称而不是覆盖它
+    remaining = contents(tmp_path)
+    assert remaining.pop("b.txt") == "a.txt"
+    assert list(remaining.values()) == ["b.txt"]
+
+def test_failed_step_restores_free_name(tmp_path, monkeypatch):
+    files = make_files(tmp_path, ["a.txt", "b.txt"])
+    rename = os.rename
+    
+    def failing_rename(source, target):
+        # a → b 和暂存后的 b → c 都失败
+        if (os.path.basename(source), os.path.basename(target)) == ("a.txt", "b.txt") or \
+                (".renaming" in str(source) and os.path.basename(target) == "c.txt"):
+            raise PermissionError("denied")
+        rename(source, target)
+    monkeypatch.setattr(core.os, "rename", failing_rename)
+    
+    assert run_rename(files, lambda name, index: ["b.txt", "c.txt"][index]) == ["failed", "failed"]
+    assert contents(tmp_path) == {"a.txt": "a.txt", "b.txt": "b.txt"}
@@ -0,0 +1,33 @@
+import sqlite3
+
+import 文本处理核心 as core
+
+def test_every_watch_batch_is_recorded_in_manifest(tmp_path, capsys):
+    source_dir = tmp_path / "src"
+    source_dir.mkdir()
+    output_dir = tmp_path / "out"
+    manifest = tmp_path / "manifest.sqlite3"
+    args = core.build_cli_parser().parse_args(
+        ["watch", str(source_dir), "--to", "utf-16", "--from", "utf-8", "--output-dir", str(output_dir),
+         "--incremental", "--manifest", str(manifest), "--workers", "2"])
+    settings = core.OutputSettings(False, str(output_dir))
+    scanner = core.FolderScanner()
+    runner = core.BatchRunner([], None, args.workers, keep_executor=True)
+    
+    executors = set()
+    try:
+        for name in ("a.txt", "b.txt", "c.txt"):
+            path = source_dir / name
+            path.write_text(name, encoding="utf-8")
+            assert core.run_watch_batch(runner, args, settings, scanner, None, [str(path)]) == (1, 1)
+            assert runner.executor is not None
+            executors.add(id(runner.executor))
+    finally:
+        runner.close()
+    
+    # 各批共用同一个进程池
+    assert len(executors) == 1
+    assert runner.executor is None
+    with sqlite3.connect(manifest) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM outputs").fetchone() == (3,)
+    assert sorted(path.name for path in output_dir.iterdir()) == ["a.txt", "b.txt", "c.txt"]
@@ -0,0 +1,451 @@
+"""文本处理器的基准测试工具，不依赖 PyQt6
+
+生成可复现的合成语料（GBK、UTF-8、UTF-16 和带BOM的文件，从几百字节到数GB，
+扁平或多层目录，含重名文件），在无界面环境下运行各个处理场景，
+输出吞吐量、单文件耗时分位数和峰值内存，结果保存为JSON以便比较不同版本：
+
+    python 基准测试.py generate 语料目录 --preset small --seed 1
+    python 基准测试.py run 语料目录 --scenarios convert,rename --repeat 3 --output 新.json
+    python 基准测试.py compare 旧.json 新.json
+"""
+from __future__ import annotations
+
+import sys
+import os
+import re
+import time
+import random
+import shutil
+import tempfile
+
+from 文本处理核心 import (
+    FolderScanner, EncodingDetector, OutputSettings, OutputNameIndex, ConflictResolver, BatchRunner,
+    StageStats, RenamePlan, RenameTransaction, collect_files, make_convert_task, make_export_task,
+    get_export_path, sequence_rule, format_duration
+)
+
+MANIFEST_NAME = "corpus.json"
+CORPUS_ENCODINGS = ("gbk", "utf-8", "utf-8-sig", "utf-16", "ascii")
+DEFAULT_ENCODINGS = ("gbk", "utf-8", "utf-8-sig", "utf-16")
+# 每种编码的文本块字符数，文件内容由文本块重复拼接而成
+BLOCK_CHARS = 32 * 1024
+
+PRESETS = {
+    'tiny': dict(files=500, sizes=("200", "2k"), layout="flat"),
+    'small': dict(files=5000, sizes=("1k", "16k", "256k"), layout="flat"),
+    'deep': dict(files=20000, sizes=("512", "8k"), layout="deep", depth=6, fanout=4),
+    'large': dict(files=16, sizes=("64m", "256m"), layout="flat"),
+    'huge': dict(files=2, sizes=("2g",), layout="flat"),
+}
+
+HANZI = ("的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说"
+         "产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点"
+         "从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原")
+PUNCTUATION = "，。、；：？！"
+ASCII_WORDS = ("text", "file", "chapter", "encoding", "convert", "rename", "batch", "data", "line", "page")
+
+def parse_size(text: str) -> int:
+    """把 200、16k、1.5M、2G 等写法转换为字节数"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([kmg]?)i?b?", text.strip().lower())
+    if not match:
+        raise ValueError(f"无效的大小: {text}")
+    number, unit = match.groups()
+    return int(float(number) * {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[unit])
+
+def make_text_block(rng: random.Random, ascii_only: bool = False) -> str:
+    """生成一段混合中文、英文单词和换行的文本"""
+    pieces = []
+    length = 0
+    while length < BLOCK_CHARS:
+        if ascii_only or rng.random() < 0.3:
+            piece = rng.choice(ASCII_WORDS) + " "
+        else:
+            piece = "".join(rng.choice(HANZI) for _ in range(rng.randint(2, 12))) + rng.choice(PUNCTUATION)
+        if rng.random() < 0.08:
+            piece += "\n"
+        pieces.append(piece)
+        length += len(piece)
+    return "".join(pieces)[:BLOCK_CHARS]
+
+class CorpusEncoding:
+    """一种语料编码：文件头BOM、不含BOM的编码名和预先编码好的文本块"""
+    
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.bom, self.codec = {
+            'utf-8-sig': (b"\xef\xbb\xbf", "utf-8"),
+            'utf-16': (b"\xff\xfe", "utf-16-le"),
+        }.get(name, (b"", name))
+        self.text = text
+        self.block = text.encode(self.codec)
+    
+    def encode_prefix(self, text: str, limit: int) -> bytes:
+        """编码 text 并截断到不超过 limit 字节，不截断多字节字符"""
+        data = text.encode(self.codec)[:limit]
+        return data.decode(self.codec, errors='ignore').encode(self.codec)
+    
+    def write_file(self, path: str, size: int, header: str, offset: int):
+        with open(path, 'wb') as f:
+            f.write(self.bom)
+            written = len(self.bom)
+            head = self.encode_prefix(header, max(0, size - written))
+            f.write(head)
+            written += len(head)
+            # 不同文件从文本块的不同位置开始，内容互不相同
+            rotated = self.text[offset:] + self.text[:offset]
+            if size - written >= len(self.block):
+                first = rotated.encode(self.codec)
+                f.write(first)
+                written += len(first)
+            while size - written >= len(self.block):
+                f.write(self.block)
+                written += len(self.block)
+            # 每个字符至少一个字节，取剩余字节数个字符编码后截断即可
+            tail = self.encode_prefix(rotated[:size - written], size - written)
+            f.write(tail)
+
+def corpus_path(root: str, index: int, layout: str, depth: int, fanout: int, collide: float) -> str:
+    """第 index 个文件的路径
+    
+    deep 布局下文件轮流放入 fanout ** depth 个目录，不同目录中的文件同名；
+    flat 布局下按 collide 比例生成与前一个文件只差 _1 后缀的名称。
+    """
+    if layout == "deep":
+        directories = fanout ** depth
+        slot = index % directories
+        parts = []
+        for _ in range(depth):
+            parts.append(f"d{slot % fanout}")
+            slot //= fanout
+        return os.path.join(root, *parts, f"章节{index // directories:06d}.txt")
+    
+    step = round(1 / collide) if collide > 0 else 0
+    if step and index % step == 1:
+        return os.path.join(root, f"章节{index - 1:06d}_1.txt")
+    return os.path.join(root, f"章节{index:06d}.txt")
+
+def generate_corpus(root: str, files: int, sizes: list[str], encodings: list[str], layout: str = "flat",
+                    depth: int = 4, fanout: int = 4, collide: float = 0.2, seed: int = 1, log=print) -> dict:
+    """生成语料并写入 corpus.json，相同参数总是生成相同的文件"""
+    for encoding in encodings:
+        if encoding not in CORPUS_ENCODINGS:
+            raise ValueError(f"不支持的语料编码: {encoding}")
+    byte_sizes = [parse_size(size) for size in sizes]
+    rng = random.Random(seed)
+    texts = {encoding: CorpusEncoding(encoding, make_text_block(rng, encoding == "ascii"))
+             for encoding in encodings}
+    
+    os.makedirs(root, exist_ok=True)
+    created_dirs = set()
+    counts = dict.fromkeys(encodings, 0)
+    total_bytes = 0
+    last_report = time.monotonic()
+    for index in range(files):
+        encoding = rng.choice(encodings)
+        size = rng.choice(byte_sizes)
+        offset = rng.randrange(BLOCK_CHARS)
+        path = corpus_path(root, index, layout, depth, fanout, collide)
+        directory = os.path.dirname(path)
+        if directory not in created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            created_dirs.add(directory)
+        
+        header = f"file {index} {encoding}\n" if encoding == "ascii" else f"第{index}号文件 {encoding}\n"
+        texts[encoding].write_file(path, size, header, offset)
+        counts[encoding] += 1
+        total_bytes += size
+        
+        if log and time.monotonic() - last_report >= 1:
+            last_report = time.monotonic()
+            log(f"已生成 {index + 1}/{files} 个文件")
+    
+    manifest = {
+        'seed': seed, 'files': files, 'sizes': list(sizes), 'encodings': list(encodings), 'layout': layout,
+        'depth': depth, 'fanout': fanout, 'collide': collide, 'total_bytes': total_bytes, 'counts': counts,
+    }
+    import json
+    with open(os.path.join(root, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+def load_manifest(root: str) -> dict:
+    import json
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def link_tree(files: list[dict], source_root: str, target_root: str) -> list[dict]:
+    """把语料文件以硬链接（不支持时复制）放到 target_root 下，返回新的文件信息"""
+    linked = []
+    for file in files:
+        target = os.path.join(target_root, os.path.relpath(file['path'], source_root))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(file['path'], target)
+        except OSError:
+            shutil.copy2(file['path'], target)
+        linked.append({**file, 'path': target})
+    return linked
+
+def peak_rss_kb() -> dict:
+    """本进程和已结束子进程的峰值内存（KB），不支持的平台返回空字典"""
+    try:
+        import resource
+    except ImportError:
+        return {}
+    # macOS 的 ru_maxrss 以字节为单位，Linux 以 KB 为单位
+    scale = 1024 if sys.platform == "darwin" else 1
+    return {
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        'children_peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale,
+    }
+
+def run_batch(items, task, workers=1, **hooks) -> dict:
+    # 保留每个文件的耗时，分位数按原始样本计算，compare 才能看出较小的变化
+    runner = BatchRunner(items, task, workers, keep_samples=True, **hooks)
+    success, canceled = runner.run()
+    stats = runner.stats.summary()
+    return {'success': success, 'failed': stats['failed'], 'canceled': canceled,
+            'latency': stats['stages'].get('file', {}), 'stages': stats['stages']}
+
+def scenario_scan(corpus, files, work_dir, options):
+    latency = StageStats(keep_samples=True)
+    start = time.perf_counter()
+    count = sum(len(batch) for batch in FolderScanner().iter_batches(corpus))
+    latency.add(time.perf_counter() - start)
+    return {'success': count, 'latency': latency.summary()}
+
+def scenario_detect(corpus, files, work_dir, options):
+    detector = EncodingDetector(backend=options.get('backend', 'chardet'))
+    latency = StageStats(keep_samples=True)
+    failed = 0
+    for file in files:
+        start = time.perf_counter()
+        # 检测失败（error 级）时编码为 None，计为失败
+        encoding, _ = detector.detect(file['path'])
+        latency.add(time.perf_counter() - start, file['size'])
+        failed += encoding is None
+    return {'success': len(files) - failed, 'failed': failed, 'latency': latency.summary(),
+            'detector': detector.format_stats()}
+
+def convert_scenario(workers):
+    def scenario(corpus, files, work_dir, options):
+        settings = OutputSettings(False, os.path.join(work_dir, "converted"))
+        os.makedirs(settings.output_dir, exist_ok=True)
+        names = OutputNameIndex(settings.output_dir)
+        detector = EncodingDetector(backend=options.get('backend', 'chardet'))
+        task = make_convert_task(settings, options.get('target', 'utf-8'), names, options.get('source'), detector)
+        return run_batch(files, task, workers or min(4, os.cpu_count() or 1), finish=names.finish)
+    return scenario
+
+def scenario_rename_plan(corpus, files, work_dir, options):
+    latency = StageStats(keep_samples=True)
+    start = time.perf_counter()
+    plan = RenamePlan(files, sequence_rule(1, 6), OutputSettings())
+    plan.statuses()
+    latency.add(time.perf_counter() - start)
+    return {'success': len(plan), 'latency': latency.summary()}
+
+def scenario_rename(corpus, files, work_dir, options):
+    # 在硬链接副本上原地重命名，语料保持不变
+    linked = link_tree(files, corpus, os.path.join(work_dir, "renamed"))
+    start = time.perf_counter()
+    transaction = RenameTransaction(RenamePlan(linked, sequence_rule(1, 6), OutputSettings()), ConflictResolver("skip"))
+    result = run_batch(transaction.changes, transaction.execute, prepare=transaction.prepare, finish=transaction.finish)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def scenario_export(corpus, files, work_dir, options):
+    settings = OutputSettings(False, work_dir)
+    task = make_export_task([file['name'] for file in files], "utf-8", ConflictResolver("replace"))
+    return run_batch([get_export_path("names.txt", settings)], task)
+
+# 名称 -> (说明, 场景函数)；场景函数返回 success、latency 等，耗时由调用方计量
+SCENARIOS = {
+    'scan': ("扫描语料目录", scenario_scan),
+    'detect': ("逐个检测编码", scenario_detect),
+    'convert': ("单进程转换到新文件夹", convert_scenario(1)),
+    'convert-parallel': ("多进程转换到新文件夹", convert_scenario(0)),
+    'rename-plan': ("计算重命名计划和冲突标记", scenario_rename_plan),
+    'rename': ("原地序号重命名", scenario_rename),
+    'export': ("导出文件名", scenario_export),
+}
+
+def run_scenario(name: str, corpus: str, work_root: str, options: dict) -> dict:
+    """在当前进程中运行一个场景，通常由 run_isolated 在独立子进程中调用"""
+    records = collect_files([corpus], FolderScanner())
+    files = [record.info() for record in records]
+    for file in files:
+        file['size'] = os.path.getsize(file['path'])
+    total_bytes = sum(file['size'] for file in files)
+    
+    work_dir = tempfile.mkdtemp(prefix=f"bench-{name}-", dir=work_root)
+    try:
+        start = time.perf_counter()
+        result = SCENARIOS[name][1](corpus, files, work_dir, options)
+        seconds = result.pop('seconds', time.perf_counter() - start)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    seconds = max(seconds, 1e-9)
+    return {
+        'scenario': name, 'files': len(files), 'bytes': total_bytes, 'seconds': round(seconds, 6),
+        'files_per_sec': round(len(files) / seconds, 3),
+        'mb_per_sec': round(total_bytes / seconds / (1024 * 1024), 3),
+        **result, **peak_rss_kb(),
+    }
+
+def run_isolated(name: str, corpus: str, work_root: str, options: dict) -> dict:
+    """在新启动的子进程中运行场景，使峰值内存只反映该场景"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_scenario, name, corpus, work_root, options).result()
+
+def median_run(runs: list[dict]) -> dict:
+    """按耗时取中位数的一次运行作为场景的代表结果"""
+    return sorted(runs, key=lambda run: run['seconds'])[len(runs) // 2]
+
+def run_benchmarks(corpus: str, scenarios: list[str], repeat: int = 1, options: dict | None = None,
+                   work_root: str | None = None, isolate: bool = True, log=print) -> dict:
+    import platform
+    options = options or {}
+    # 临时目录默认与语料放在同一文件系统，硬链接和 os.replace 才能生效
+    work_root = work_root or os.path.dirname(os.path.abspath(corpus))
+    results = {}
+    for name in scenarios:
+        runs = []
+        for attempt in range(repeat):
+            run = (run_isolated if isolate else run_scenario)(name, corpus, work_root, options)
+            runs.append(run)
+            if log:
+                log(format_run(run) + (f"  (第 {attempt + 1}/{repeat} 次)" if repeat > 1 else ""))
+        results[name] = {'median': median_run(runs), 'runs': runs}
+    
+    return {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'corpus': {'path': os.path.abspath(corpus), **load_manifest(corpus)},
+        'options': options,
+        'scenarios': results,
+    }
+
+def format_run(run: dict) -> str:
+    latency = run.get('latency') or {}
+    text = (f"{run['scenario']}: {run['files']} 个文件，{format_duration(run['seconds'])} ({run['seconds']:.3f} 秒)，"
+            f"{run['files_per_sec']:.1f} 文件/秒，{run['mb_per_sec']:.1f} MB/秒")
+    if run.get('failed'):
+        text += f"，失败 {run['failed']} 个"
+    if latency.get('count', 0) > 1:
+        text += f"，p50 {latency['p50_ms']:.3f} ms，p95 {latency['p95_ms']:.3f} ms，p99 {latency['p99_ms']:.3f} ms"
+    if 'peak_rss_kb' in run:
+        text += f"，峰值内存 {run['peak_rss_kb'] / 1024:.0f} MB"
+    return text
+
+def compare_results(base: dict, new: dict) -> list[str]:
+    """逐个场景比较两次结果的中位数，比值大于 1 表示新结果更好（内存为新/旧）"""
+    lines = []
+    for name, entry in new['scenarios'].items():
+        if name not in base['scenarios']:
+            lines.append(f"{name}: 只在新结果中")
+            continue
+        old, current = base['scenarios'][name]['median'], entry['median']
+        
+        def ratio(key, invert=False):
+            a, b = old.get(key), current.get(key)
+            if not a or not b:
+                return "-"
+            return f"{(a / b if invert else b / a):.2f}x"
+        
+        old_p95 = (old.get('latency') or {}).get('p95_ms')
+        new_p95 = (current.get('latency') or {}).get('p95_ms')
+        p95 = f"{old_p95:.3f} → {new_p95:.3f} ms ({old_p95 / new_p95:.2f}x)" if old_p95 and new_p95 else "-"
+        lines.append(f"{name}: 文件/秒 {old['files_per_sec']:.1f} → {current['files_per_sec']:.1f} "
+                     f"({ratio('files_per_sec')})，MB/秒 {ratio('mb_per_sec')}，p95 {p95}，"
+                     f"峰值内存 {ratio('peak_rss_kb', invert=True)}")
+    return lines
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog="基准测试.py", description="生成合成语料并运行文本处理基准测试")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    generate = commands.add_parser("generate", help="生成可复现的合成语料")
+    generate.add_argument("root", help="语料目录")
+    generate.add_argument("--preset", choices=list(PRESETS), default="small", help="预设规模，其余参数可覆盖预设")
+    generate.add_argument("--files", type=int, help="文件数")
+    generate.add_argument("--sizes", help="以逗号分隔的文件大小，每个文件随机取其一，如 200,16k,64m,2g")
+    generate.add_argument("--encodings", default=",".join(DEFAULT_ENCODINGS),
+                          help=f"以逗号分隔的编码，可选 {','.join(CORPUS_ENCODINGS)}")
+    generate.add_argument("--layout", choices=("flat", "deep"), help="扁平目录或多层目录")
+    generate.add_argument("--depth", type=int, help="多层目录的层数")
+    generate.add_argument("--fanout", type=int, help="多层目录每层的子目录数")
+    generate.add_argument("--collide", type=float, default=0.2, help="扁平目录中带 _1 后缀的重名文件比例")
+    generate.add_argument("--seed", type=int, default=1, help="随机种子")
+    
+    run = commands.add_parser("run", help="运行基准测试场景")
+    run.add_argument("corpus", help="语料目录")
+    run.add_argument("--scenarios", default=",".join(SCENARIOS),
+                     help=f"以逗号分隔的场景，可选 {','.join(SCENARIOS)}")
+    run.add_argument("--repeat", type=int, default=1, help="每个场景的运行次数，结果取耗时中位数")
+    run.add_argument("--output", help="结果JSON文件")
+    run.add_argument("--work-dir", help="临时输出目录的位置，默认与语料目录相邻")
+    run.add_argument("--backend", default="chardet", help="编码检测引擎")
+    run.add_argument("--from", dest="source", help="转换场景的源编码，不指定时自动检测")
+    run.add_argument("--to", dest="target", default="utf-8", help="转换场景的目标编码")
+    run.add_argument("--no-isolate", action="store_true", help="在当前进程中运行场景（峰值内存会累积）")
+    
+    compare = commands.add_parser("compare", help="比较两次结果")
+    compare.add_argument("base", help="旧结果JSON")
+    compare.add_argument("new", help="新结果JSON")
+    return parser
+
+def main(argv: list[str] | None = None) -> int:
+    import json
+    args = build_parser().parse_args(argv)
+    
+    if args.command == "generate":
+        preset = PRESETS[args.preset]
+        start = time.perf_counter()
+        manifest = generate_corpus(
+            args.root,
+            files=args.files or preset['files'],
+            sizes=args.sizes.split(",") if args.sizes else list(preset['sizes']),
+            encodings=[encoding.strip() for encoding in args.encodings.split(",") if encoding.strip()],
+            layout=args.layout or preset['layout'],
+            depth=args.depth or preset.get('depth', 4),
+            fanout=args.fanout or preset.get('fanout', 4),
+            collide=args.collide,
+            seed=args.seed,
+        )
+        print(f"已生成 {manifest['files']} 个文件，共 {manifest['total_bytes'] / (1024 * 1024):.1f} MB，"
+              f"用时 {time.perf_counter() - start:.1f} 秒")
+        return 0
+    
+    if args.command == "compare":
+        with open(args.base, encoding='utf-8') as f:
+            base = json.load(f)
+        with open(args.new, encoding='utf-8') as f:
+            new = json.load(f)
+        print("\n".join(compare_results(base, new)))
+        return 0
+    
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    if unknown := [name for name in scenarios if name not in SCENARIOS]:
+        print(f"未知的场景: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    options = {'backend': args.backend, 'source': args.source, 'target': args.target}
+    results = run_benchmarks(args.corpus, scenarios, max(1, args.repeat), options, args.work_dir,
+                             isolate=not args.no_isolate)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
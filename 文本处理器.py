@@ -1,44 +1,227 @@
+import time
+# 启动各阶段结束的时间点，--profile-startup 时据此输出耗时报告
+STARTUP_MARKS = [("开始", time.perf_counter())]
 import sys
 import os
-import shutil
-import codecs
-import chardet
-from pathlib import Path
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+STARTUP_MARKS.append(("导入标准库", time.perf_counter()))
+from PyQt6.QtCore import (
+    Qt, QObject, QThread, QTimer, pyqtSignal, QAbstractListModel, QAbstractTableModel, QModelIndex,
+    QMimeData, QItemSelection, QItemSelectionModel
+)
+STARTUP_MARKS.append(("导入 QtCore", time.perf_counter()))
+from PyQt6.QtGui import QDragEnterEvent, QDropEvent, QDrag, QColor
+STARTUP_MARKS.append(("导入 QtGui", time.perf_counter()))
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QListWidget, QPushButton, QLabel, QGroupBox, QLineEdit,
-    QFileDialog, QMessageBox, QComboBox, QCheckBox, QTextEdit, 
-    QSpinBox, QTabWidget, QListWidgetItem, QDialog, QDialogButtonBox,
-    QRadioButton, QButtonGroup
+    QListView, QTableView, QHeaderView, QPushButton, QLabel, QGroupBox, QLineEdit,
+    QFileDialog, QMessageBox, QComboBox, QCheckBox, QPlainTextEdit,
+    QSpinBox, QTabWidget, QDialog, QDialogButtonBox,
+    QRadioButton, QButtonGroup, QProgressBar
+)
+STARTUP_MARKS.append(("导入 QtWidgets", time.perf_counter()))
+from 文本处理核心 import (
+    EncodingCache, EncodingDetector, FolderScanner, FolderWatcher, FileRegistry, BatchRunner,
+    OutputSettings, OutputNameIndex, ConflictResolver, MATERIALIZE_NAMES, available_detection_backends, split_patterns, format_duration,
+    make_convert_task, make_export_task, RenamePlan, RenameTransaction, get_export_path,
+    replace_rule, affix_rule, remove_affix_rule, sequence_rule, regex_rule, template_rule,
+    LOG_LEVELS, LOG_LEVEL_NAMES, LogFile, PROFILE_MODES, RunProfiler, DURABILITY_NAMES, GroupCommit, chain_finish,
+    ConversionManifest
 )
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QDragEnterEvent, QDropEvent
+STARTUP_MARKS.append(("导入核心模块", time.perf_counter()))
 
-class PreviewDialog(QDialog):
+class StartupProfiler:
+    """记录启动各阶段结束的时间点，输出每个阶段的耗时"""
+    
+    def __init__(self, marks=()):
+        self.marks = list(marks) or [("开始", time.perf_counter())]
+    
+    def mark(self, phase):
+        self.marks.append((phase, time.perf_counter()))
+    
+    def report(self):
+        lines = ["启动耗时:"]
+        for (_, previous), (phase, moment) in zip(self.marks, self.marks[1:]):
+            lines.append(f"  {phase}: {(moment - previous) * 1000:.1f} ms")
+        lines.append(f"  合计: {(self.marks[-1][1] - self.marks[0][1]) * 1000:.1f} ms")
+        return "\n".join(lines)
+
+class PreviewModel(QAbstractTableModel):
+    """预览表格的数据模型，只在视图绘制某一行时才生成该行文本
+    
+    rows 为当前显示的行号，未过滤时是 range，过滤后是行号列表。
+    子类实现 headers、row_count、cell 和 is_problem。
+    """
+    headers = ()
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = range(0)
+    
+    def row_count(self):
+        return 0
+    
+    def cell(self, row, column):
+        return ""
+    
+    def is_problem(self, row):
+        return False
+    
+    def problem_count(self):
+        return 0
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+    
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return None
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return self.cell(row, index.column())
+        if role == Qt.ItemDataRole.ForegroundRole and self.is_problem(row):
+            return QColor(Qt.GlobalColor.red)
+        return None
+    
+    def set_filter(self, text="", problems_only=False):
+        """按文本（不区分大小写）和是否只显示冲突过滤行"""
+        self.beginResetModel()
+        text = text.casefold()
+        if not text and not problems_only:
+            self.rows = range(self.row_count())
+        else:
+            self.rows = [
+                row for row in range(self.row_count())
+                if (not problems_only or self.is_problem(row))
+                and (not text or any(text in self.cell(row, column).casefold()
+                                     for column in range(len(self.headers))))
+            ]
+        self.endResetModel()
+
+class RenamePlanModel(PreviewModel):
+    """重命名计划的预览模型，状态列标出目标已存在和重名的项"""
+    headers = ("状态", "原文件名", "新文件名", "目录")
+    
+    def __init__(self, plan, parent=None):
+        super().__init__(parent)
+        self.plan = plan
+        self.statuses = plan.statuses()
+        self.rows = range(self.row_count())
+    
+    def row_count(self):
+        return len(self.plan)
+    
+    def cell(self, row, column):
+        change = self.plan.changes[row]
+        if column == 0:
+            return RenamePlan.STATUS_NAMES[self.statuses[row]]
+        elif column == 1:
+            return change.old_name
+        elif column == 2:
+            return change.new_name
+        return os.path.dirname(self.plan.targets[row])
+    
+    def is_problem(self, row):
+        return self.statuses[row] in RenamePlan.PROBLEM_STATUSES
+    
+    def problem_count(self):
+        return self.plan.problem_count()
+
+class ChangeListModel(PreviewModel):
+    """(原名称, 更改说明) 列表的预览模型"""
+    headers = ("文件名", "更改")
+    
     def __init__(self, changes, parent=None):
         super().__init__(parent)
+        self.changes = changes
+        self.rows = range(self.row_count())
+    
+    def row_count(self):
+        return len(self.changes)
+    
+    def cell(self, row, column):
+        return self.changes[row][column]
+
+class PreviewDialog(QDialog):
+    """以虚拟化表格预览更改，大批量时也只绘制可见的行"""
+    FILTER_DELAY_MS = 200
+    
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
         self.setup_ui()
-        self.populate_list(changes)
         
     def setup_ui(self):
         self.setWindowTitle("预览更改")
         self.setModal(True)
-        self.resize(600, 400)
+        self.resize(800, 500)
         
         layout = QVBoxLayout(self)
-        layout.addWidget(QLabel("以下是将要进行的更改:"))
-        
-        self.preview_list = QListWidget()
-        layout.addWidget(self.preview_list)
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+        
+        filter_layout = QHBoxLayout()
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("过滤文件名...")
+        filter_layout.addWidget(self.filter_edit)
+        self.problems_only = QCheckBox("只显示冲突")
+        self.problems_only.setVisible(self.model.problem_count() > 0)
+        filter_layout.addWidget(self.problems_only)
+        layout.addLayout(filter_layout)
+        
+        # 过滤需要遍历所有行，输入停顿后再执行
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(self.FILTER_DELAY_MS)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        self.filter_edit.textChanged.connect(self.filter_timer.start)
+        self.problems_only.toggled.connect(self.apply_filter)
+        
+        self.preview_table = QTableView()
+        self.preview_table.setModel(self.model)
+        self.preview_table.setWordWrap(False)
+        self.preview_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        # 固定行高，视图无需逐行测量
+        vertical_header = self.preview_table.verticalHeader()
+        vertical_header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        vertical_header.setDefaultSectionSize(self.fontMetrics().height() + 6)
+        vertical_header.setVisible(False)
+        horizontal_header = self.preview_table.horizontalHeader()
+        horizontal_header.setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        horizontal_header.setStretchLastSection(True)
+        for column in range(self.model.columnCount()):
+            self.preview_table.setColumnWidth(column, 200)
+        layout.addWidget(self.preview_table)
         
         button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         button_box.accepted.connect(self.accept)
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
+        self.update_summary()
     
-    def populate_list(self, changes):
-        for old_name, new_name in changes:
-            self.preview_list.addItem(f"{old_name} → {new_name}")
+    def apply_filter(self):
+        self.filter_timer.stop()
+        self.model.set_filter(self.filter_edit.text().strip(), self.problems_only.isChecked())
+        self.update_summary()
+    
+    def update_summary(self):
+        total = self.model.row_count()
+        text = f"以下是将要进行的更改，共 {total} 项"
+        if problems := self.model.problem_count():
+            text += f"，其中 {problems} 项存在冲突（红色）"
+        if self.model.rowCount() != total:
+            text += f"，当前显示 {self.model.rowCount()} 项"
+        self.summary_label.setText(text)
 
 class FileConflictDialog(QDialog):
     def __init__(self, file_name, parent=None):
@@ -86,17 +269,316 @@ class FileConflictDialog(QDialog):
     def get_result(self):
         return self.result_value, self.apply_to_all.isChecked()
 
-class FileListWidget(QListWidget):
+class LogView(QPlainTextEdit):
+    """日志视图：日志先进入缓冲区，按固定间隔批量显示，控件中只保留最近的 MAX_LINES 行
+    
+    大批量任务每秒可能产生上万条日志，逐条追加会让界面卡顿。缓冲区同样有上限，
+    来不及显示的旧日志直接丢弃并提示条数；设置了日志文件时所有日志仍会完整写入文件，
+    文件同样随每次刷新批量写入，记录级别与视图保持一致。
+    """
+    FLUSH_INTERVAL_MS = 100
+    MAX_LINES = 5000
+    
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)
+        self.setMaximumBlockCount(self.MAX_LINES)
+        self.threshold = LOG_LEVELS["info"]
+        self.log_file = None
+        self.pending = collections.deque(maxlen=self.MAX_LINES)
+        self.dropped = 0
+        # 等待写入日志文件的 (消息, 级别, 时间)，不受显示上限影响
+        self.file_pending = []
+        
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self.flush_timer.timeout.connect(self.flush)
+    
+    def set_level(self, level):
+        self.threshold = LOG_LEVELS[level]
+        if self.log_file:
+            self.flush_log_file()
+            self.log_file.set_level(level)
+    
+    def set_log_file(self, log_file):
+        if self.log_file:
+            self.flush_log_file()
+            self.log_file.close()
+        self.log_file = log_file
+    
+    def append(self, message, level="info"):
+        if self.log_file:
+            self.file_pending.append((message, level, time.time()))
+        if LOG_LEVELS[level] >= self.threshold:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(message)
+        if (self.pending or self.file_pending) and not self.flush_timer.isActive():
+            self.flush_timer.start()
+    
+    def flush_log_file(self):
+        if self.file_pending:
+            records, self.file_pending = self.file_pending, []
+            self.log_file.write_many(records)
+    
+    def flush(self):
+        if self.log_file:
+            self.flush_log_file()
+        if not self.pending:
+            self.flush_timer.stop()
+            return
+        
+        lines = [f"…… 省略了 {self.dropped} 条日志"] if self.dropped else []
+        lines.extend(self.pending)
+        self.pending.clear()
+        self.dropped = 0
+        # 一次追加整批文本，只触发一次排版和重绘
+        self.appendPlainText("\n".join(lines))
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+    
+    def clear(self):
+        self.pending.clear()
+        self.dropped = 0
+        super().clear()
+    
+    def close_log_file(self):
+        self.set_log_file(None)
+
+class RunStatsDialog(QDialog):
+    """显示上一次任务各阶段的耗时统计，可导出为JSON"""
+    
+    def __init__(self, stats, parent=None):
+        super().__init__(parent)
+        self.stats = stats
+        self.setWindowTitle("运行统计")
+        self.resize(640, 320)
+        
+        layout = QVBoxLayout(self)
+        summary = QPlainTextEdit(stats.format_summary())
+        summary.setReadOnly(True)
+        layout.addWidget(summary)
+        
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        export_btn = button_box.addButton("导出JSON...", QDialogButtonBox.ButtonRole.ActionRole)
+        export_btn.clicked.connect(self.export_json)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+    
+    def export_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出运行统计", "stats.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            self.stats.export_json(path)
+        except OSError as e:
+            QMessageBox.warning(self, "警告", f"导出失败: {e}")
+
+class BatchJob(QObject):
+    """在后台线程中运行 BatchRunner 的Qt任务，支持进度报告和取消
+    
+    任务内不得访问控件：日志和文件列表更新通过信号发回GUI线程，
+    冲突对话框通过阻塞式连接在GUI线程中弹出。
+    """
+    # 已完成数, 总数, 文件/秒, MB/秒, 预计剩余秒数
+    progress = pyqtSignal(int, int, float, float, float)
+    # 消息, 级别
+    log = pyqtSignal(str, str)
+    # 文件ID, 新文件名, 新路径, 新编码（未改变时为空字符串）
+    file_updated = pyqtSignal(int, str, str, str)
+    conflict_requested = pyqtSignal(str)
+    finished = pyqtSignal(int, bool)
+    
+    def __init__(self, items, task, workers=1, prepare=None, finish=None, profiler=None):
+        super().__init__()
+        self.runner = BatchRunner(
+            items, task, workers,
+            on_log=self.log.emit,
+            on_file_updated=self.file_updated.emit,
+            on_progress=self.progress.emit,
+            ask_conflict=self.ask_conflict,
+            prepare=prepare,
+            finish=finish,
+            profiler=profiler,
+            # 统计对话框显示精确的分位数
+            keep_samples=True
+        )
+        self.conflict_result = None
+    
+    def cancel(self):
+        """请求取消，当前文件处理完后停止"""
+        self.runner.cancel()
+    
+    def ask_conflict(self, file_name):
+        """在GUI线程中询问冲突处理方式，阻塞直到用户选择"""
+        self.conflict_result = ("cancel", False)
+        self.conflict_requested.emit(file_name)
+        return self.conflict_result
+    
+    def run(self):
+        self.finished.emit(*self.runner.run())
+
+class FileListModel(QAbstractListModel):
+    """以 FileRegistry 为数据的文件列表模型，提示信息在显示时才生成"""
+    ROWS_MIME_TYPE = "application/x-file-list-rows"
+    PENDING_ENCODING_TEXT = "检测中..."
+    FAILED_ENCODING_TEXT = "检测失败"
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.registry = FileRegistry()
+    
+    @property
+    def records(self):
+        return self.registry.records
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        
+        record = self.records[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return record.name
+        if role == Qt.ItemDataRole.ToolTipRole:
+            pending_text = self.PENDING_ENCODING_TEXT if record.detection is not None else self.FAILED_ENCODING_TEXT
+            return f"{record.path}\n编码: {record.encoding or pending_text}"
+        if role == Qt.ItemDataRole.UserRole:
+            return record
+        return None
+    
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.ItemIsDropEnabled
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsDragEnabled
+    
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+    
+    def mimeTypes(self):
+        return [self.ROWS_MIME_TYPE]
+    
+    def mimeData(self, indexes):
+        mime_data = QMimeData()
+        rows = ",".join(str(index.row()) for index in indexes)
+        mime_data.setData(self.ROWS_MIME_TYPE, rows.encode())
+        return mime_data
+    
+    def add_paths(self, paths):
+        """登记并追加新文件，返回新建的记录"""
+        if not (records := self.registry.create_records(paths)):
+            return records
+        
+        start = len(self.records)
+        self.beginInsertRows(QModelIndex(), start, start + len(records) - 1)
+        self.registry.append(records)
+        self.endInsertRows()
+        return records
+    
+    def remove_rows(self, rows):
+        """一次性移除多行并重置模型，返回被移除的记录"""
+        self.beginResetModel()
+        removed = self.registry.remove_rows(rows)
+        self.endResetModel()
+        return removed
+    
+    def change_layout(self, reorder):
+        """在一次布局变化中执行 reorder()，并把选中状态等持久索引映射到记录的新位置"""
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        tracked = [self.records[index.row()] for index in old_indexes]
+        result = reorder()
+        new_indexes = [self.index(self.registry.row_of(record), 0) for record in tracked]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+        return result
+    
+    def shift_rows(self, rows, step):
+        return self.change_layout(lambda: self.registry.shift_rows(rows, step))
+    
+    def move_rows(self, rows, target):
+        return self.change_layout(lambda: self.registry.move_rows(rows, target))
+    
+    def clear(self):
+        # 替换为新的空容器，旧记录和索引一次性释放
+        self.beginResetModel()
+        self.registry.clear()
+        self.endResetModel()
+    
+    def rename(self, file_id, new_name, new_path, encoding=None):
+        if (record := self.registry.rename(file_id, new_name, new_path, encoding)) is not None:
+            index = self.index(self.registry.row_of(record), 0)
+            self.dataChanged.emit(index, index)
+    
+    def all_records_changed(self):
+        if self.records:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.records) - 1, 0))
+
+class FileListWidget(QListView):
+    # 选中项变化时发出
+    selection_changed = pyqtSignal()
+    # 后台检测的编码合并到列表后发出
+    encodings_updated = pyqtSignal()
+    # 所有待检测文件完成后发出
+    detection_finished = pyqtSignal()
+    # 后台扫描目录时分批发出 (扫描批次号, 文件路径列表)
+    files_found = pyqtSignal(int, list)
+    # 目录扫描结束 (目录, 找到的文件数)
+    scan_finished = pyqtSignal(str, int)
+    
+    # 检测结果合并到界面的间隔（毫秒）
+    DETECTION_MERGE_INTERVAL = 200
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.file_model = FileListModel(self)
+        self.setModel(self.file_model)
         self.setup_ui()
-        self.full_paths = {}
-        self.file_encodings = {}
+        self.encoding_cache = EncodingCache()
+        self.detector = EncodingDetector(self.encoding_cache)
+        
+        # 编码检测在后台线程池中进行，结果由定时器批量合并到界面
+        self.detection_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        self.pending_detections = set()
+        self.detected_records = collections.deque()
+        self.detection_timer = QTimer(self)
+        self.detection_timer.setInterval(self.DETECTION_MERGE_INTERVAL)
+        self.detection_timer.timeout.connect(self.merge_detected_encodings)
+        
+        # 目录扫描在后台线程中进行，清空列表时递增批次号丢弃旧扫描的结果
+        self.scanner = FolderScanner()
+        self.scan_generation = 0
+        self.scan_cancel = threading.Event()
+        self.files_found.connect(self.add_found_files)
     
     def setup_ui(self):
         self.setAcceptDrops(True)
-        self.setDragDropMode(QListWidget.DragDropMode.InternalMove)
-        self.setSelectionMode(QListWidget.SelectionMode.ExtendedSelection)
+        self.setDragDropMode(QListView.DragDropMode.InternalMove)
+        self.setSelectionMode(QListView.SelectionMode.ExtendedSelection)
+        # 行高一致时视图无需逐行计算尺寸，百万行也能流畅滚动
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+    
+    def count(self):
+        return len(self.file_model.records)
+    
+    def selectionChanged(self, selected, deselected):
+        super().selectionChanged(selected, deselected)
+        self.selection_changed.emit()
+    
+    def selected_rows(self):
+        """返回选中的行号，按当前显示顺序"""
+        return sorted(index.row() for index in self.selectionModel().selectedRows())
+    
+    def select_rows(self, rows):
+        selection = QItemSelection()
+        for row in rows:
+            index = self.file_model.index(row, 0)
+            selection.select(index, index)
+        self.selectionModel().select(selection, QItemSelectionModel.SelectionFlag.ClearAndSelect)
     
     def dragEnterEvent(self, event: QDragEnterEvent):
         event.acceptProposedAction() if event.mimeData().hasUrls() else super().dragEnterEvent(event)
@@ -104,86 +586,143 @@ class FileListWidget(QListWidget):
     def dragMoveEvent(self, event):
         event.acceptProposedAction() if event.mimeData().hasUrls() else super().dragMoveEvent(event)
     
+    def startDrag(self, supported_actions):
+        # 内部拖动由 dropEvent 直接移动记录，拖动结束后不再删除源行
+        if not (indexes := self.selectedIndexes()):
+            return
+        drag = QDrag(self)
+        drag.setMimeData(self.file_model.mimeData(indexes))
+        drag.exec(Qt.DropAction.MoveAction)
+    
     def dropEvent(self, event: QDropEvent):
         if event.mimeData().hasUrls():
             for url in event.mimeData().urls():
                 file_path = url.toLocalFile()
                 self.add_file(file_path) if os.path.isfile(file_path) else self.find_txt_files_in_folder(file_path)
             event.acceptProposedAction()
-        else:
-            # 保存当前选中项
-            selected_items = self.selectedItems()
-            selected_indices = [self.row(item) for item in selected_items]
-            
-            # 执行默认的拖放操作
-            super().dropEvent(event)
+        elif event.source() is self and (rows := self.selected_rows()):
+            # 计算放置位置：落在某行下半部分时插入到该行之后
+            index = self.indexAt(event.position().toPoint())
+            if not index.isValid():
+                target = self.count()
+            elif self.dropIndicatorPosition() == QListView.DropIndicatorPosition.BelowItem:
+                target = index.row() + 1
+            else:
+                target = index.row()
             
-            # 重新选中之前选中的项
-            self.clearSelection()
-            for idx in selected_indices:
-                if idx < self.count():
-                    self.item(idx).setSelected(True)
+            # 移动后保持原来选中的文件处于选中状态
+            self.move_rows(rows, target)
+            event.acceptProposedAction()
+        else:
+            event.ignore()
     
     def add_file(self, file_path):
-        file_name = Path(file_path).name
-        item = QListWidgetItem(file_name)
-        item.setToolTip(file_path)
-        self.addItem(item)
-        self.full_paths[file_name] = file_path
+        self.add_files([file_path])
+    
+    def add_files(self, file_paths):
+        """文件先显示在列表中，编码在后台检测；已在列表中的文件不会重复添加"""
+        records = self.file_model.add_paths(file_paths)
+        
+        for record in records:
+            record.detection = self.detection_pool.submit(self.detect_encoding, record.path)
+            self.pending_detections.add(record)
+            record.detection.add_done_callback(lambda f, record=record: self.detected_records.append(record))
+        if records and not self.detection_timer.isActive():
+            self.detection_timer.start()
+    
+    def merge_detected_encodings(self):
+        """将已完成的检测结果批量写入记录，并一次性通知视图刷新"""
+        if not self.detected_records:
+            return
         
-        encoding = self.detect_encoding(file_path)
-        self.file_encodings[file_name] = encoding
-        item.setToolTip(f"{file_path}\n编码: {encoding}")
+        while self.detected_records:
+            record = self.detected_records.popleft()
+            # 检测期间被移除的文件不再处理
+            if record not in self.pending_detections or record.detection.cancelled():
+                continue
+            
+            self.pending_detections.discard(record)
+            record.encoding = record.detection.result()
+            record.detection = None
+        # 提示信息在显示时生成，只需通知视图数据已变化
+        self.file_model.all_records_changed()
+        
+        self.encodings_updated.emit()
+        if not self.pending_detections:
+            self.detection_timer.stop()
+            self.encoding_cache.flush()
+            self.detection_finished.emit()
+    
+    def cancel_detection(self, record):
+        if record in self.pending_detections:
+            self.pending_detections.discard(record)
+            record.detection.cancel()
+            record.detection = None
+    
+    def cancel_all_detections(self):
+        for record in self.pending_detections:
+            record.detection.cancel()
+            record.detection = None
+        self.pending_detections.clear()
+        self.detected_records.clear()
+        self.detection_timer.stop()
+    
+    def shutdown_detection(self):
+        self.cancel_all_detections()
+        self.detection_pool.shutdown(wait=True, cancel_futures=True)
     
     def detect_encoding(self, file_path):
-        try:
-            with open(file_path, 'rb') as f:
-                raw_data = f.read(4096)
-            
-            result = chardet.detect(raw_data)
-            encoding = result['encoding'] or 'utf-8'
-            
-            # 检测BOM标记
-            bom_encodings = [
-                (codecs.BOM_UTF8, 'utf-8-sig'),
-                (codecs.BOM_UTF16_LE, 'utf-16-le'),
-                (codecs.BOM_UTF16_BE, 'utf-16-be')
-            ]
-            
-            for bom, enc in bom_encodings:
-                if raw_data.startswith(bom):
-                    encoding = enc
-                    break
-            
-            return encoding
-        except Exception:
-            return 'utf-8'
+        return self.detector.detect(file_path)[0]
     
     def find_txt_files_in_folder(self, folder_path):
-        folder = Path(folder_path)
-        for txt_file in folder.glob("**/*.txt"):
-            self.add_file(str(txt_file))
-    
-    def get_full_path(self, file_name):
-        return self.full_paths.get(file_name, "")
-    
-    def get_file_encoding(self, file_name):
-        return self.file_encodings.get(file_name, "utf-8")
-    
-    def update_file_name(self, old_name, new_name, new_full_path):
-        for i in range(self.count()):
-            item = self.item(i)
-            if item.text() == old_name:
-                item.setText(new_name)
-                encoding = self.file_encodings.get(old_name, "utf-8")
-                item.setToolTip(f"{new_full_path}\n编码: {encoding}")
-                
-                # 更新内部映射
-                if old_name in self.full_paths:
-                    self.full_paths[new_name] = self.full_paths.pop(old_name)
-                if old_name in self.file_encodings:
-                    self.file_encodings[new_name] = self.file_encodings.pop(old_name)
-                break
+        """在后台扫描目录，匹配的文件分批加入列表"""
+        scanner = self.scanner
+        generation = self.scan_generation
+        cancel_event = self.scan_cancel
+        
+        def scan():
+            count = 0
+            for batch in scanner.iter_batches(folder_path, cancel_event):
+                count += len(batch)
+                self.files_found.emit(generation, batch)
+            self.scan_finished.emit(folder_path, count)
+        
+        threading.Thread(target=scan, daemon=True).start()
+    
+    def add_found_files(self, generation, file_paths):
+        if generation == self.scan_generation:
+            self.add_files(file_paths)
+    
+    def cancel_scans(self):
+        self.scan_cancel.set()
+        self.scan_cancel = threading.Event()
+        self.scan_generation += 1
+    
+    def remove_rows(self, rows):
+        for record in self.file_model.remove_rows(rows):
+            self.cancel_detection(record)
+    
+    def shift_rows(self, rows, step):
+        return self.file_model.shift_rows(rows, step)
+    
+    def move_rows(self, rows, target):
+        """将行整体移动到 target 之前并保持选中"""
+        self.select_rows(self.file_model.move_rows(rows, target))
+    
+    def clear_files(self):
+        self.cancel_scans()
+        self.cancel_all_detections()
+        self.file_model.clear()
+    
+    def get_file_encoding(self, row):
+        """返回指定行文件的编码，检测尚未完成时返回 None"""
+        return self.file_model.records[row].encoding
+    
+    def update_file_name(self, file_id, new_name, new_full_path, encoding=""):
+        """更新文件名和路径；文件被转换改写时 encoding 为新编码，尚未合并的旧检测结果随之作废"""
+        if encoding and (record := self.file_model.registry.get(file_id)) is not None:
+            self.cancel_detection(record)
+        self.file_model.rename(file_id, new_name, new_full_path, encoding)
     
     def get_all_files(self):
         """返回所有文件的列表，按当前显示顺序"""
@@ -191,15 +730,15 @@ class FileListWidget(QListWidget):
     
     def get_selected_files(self):
         """返回选中文件的列表，按当前显示顺序"""
-        return [self._get_file_info(self.row(item)) for item in self.selectedItems()]
+        return [self._get_file_info(row) for row in self.selected_rows()]
+    
+    def get_files_by_path(self, paths):
+        """返回这些路径对应的文件，不在列表中的路径被忽略"""
+        records = (self.file_model.registry.find_path(path) for path in paths)
+        return [record.info() for record in records if record is not None]
     
     def _get_file_info(self, index):
-        name = self.item(index).text()
-        return {
-            'name': name,
-            'path': self.get_full_path(name),
-            'encoding': self.get_file_encoding(name)
-        }
+        return self.file_model.records[index].info()
 
 class BaseRenameTab(QWidget):
     def __init__(self, parent=None):
@@ -222,10 +761,32 @@ class BaseRenameTab(QWidget):
         return button
 
 class FileProcessorApp(QMainWindow):
-    def __init__(self):
+    # 监视线程发现的新文件和日志，经信号交给GUI线程
+    watched_files = pyqtSignal(list)
+    watch_log = pyqtSignal(str, str)
+    # 后台线程计算出的重命名计划：(回调, 计划或错误信息)
+    rename_plan_ready = pyqtSignal(object, object)
+    
+    def __init__(self, profiler=None, job_profile=None):
         super().__init__()
+        self.profiler = profiler
+        # 任务性能分析方式（cprofile 或 sample），为 None 时不分析
+        self.job_profile = job_profile
         self.setup_ui()
-        self.file_conflict_policy = None
+        self.output_settings = OutputSettings()
+        self.current_job = None
+        self.job_thread = None
+        self.job_done_callback = None
+        self.last_run_stats = None
+        # 监视文件夹：监视器、等待转换的新文件和开始监视时的转换设置
+        self.watcher = None
+        self.watch_queue = []
+        self.watch_options = None
+        self.watched_files.connect(self.on_watched_files)
+        self.watch_log.connect(self.log_text.append)
+        # 正在后台计算重命名计划时不再接受新的预览或重命名
+        self.planning = False
+        self.rename_plan_ready.connect(self.on_rename_plan_ready)
     
     def setup_ui(self):
         self.setWindowTitle("文件处理工具")
@@ -237,12 +798,28 @@ class FileProcessorApp(QMainWindow):
         
         # 左侧文件列表区域
         left_layout = self.create_file_list_section()
+        self.mark_startup("创建文件列表")
         
         # 右侧功能区域
         right_layout = self.create_function_section()
         
         main_layout.addLayout(left_layout, 3)
         main_layout.addLayout(right_layout, 2)
+        
+        # 状态栏中的任务进度
+        self.create_job_status()
+        self.mark_startup("创建状态栏")
+    
+    def mark_startup(self, phase):
+        if self.profiler:
+            self.profiler.mark(phase)
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.profiler:
+            self.mark_startup("首次绘制")
+            print(self.profiler.report(), flush=True)
+            self.profiler = None
     
     def create_file_list_section(self):
         layout = QVBoxLayout()
@@ -250,9 +827,36 @@ class FileProcessorApp(QMainWindow):
         file_list_layout = QVBoxLayout()
         
         self.file_list = FileListWidget()
-        self.file_list.itemSelectionChanged.connect(self.update_source_encoding_display)
+        self.file_list.selection_changed.connect(self.update_source_encoding_display)
+        self.file_list.encodings_updated.connect(self.update_source_encoding_display)
+        self.file_list.detection_finished.connect(self.log_detection_stats)
+        self.file_list.scan_finished.connect(
+            lambda folder, count: self.log_text.append(f"文件夹扫描完成: {folder}，共 {count} 个文件")
+        )
         file_list_layout.addWidget(self.file_list)
         
+        # 添加文件夹时的扫描规则
+        scan_layout = QHBoxLayout()
+        scan_layout.addWidget(QLabel("文件类型:"))
+        self.scan_include = QLineEdit(";".join(FolderScanner.DEFAULT_INCLUDE))
+        self.scan_include.setToolTip("以分号分隔的通配符，如 *.txt;*.md;*.log")
+        scan_layout.addWidget(self.scan_include)
+        scan_layout.addWidget(QLabel("排除:"))
+        self.scan_exclude = QLineEdit(";".join(FolderScanner.DEFAULT_EXCLUDE))
+        self.scan_exclude.setToolTip("名称匹配的文件和文件夹不会被扫描")
+        scan_layout.addWidget(self.scan_exclude)
+        scan_layout.addWidget(QLabel("深度:"))
+        self.scan_depth = QSpinBox()
+        self.scan_depth.setRange(-1, 999)
+        self.scan_depth.setValue(-1)
+        self.scan_depth.setSpecialValueText("不限")
+        self.scan_depth.setToolTip("向下扫描的子文件夹层数，0 表示只扫描所选文件夹")
+        scan_layout.addWidget(self.scan_depth)
+        for field in (self.scan_include, self.scan_exclude):
+            field.editingFinished.connect(self.update_scan_settings)
+        self.scan_depth.valueChanged.connect(self.update_scan_settings)
+        file_list_layout.addLayout(scan_layout)
+        
         # 创建按钮
         buttons = [
             ("添加文件", self.add_files),
@@ -260,7 +864,9 @@ class FileProcessorApp(QMainWindow):
             ("移除选中", self.remove_selected_files),
             ("清空列表", self.clear_file_list),
             ("上移选中", self.move_selected_up),
-            ("下移选中", self.move_selected_down)
+            ("下移选中", self.move_selected_down),
+            ("置顶选中", self.move_selected_to_top),
+            ("置底选中", self.move_selected_to_bottom)
         ]
         
         button_layout = QHBoxLayout()
@@ -280,18 +886,22 @@ class FileProcessorApp(QMainWindow):
         
         # 输出设置
         layout.addWidget(self.create_output_settings())
+        self.mark_startup("创建输出设置")
         
         # 重命名选项卡
         layout.addWidget(self.create_rename_section())
+        self.mark_startup("创建重命名选项卡")
         
         # 编码转换功能
         layout.addWidget(self.create_encoding_section())
+        self.mark_startup("创建编码转换")
         
         # 导出文件名功能
         layout.addWidget(self.create_export_section())
         
         # 日志区域
         layout.addWidget(self.create_log_section())
+        self.mark_startup("创建导出和日志")
         
         return layout
     
@@ -319,6 +929,25 @@ class FileProcessorApp(QMainWindow):
         output_dir_layout.addWidget(self.select_output_dir_btn)
         
         layout.addLayout(output_dir_layout)
+        
+        materialize_layout = QHBoxLayout()
+        materialize_layout.addWidget(QLabel("重命名时生成文件:"))
+        self.materialize_strategy = QComboBox()
+        for strategy, name in MATERIALIZE_NAMES.items():
+            self.materialize_strategy.addItem(name, strategy)
+        self.materialize_strategy.setToolTip("写时复制和硬链接在同一磁盘上几乎不复制数据，不支持时自动退回内核复制或普通复制")
+        self.materialize_strategy.setEnabled(False)
+        materialize_layout.addWidget(self.materialize_strategy)
+        materialize_layout.addWidget(QLabel("落盘:"))
+        self.durability_mode = QComboBox()
+        for mode, name in DURABILITY_NAMES.items():
+            self.durability_mode.addItem(name, mode)
+        self.durability_mode.setToolTip("转换后的文件总是先写入临时文件再原子替换；"
+                                        "逐个文件落盘最安全但最慢，分组落盘每批文件同步一次目录")
+        materialize_layout.addWidget(self.durability_mode)
+        materialize_layout.addStretch()
+        layout.addLayout(materialize_layout)
+        
         group.setLayout(layout)
         return group
     
@@ -326,28 +955,38 @@ class FileProcessorApp(QMainWindow):
         group = QGroupBox("批量重命名")
         layout = QVBoxLayout()
         
-        rename_tabs = QTabWidget()
-        
-        # 关键字替换选项卡
-        self.replace_tab = self.create_replace_tab()
-        rename_tabs.addTab(self.replace_tab, "关键字替换")
-        
-        # 添加前缀/后缀选项卡
-        self.affix_tab = self.create_affix_tab()
-        rename_tabs.addTab(self.affix_tab, "添加前缀/后缀")
-        
-        # 删除前缀/后缀选项卡
-        self.remove_affix_tab = self.create_remove_affix_tab()
-        rename_tabs.addTab(self.remove_affix_tab, "删除前缀/后缀")
-        
-        # 序号重命名选项卡
-        self.sequence_tab = self.create_sequence_tab()
-        rename_tabs.addTab(self.sequence_tab, "序号重命名")
-        
-        layout.addWidget(rename_tabs)
+        self.rename_tabs = QTabWidget()
+        # 选项卡先放入空白页，首次切换到时才创建其中的控件
+        self.rename_tab_specs = [
+            ("关键字替换", "replace_tab", self.create_replace_tab),
+            ("添加前缀/后缀", "affix_tab", self.create_affix_tab),
+            ("删除前缀/后缀", "remove_affix_tab", self.create_remove_affix_tab),
+            ("序号重命名", "sequence_tab", self.create_sequence_tab),
+            ("正则/模板", "template_tab", self.create_template_tab),
+        ]
+        for title, attr, factory in self.rename_tab_specs:
+            setattr(self, attr, None)
+            page = QWidget()
+            page_layout = QVBoxLayout(page)
+            page_layout.setContentsMargins(0, 0, 0, 0)
+            self.rename_tabs.addTab(page, title)
+        self.rename_tabs.currentChanged.connect(self.build_rename_tab)
+        self.build_rename_tab(self.rename_tabs.currentIndex())
+        
+        layout.addWidget(self.rename_tabs)
         group.setLayout(layout)
         return group
     
+    def build_rename_tab(self, index):
+        if not 0 <= index < len(self.rename_tab_specs):
+            return
+        
+        title, attr, factory = self.rename_tab_specs[index]
+        if getattr(self, attr) is None:
+            tab = factory()
+            self.rename_tabs.widget(index).layout().addWidget(tab)
+            setattr(self, attr, tab)
+    
     def create_replace_tab(self):
         tab = BaseRenameTab()
         tab.add_field("查找:", "find_text")
@@ -455,6 +1094,33 @@ class FileProcessorApp(QMainWindow):
         
         return tab
     
+    def create_template_tab(self):
+        tab = BaseRenameTab()
+        tab.add_field("正则:", "pattern_text").setPlaceholderText("可选，如 (\\d+)")
+        tab.add_field("替换为:", "regex_replace_text").setPlaceholderText("正则替换，可用 \\1 引用分组")
+        tab.add_field("模板:", "template_text").setPlaceholderText("{stem}_{n:03}{ext}")
+        tab.template_text.setToolTip(
+            "可用字段: {name} {stem} {ext} {n} {parent} {mtime:%Y%m%d} {size} {encoding}\n"
+            "填写正则时可用 {1}、{名称} 引用分组，不匹配的文件保持原名；填写模板时忽略“替换为”"
+        )
+        # 填写模板后正则只用于匹配和提供分组
+        tab.template_text.textChanged.connect(lambda text: tab.regex_replace_text.setEnabled(not text))
+        
+        options_layout = QHBoxLayout()
+        tab.ignore_case = QCheckBox("忽略大小写")
+        options_layout.addWidget(tab.ignore_case)
+        options_layout.addWidget(QLabel("{n} 起始值:"))
+        tab.template_start = QSpinBox()
+        tab.template_start.setRange(0, 999999)
+        tab.template_start.setValue(1)
+        options_layout.addWidget(tab.template_start)
+        options_layout.addStretch()
+        tab.layout.addLayout(options_layout)
+        
+        tab.add_button("预览", lambda: self.preview_rename("template"))
+        tab.add_button("执行重命名", lambda: self.rename_files("template"))
+        return tab
+    
     def create_encoding_section(self):
         group = QGroupBox("编码转换")
         layout = QVBoxLayout()
@@ -464,6 +1130,12 @@ class FileProcessorApp(QMainWindow):
         self.auto_detect_encoding.setChecked(True)
         self.auto_detect_encoding.stateChanged.connect(self.toggle_auto_detect)
         auto_detect_layout.addWidget(self.auto_detect_encoding)
+        
+        auto_detect_layout.addWidget(QLabel("检测引擎:"))
+        self.detection_backend = QComboBox()
+        self.detection_backend.addItems(available_detection_backends())
+        self.detection_backend.currentTextChanged.connect(self.change_detection_backend)
+        auto_detect_layout.addWidget(self.detection_backend)
         layout.addLayout(auto_detect_layout)
         
         encoding_options_layout = QHBoxLayout()
@@ -480,6 +1152,20 @@ class FileProcessorApp(QMainWindow):
         
         layout.addLayout(encoding_options_layout)
         
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("并行进程数:"))
+        self.convert_workers = QSpinBox()
+        self.convert_workers.setMinimum(1)
+        self.convert_workers.setMaximum(os.cpu_count() or 1)
+        self.convert_workers.setValue(1)
+        self.convert_workers.setToolTip("大于1时使用多进程并行转换")
+        workers_layout.addWidget(self.convert_workers)
+        self.incremental_convert = QCheckBox("增量转换")
+        self.incremental_convert.setToolTip("跳过上次已转换且源文件和输出都没有变化的文件")
+        workers_layout.addWidget(self.incremental_convert)
+        workers_layout.addStretch()
+        layout.addLayout(workers_layout)
+        
         self.convert_preview_btn = QPushButton("预览")
         self.convert_preview_btn.clicked.connect(self.preview_encoding)
         layout.addWidget(self.convert_preview_btn)
@@ -488,6 +1174,12 @@ class FileProcessorApp(QMainWindow):
         self.convert_encoding_btn.clicked.connect(self.convert_encoding)
         layout.addWidget(self.convert_encoding_btn)
         
+        self.watch_folder_btn = QPushButton("监视文件夹...")
+        self.watch_folder_btn.setCheckable(True)
+        self.watch_folder_btn.setToolTip("文件夹中新出现的文件写完后自动加入列表，并按开始监视时的设置转换")
+        self.watch_folder_btn.clicked.connect(self.toggle_watch_folder)
+        layout.addWidget(self.watch_folder_btn)
+        
         group.setLayout(layout)
         return group
     
@@ -524,22 +1216,56 @@ class FileProcessorApp(QMainWindow):
         log_toolbar = QHBoxLayout()
         log_toolbar.addWidget(QLabel("操作日志:"))
         log_toolbar.addStretch()
+        log_toolbar.addWidget(QLabel("级别:"))
+        self.log_level = QComboBox()
+        for level, name in LOG_LEVEL_NAMES.items():
+            self.log_level.addItem(name, level)
+        self.log_level.setCurrentIndex(self.log_level.findData("info"))
+        log_toolbar.addWidget(self.log_level)
+        self.run_stats_btn = QPushButton("运行统计")
+        self.run_stats_btn.setEnabled(False)
+        self.run_stats_btn.clicked.connect(lambda: RunStatsDialog(self.last_run_stats, self).exec())
+        log_toolbar.addWidget(self.run_stats_btn)
+        self.log_file_btn = QPushButton("保存到文件...")
+        self.log_file_btn.clicked.connect(self.toggle_log_file)
+        log_toolbar.addWidget(self.log_file_btn)
         self.clear_log_btn = QPushButton("清除日志")
         self.clear_log_btn.clicked.connect(self.clear_log)
         log_toolbar.addWidget(self.clear_log_btn)
         layout.addLayout(log_toolbar)
         
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
+        self.log_text = LogView()
+        self.log_level.currentIndexChanged.connect(lambda: self.log_text.set_level(self.log_level.currentData()))
         layout.addWidget(self.log_text)
         
         group.setLayout(layout)
         return group
     
+    def create_job_status(self):
+        status_bar = self.statusBar()
+        
+        self.job_status_label = QLabel()
+        status_bar.addPermanentWidget(self.job_status_label)
+        
+        self.job_progress = QProgressBar()
+        self.job_progress.setMaximumWidth(200)
+        status_bar.addPermanentWidget(self.job_progress)
+        
+        self.cancel_job_btn = QPushButton("取消任务")
+        self.cancel_job_btn.clicked.connect(self.cancel_job)
+        status_bar.addPermanentWidget(self.cancel_job_btn)
+        
+        self.set_job_status_visible(False)
+    
+    def set_job_status_visible(self, visible):
+        for widget in (self.job_status_label, self.job_progress, self.cancel_job_btn):
+            widget.setVisible(visible)
+    
     def toggle_modify_mode(self, state):
         enabled = state != Qt.CheckState.Checked.value
         self.output_dir_edit.setEnabled(enabled)
         self.select_output_dir_btn.setEnabled(enabled)
+        self.materialize_strategy.setEnabled(enabled)
         mode = "输出到新文件夹" if enabled else "直接修改源文件"
         self.log_text.append(f"已切换到{mode}模式")
     
@@ -549,11 +1275,19 @@ class FileProcessorApp(QMainWindow):
         mode = "手动指定" if enabled else "自动检测"
         self.log_text.append(f"编码检测模式: {mode}")
     
+    def change_detection_backend(self, backend):
+        self.file_list.detector.backend = backend
+        self.log_text.append(f"编码检测引擎: {backend}")
+    
+    def log_detection_stats(self):
+        self.log_text.append(f"编码检测统计: {self.file_list.detector.format_stats()}")
+        self.file_list.detector.reset_stats()
+    
     def update_source_encoding_display(self):
-        if self.auto_detect_encoding.isChecked() and self.file_list.selectedItems():
-            file_name = self.file_list.selectedItems()[0].text()
-            encoding = self.file_list.get_file_encoding(file_name)
-            self.source_encoding.setCurrentText(encoding)
+        if self.auto_detect_encoding.isChecked() and (rows := self.file_list.selected_rows()):
+            # 编码仍在检测中时保持当前显示，检测完成后会再次刷新
+            if encoding := self.file_list.get_file_encoding(rows[0]):
+                self.source_encoding.setCurrentText(encoding)
     
     def select_output_directory(self):
         if directory := QFileDialog.getExistingDirectory(self, "选择输出目录"):
@@ -564,77 +1298,80 @@ class FileProcessorApp(QMainWindow):
         self.log_text.clear()
         self.log_text.append("日志已清除")
     
+    def toggle_log_file(self):
+        """开始或停止把日志写入文件，.jsonl 文件按 JSON Lines 格式写入"""
+        if self.log_text.log_file:
+            path = self.log_text.log_file.path
+            self.log_text.close_log_file()
+            self.log_file_btn.setText("保存到文件...")
+            self.log_text.append(f"已停止保存日志: {path}")
+            return
+        
+        path, _ = QFileDialog.getSaveFileName(self, "保存日志", "", "文本日志 (*.log);;JSON Lines (*.jsonl)")
+        if not path:
+            return
+        self.log_text.set_log_file(LogFile(path, level=self.log_level.currentData()))
+        self.log_file_btn.setText("停止保存")
+        self.log_text.append(f"日志将保存到: {path}")
+    
     def add_files(self):
         if files := QFileDialog.getOpenFileNames(self, "选择文件", "", "文本文件 (*.txt);;所有文件 (*.*)")[0]:
-            for file in files:
-                self.file_list.add_file(file)
+            self.file_list.add_files(files)
             self.log_text.append(f"添加了 {len(files)} 个文件")
     
+    def update_scan_settings(self):
+        # 深度为最小值时显示“不限”
+        depth = self.scan_depth.value()
+        self.file_list.scanner = FolderScanner(
+            include=split_patterns(self.scan_include.text()),
+            exclude=split_patterns(self.scan_exclude.text()),
+            max_depth=None if depth < 0 else depth
+        )
+    
     def add_folder(self):
         if folder := QFileDialog.getExistingDirectory(self, "选择文件夹"):
             self.file_list.find_txt_files_in_folder(folder)
             self.log_text.append(f"添加了文件夹: {folder}")
     
     def remove_selected_files(self):
-        if not (selected_items := self.file_list.selectedItems()):
+        if not (rows := self.file_list.selected_rows()):
             QMessageBox.warning(self, "警告", "请先选择要移除的文件")
             return
         
-        for item in selected_items:
-            file_name = item.text()
-            self.file_list.takeItem(self.file_list.row(item))
-            self.file_list.full_paths.pop(file_name, None)
-            self.file_list.file_encodings.pop(file_name, None)
-        self.log_text.append(f"移除了 {len(selected_items)} 个文件")
+        self.file_list.remove_rows(rows)
+        self.log_text.append(f"移除了 {len(rows)} 个文件")
     
     def move_selected_up(self):
-        selected_items = self.file_list.selectedItems()
-        if not selected_items:
-            QMessageBox.warning(self, "警告", "请先选择要移动的文件")
-            return
-        
-        # 获取所有选中项的行号并排序
-        rows = sorted([self.file_list.row(item) for item in selected_items])
-        
-        # 如果第一项已经在最上面，无法上移
-        if rows[0] == 0:
-            return
-        
-        # 移动选中项
-        for row in rows:
-            if row > 0:
-                item = self.file_list.takeItem(row)
-                self.file_list.insertItem(row - 1, item)
-                item.setSelected(True)
-        
-        self.log_text.append(f"已将 {len(selected_items)} 个文件上移")
+        self.shift_selected(-1, "上移")
     
     def move_selected_down(self):
-        selected_items = self.file_list.selectedItems()
-        if not selected_items:
+        self.shift_selected(1, "下移")
+    
+    def shift_selected(self, step, action):
+        if not (rows := self.file_list.selected_rows()):
             QMessageBox.warning(self, "警告", "请先选择要移动的文件")
             return
         
-        # 获取所有选中项的行号并排序（从大到小）
-        rows = sorted([self.file_list.row(item) for item in selected_items], reverse=True)
-        
-        # 如果最后一项已经在最下面，无法下移
-        if rows[0] == self.file_list.count() - 1:
+        # 有选中项已在最上面或最下面时无法移动，选中状态随行一起移动
+        if self.file_list.shift_rows(rows, step):
+            self.log_text.append(f"已将 {len(rows)} 个文件{action}")
+    
+    def move_selected_to_top(self):
+        self.move_selected_to(0, "置顶")
+    
+    def move_selected_to_bottom(self):
+        self.move_selected_to(self.file_list.count(), "置底")
+    
+    def move_selected_to(self, target, action):
+        if not (rows := self.file_list.selected_rows()):
+            QMessageBox.warning(self, "警告", "请先选择要移动的文件")
             return
         
-        # 移动选中项
-        for row in rows:
-            if row < self.file_list.count() - 1:
-                item = self.file_list.takeItem(row)
-                self.file_list.insertItem(row + 1, item)
-                item.setSelected(True)
-        
-        self.log_text.append(f"已将 {len(selected_items)} 个文件下移")
+        self.file_list.move_rows(rows, target)
+        self.log_text.append(f"已将 {len(rows)} 个文件{action}")
     
     def clear_file_list(self):
-        self.file_list.clear()
-        self.file_list.full_paths.clear()
-        self.file_list.file_encodings.clear()
+        self.file_list.clear_files()
         self.log_text.append("已清空文件列表")
     
     def get_files_to_process(self):
@@ -646,70 +1383,120 @@ class FileProcessorApp(QMainWindow):
         QMessageBox.warning(self, "警告", message)
         return None
     
-    def get_output_path(self, original_path):
-        if self.modify_directly.isChecked():
-            return original_path
-        
+    def prepare_batch(self):
+        """记录本次批处理的输出设置快照，后台线程只读取快照而不访问控件"""
+        if self.current_job:
+            self.show_warning("已有任务正在运行，请等待完成或取消")
+            return False
+        
+        if not (settings := self.read_output_settings()):
+            return False
+        self.output_settings = settings
+        return True
+    
+    def read_output_settings(self):
+        """读取当前输出设置，未设置输出文件夹时提示并返回 None"""
+        modify_directly = self.modify_directly.isChecked()
         output_dir = self.output_dir_edit.text().strip()
-        if not output_dir:
-            self.show_warning("请先设置输出文件夹")
-            return None
-        
-        os.makedirs(output_dir, exist_ok=True)
-        original_file = Path(original_path)
-        output_path = Path(output_dir) / original_file.name
-        
-        counter = 1
-        while output_path.exists():
-            name_parts = original_file.stem.split('_')
-            if name_parts and name_parts[-1].isdigit():
-                name_parts[-1] = str(int(name_parts[-1]) + 1)
-                new_name = '_'.join(name_parts) + original_file.suffix
-            else:
-                new_name = f"{original_file.stem}_{counter}{original_file.suffix}"
-            
-            output_path = Path(output_dir) / new_name
-            counter += 1
-        
-        return str(output_path)
-    
-    def handle_file_conflict(self, file_path, new_name):
-        """处理文件冲突，返回是否继续操作"""
-        if self.file_conflict_policy:
-            return self.file_conflict_policy
-        
-        # 检查目标文件是否已存在
-        if self.modify_directly.isChecked():
-            # 直接修改模式：检查新文件名是否已存在
-            original_path = Path(file_path)
-            new_path = original_path.parent / new_name
-            if new_path.exists() and new_path != original_path:
-                return self.show_conflict_dialog(new_name)
+        if not modify_directly and not output_dir:
+            return self.show_warning("请先设置输出文件夹")
+        return OutputSettings(modify_directly, output_dir, self.materialize_strategy.currentData(),
+                              self.durability_mode.currentData())
+    
+    def start_job(self, items, task, done_callback, workers=1, prepare=None, finish=None):
+        """在后台线程中运行批处理任务，完成且未取消时在GUI线程调用 done_callback(成功数)"""
+        profiler = None
+        if self.job_profile:
+            suffix = "prof" if self.job_profile == "cprofile" else "folded"
+            profiler = RunProfiler(self.job_profile, f"job-{time.strftime('%Y%m%d-%H%M%S')}.{suffix}")
+        job = BatchJob(items, task, workers, prepare, finish, profiler)
+        thread = QThread(self)
+        job.moveToThread(thread)
+        
+        thread.started.connect(job.run)
+        job.log.connect(self.log_text.append)
+        job.file_updated.connect(self.file_list.update_file_name)
+        job.conflict_requested.connect(self.on_job_conflict, Qt.ConnectionType.BlockingQueuedConnection)
+        job.progress.connect(self.update_job_progress)
+        job.finished.connect(self.on_job_finished)
+        job.finished.connect(thread.quit)
+        job.finished.connect(job.deleteLater)
+        thread.finished.connect(thread.deleteLater)
+        
+        self.current_job = job
+        self.job_thread = thread
+        self.job_done_callback = done_callback
+        
+        self.job_progress.setRange(0, len(items))
+        self.job_progress.setValue(0)
+        self.job_status_label.setText(f"0/{len(items)}")
+        self.cancel_job_btn.setEnabled(True)
+        self.set_job_status_visible(True)
+        
+        thread.start()
+    
+    def cancel_job(self):
+        if self.current_job:
+            self.current_job.cancel()
+            self.cancel_job_btn.setEnabled(False)
+            self.log_text.append("正在取消任务...")
+    
+    def update_job_progress(self, done, total, files_per_sec, mb_per_sec, eta):
+        self.job_progress.setValue(done)
+        self.job_status_label.setText(
+            f"{done}/{total}  {files_per_sec:.1f} 文件/秒  {mb_per_sec:.2f} MB/秒  剩余 {format_duration(eta)}"
+        )
+    
+    def on_job_conflict(self, file_name):
+        # 通过阻塞式连接在GUI线程执行，工作线程等待结果
+        self.current_job.conflict_result = self.show_conflict_dialog(file_name)
+    
+    def on_job_finished(self, success_count, canceled):
+        done_callback = self.job_done_callback
+        runner = self.current_job.runner
+        self.last_run_stats = runner.stats
+        self.run_stats_btn.setEnabled(True)
+        self.log_text.append(runner.stats.format_summary(), "debug")
+        if runner.profiler is not None:
+            self.log_text.append(f"性能分析结果已保存到: {os.path.abspath(runner.profiler.path)}")
+        self.current_job = None
+        self.job_thread = None
+        self.job_done_callback = None
+        self.set_job_status_visible(False)
+        
+        if canceled:
+            self.log_text.append("任务已取消")
         else:
-            # 输出到新文件夹模式：检查输出文件是否已存在
-            output_dir = self.output_dir_edit.text().strip()
-            if output_dir:
-                output_path = Path(output_dir) / new_name
-                if output_path.exists():
-                    return self.show_conflict_dialog(new_name)
-        
-        return "continue"
+            done_callback(success_count)
+        # 任务运行期间监视到的新文件
+        self.convert_watched_files()
+    
+    def closeEvent(self, event):
+        # 关闭窗口前停止后台任务
+        self.stop_watching()
+        if self.current_job:
+            self.current_job.cancel()
+            self.job_thread.quit()
+            self.job_thread.wait()
+        self.file_list.cancel_scans()
+        self.file_list.shutdown_detection()
+        self.file_list.encoding_cache.close()
+        self.log_text.close_log_file()
+        super().closeEvent(event)
     
     def show_conflict_dialog(self, file_name):
+        """返回 (处理方式, 是否应用于所有冲突文件)，处理方式为 replace、skip 或 cancel"""
         dialog = FileConflictDialog(file_name, self)
-        if dialog.exec() == QDialog.DialogCode.Accepted:
-            result, apply_to_all = dialog.get_result()
-            if apply_to_all:
-                self.file_conflict_policy = result
-            
-            if result in ["yes", "yes_to_all"]:
-                return "replace"
-            elif result in ["no", "no_to_all"]:
-                return "skip"
-            else:  # cancel
-                return "cancel"
-        else:
-            return "cancel"
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return "cancel", False
+        
+        result, apply_to_all = dialog.get_result()
+        if result in ["yes", "yes_to_all"]:
+            return "replace", apply_to_all or result == "yes_to_all"
+        elif result in ["no", "no_to_all"]:
+            return "skip", apply_to_all or result == "no_to_all"
+        else:  # cancel
+            return "cancel", False
     
     def preview_encoding(self):
         files = self.get_files_to_process()
@@ -721,307 +1508,184 @@ class FileProcessorApp(QMainWindow):
         
         changes = [(file['name'], f"{file['name']} (编码: {source_enc} → {target_enc})") for file in files]
         
-        preview_dialog = PreviewDialog(changes, self)
+        preview_dialog = PreviewDialog(ChangeListModel(changes), self)
         if preview_dialog.exec() == QDialog.DialogCode.Accepted:
             self.convert_encoding()
     
     def convert_encoding(self):
         files = self.get_files_to_process()
-        if not files:
+        if not files or not self.prepare_batch():
             return
         
-        # 重置文件冲突策略
-        self.file_conflict_policy = None
-        
-        target_enc = self.target_encoding.currentText()
-        success_count = 0
-        canceled = False
-        
-        for file in files:
-            if canceled:
-                break
-                
-            file_name = file['name']
-            file_path = file['path']
-            if not (output_path := self.get_output_path(file_path)):
-                return
-            
-            # 检查文件冲突
-            conflict_action = self.handle_file_conflict(file_path, Path(output_path).name)
-            if conflict_action == "cancel":
-                canceled = True
-                break
-            elif conflict_action == "skip":
-                self.log_text.append(f"跳过文件: {file_name}")
-                continue
-            
-            if self.auto_detect_encoding.isChecked():
-                source_enc = file['encoding']
-                self.log_text.append(f"检测到文件 {file_name} 的编码: {source_enc}")
-            else:
-                source_enc = self.source_encoding.currentText()
-            
-            try:
-                if source_enc.startswith('utf-16'):
-                    with open(file_path, 'rb') as f:
-                        content_bytes = f.read()
-                    
-                    actual_encoding = 'utf-16-be' if content_bytes.startswith(codecs.BOM_UTF16_BE) else \
-                                     'utf-16-le' if content_bytes.startswith(codecs.BOM_UTF16_LE) else source_enc
-                    
-                    content = content_bytes.decode(actual_encoding)
-                else:
-                    with open(file_path, 'r', encoding=source_enc, errors='ignore') as f:
-                        content = f.read()
-                
-                if target_enc.startswith('utf-16'):
-                    with open(output_path, 'wb') as f:
-                        if target_enc == 'utf-16-be':
-                            f.write(codecs.BOM_UTF16_BE)
-                        elif target_enc in ['utf-16-le', 'utf-16']:
-                            f.write(codecs.BOM_UTF16_LE)
-                            if target_enc == 'utf-16':
-                                target_enc = 'utf-16-le'
-                        
-                        f.write(content.encode(target_enc))
-                else:
-                    with open(output_path, 'w', encoding=target_enc, errors='ignore') as f:
-                        f.write(content)
-                
-                if self.modify_directly.isChecked():
-                    self.file_list.update_file_name(file_name, file_name, output_path)
-                
-                success_count += 1
-                self.log_text.append(f"转换成功: {file_path} -> {output_path}")
-            except Exception as e:
-                self.log_text.append(f"转换失败 {file_path}: {str(e)}")
+        task, finish = self.create_convert_task(self.output_settings, *self.read_convert_options())
+        self.start_job(files, task,
+                       lambda count: QMessageBox.information(self, "完成", f"编码转换完成，成功 {count} 个文件"),
+                       self.convert_workers.value(), finish=finish)
+    
+    def read_convert_options(self):
+        """返回 (目标编码, 手动指定的源编码, 是否增量转换)
         
-        if not canceled:
-            QMessageBox.information(self, "完成", f"编码转换完成，成功 {success_count} 个文件")
+        手动指定时在GUI线程读取源编码，后台线程不访问控件
+        """
+        manual_source_enc = None if self.auto_detect_encoding.isChecked() else self.source_encoding.currentText()
+        return self.target_encoding.currentText(), manual_source_enc, self.incremental_convert.isChecked()
     
-    def preview_rename(self, rename_type):
-        files = self.get_files_to_process()
-        if not files:
+    def create_convert_task(self, settings, target_enc, manual_source_enc, incremental):
+        """返回编码转换任务及其收尾钩子"""
+        names = OutputNameIndex(settings.output_dir)
+        group = GroupCommit() if settings.durability == "group" else None
+        manifest = ConversionManifest() if incremental else None
+        task = make_convert_task(
+            settings, target_enc, names, manual_source_enc,
+            self.file_list.detector, self.file_list.encoding_cache, group, manifest
+        )
+        return task, chain_finish(group and group.finish, names.finish, manifest and manifest.finish)
+    
+    def toggle_watch_folder(self, checked):
+        if not checked:
+            self.stop_watching()
+            return
+        
+        folder = QFileDialog.getExistingDirectory(self, "选择要监视的文件夹")
+        if not folder or not (settings := self.read_output_settings()):
+            self.watch_folder_btn.setChecked(False)
             return
         
-        changes = []
+        try:
+            # 输出文件夹不监视，否则输出文件会被再次转换
+            self.watcher = FolderWatcher([folder], self.watched_files.emit, self.file_list.scanner,
+                                         ignore_dirs=[] if settings.modify_directly else [settings.output_dir],
+                                         on_log=self.watch_log.emit)
+        except ValueError as e:
+            self.watch_folder_btn.setChecked(False)
+            self.show_warning(str(e))
+            return
         
-        if rename_type == "replace":
-            # 通过选项卡引用访问UI元素
-            find_str = self.replace_tab.find_text.text()
-            if not find_str:
-                self.show_warning("请输入要查找的文本")
-                return
-            
-            replace_str = self.replace_tab.replace_text.text()
-            for file in files:
-                file_name = file['name']
-                changes.append((file_name, file_name.replace(find_str, replace_str)))
-        
-        elif rename_type == "affix":
-            # 通过选项卡引用访问UI元素
-            prefix = self.affix_tab.prefix_text.text()
-            suffix = self.affix_tab.suffix_text.text()
-            
-            if not prefix and not suffix:
-                self.show_warning("请至少输入前缀或后缀")
-                return
-            
-            for file in files:
-                file_name = file['name']
-                name_parts = os.path.splitext(file_name)
-                changes.append((file_name, f"{prefix}{name_parts[0]}{suffix}{name_parts[1]}"))
-        
-        elif rename_type == "remove_affix":
-            # 通过选项卡引用访问UI元素
-            remove_count = self.remove_affix_tab.remove_count.value()
-            
-            for file in files:
-                file_name = file['name']
-                name_parts = os.path.splitext(file_name)
-                
-                if self.remove_affix_tab.remove_prefix_radio.isChecked():
-                    # 删除前缀字符
-                    if len(name_parts[0]) > remove_count:
-                        new_name = f"{name_parts[0][remove_count:]}{name_parts[1]}"
-                    else:
-                        new_name = name_parts[1]  # 如果文件名长度不足，只保留扩展名
-                else:
-                    # 删除后缀字符
-                    if len(name_parts[0]) > remove_count:
-                        new_name = f"{name_parts[0][:-remove_count]}{name_parts[1]}"
-                    else:
-                        new_name = name_parts[1]  # 如果文件名长度不足，只保留扩展名
-                
-                changes.append((file_name, new_name))
-        
-        elif rename_type == "sequence":
-            # 通过选项卡引用访问UI元素
-            start_num = self.sequence_tab.start_number.value()
-            digits = self.sequence_tab.digit_count.value()
-            
-            for i, file in enumerate(files):
-                file_name = file['name']
-                seq_num = start_num + i
-                seq_str = f"{seq_num:0{digits}d}"
-                name_parts = os.path.splitext(file_name)
-                
-                if self.sequence_tab.sequence_replace_radio.isChecked():
-                    # 替换模式：完全用序号替换原始名称
-                    new_name = f"{seq_str}{name_parts[1]}"
-                else:
-                    # 追加模式：在原始名称后追加序号
-                    new_name = f"{name_parts[0]}_{seq_str}{name_parts[1]}"
-                
-                changes.append((file_name, new_name))
-        
-        preview_dialog = PreviewDialog(changes, self)
-        if preview_dialog.exec() == QDialog.DialogCode.Accepted:
-            self.rename_files(rename_type)
+        self.watch_options = (settings, *self.read_convert_options(), self.convert_workers.value())
+        self.watcher.start()
+        self.watch_folder_btn.setText("停止监视")
+        self.log_text.append(f"开始监视文件夹: {folder}")
     
-    def rename_files(self, rename_type):
-        files = self.get_files_to_process()
-        if not files:
+    def stop_watching(self):
+        if self.watcher is None:
+            return
+        self.watcher.stop()
+        self.watcher = None
+        self.watch_queue.clear()
+        self.watch_folder_btn.setChecked(False)
+        self.watch_folder_btn.setText("监视文件夹...")
+        self.log_text.append("已停止监视文件夹")
+    
+    def on_watched_files(self, paths):
+        # 停止监视前已发出的信号不再处理
+        if self.watcher is None:
+            return
+        self.file_list.add_files(paths)
+        self.watch_queue.extend(paths)
+        self.convert_watched_files()
+    
+    def convert_watched_files(self):
+        """转换监视到的新文件；已有任务运行时等待其结束后再转换"""
+        if self.watcher is None or not self.watch_queue or self.current_job:
             return
         
-        # 重置文件冲突策略
-        self.file_conflict_policy = None
+        paths, self.watch_queue = self.watch_queue, []
+        if not (files := self.file_list.get_files_by_path(paths)):
+            return
+        settings, target_enc, manual_source_enc, incremental, workers = self.watch_options
+        task, finish = self.create_convert_task(settings, target_enc, manual_source_enc, incremental)
+        self.output_settings = settings
+        self.start_job(files, task,
+                       lambda count: self.log_text.append(f"转换了 {len(files)} 个新文件，成功 {count} 个"),
+                       workers, finish=finish)
+    
+    def create_name_func(self, rename_type):
+        """根据选项卡的当前值创建命名函数，输入无效时提示并返回 None
         
-        success_count = 0
-        canceled = False
+        命名函数在后台线程执行，需在此提前读取控件状态
+        """
+        try:
+            if rename_type == "replace":
+                return replace_rule(self.replace_tab.find_text.text(), self.replace_tab.replace_text.text())
+            elif rename_type == "affix":
+                return affix_rule(self.affix_tab.prefix_text.text(), self.affix_tab.suffix_text.text())
+            elif rename_type == "remove_affix":
+                return remove_affix_rule(self.remove_affix_tab.remove_count.value(),
+                                         self.remove_affix_tab.remove_prefix_radio.isChecked())
+            elif rename_type == "sequence":
+                return sequence_rule(self.sequence_tab.start_number.value(), self.sequence_tab.digit_count.value(),
+                                     self.sequence_tab.sequence_replace_radio.isChecked())
+            elif rename_type == "template":
+                tab = self.template_tab
+                pattern = tab.pattern_text.text()
+                if template := tab.template_text.text():
+                    return template_rule(template, pattern, tab.template_start.value(), tab.ignore_case.isChecked(),
+                                         self.file_list.detector)
+                return regex_rule(pattern, tab.regex_replace_text.text(), tab.ignore_case.isChecked())
+        except ValueError as e:
+            self.show_warning(str(e))
+        return None
+    
+    def create_rename_plan(self, rename_type, callback):
+        """在后台线程计算一次重命名计划，完成后在GUI线程调用 callback(计划)，输入无效时不调用
         
-        rename_operations = {
-            "replace": self._rename_replace,
-            "affix": self._rename_affix,
-            "remove_affix": self._rename_remove_affix,
-            "sequence": self._rename_sequence
-        }
+        模板用到 {encoding} 时计划要等待所有文件的编码检测，放在后台计算界面不会卡住。
+        """
+        if self.planning:
+            self.show_warning("正在计算重命名计划，请稍候")
+            return
+        files = self.get_files_to_process()
+        if not files or not (settings := self.read_output_settings()):
+            return
+        if not (name_func := self.create_name_func(rename_type)):
+            return
+        if getattr(name_func, 'needs_encoding', False) and any(not file['encoding'] for file in files):
+            self.log_text.append("正在等待编码检测完成...")
         
-        if rename_type in rename_operations:
-            success_count, canceled = rename_operations[rename_type](files)
+        def build():
+            try:
+                result = RenamePlan(files, name_func, settings)
+                # 预览要显示的冲突标记需要列举目录，也在后台算好
+                result.statuses()
+            except ValueError as e:
+                result = str(e)
+            except Exception as e:
+                result = f"计算重命名计划失败: {e}"
+            self.rename_plan_ready.emit(callback, result)
         
-        if not canceled:
-            QMessageBox.information(self, "完成", f"重命名完成，成功 {success_count} 个文件")
+        self.planning = True
+        threading.Thread(target=build, daemon=True).start()
     
-    def _rename_replace(self, files):
-        # 通过选项卡引用访问UI元素
-        find_str = self.replace_tab.find_text.text()
-        if not find_str:
-            self.show_warning("请输入要查找的文本")
-            return 0, False
-        
-        replace_str = self.replace_tab.replace_text.text()
-        return self._process_rename_operation(files, lambda f: f.replace(find_str, replace_str))
+    def on_rename_plan_ready(self, callback, plan):
+        self.planning = False
+        if isinstance(plan, str):
+            self.show_warning(plan)
+        else:
+            callback(plan)
     
-    def _rename_affix(self, files):
-        # 通过选项卡引用访问UI元素
-        prefix = self.affix_tab.prefix_text.text()
-        suffix = self.affix_tab.suffix_text.text()
-        
-        if not prefix and not suffix:
-            self.show_warning("请至少输入前缀或后缀")
-            return 0, False
-        
-        return self._process_rename_operation(files, lambda f: f"{prefix}{os.path.splitext(f)[0]}{suffix}{os.path.splitext(f)[1]}")
+    def preview_rename(self, rename_type):
+        self.create_rename_plan(rename_type, self.show_rename_preview)
     
-    def _rename_remove_affix(self, files):
-        # 通过选项卡引用访问UI元素
-        remove_count = self.remove_affix_tab.remove_count.value()
-        
-        def remove_affix_func(file_name):
-            name_parts = os.path.splitext(file_name)
-            if self.remove_affix_tab.remove_prefix_radio.isChecked():
-                return f"{name_parts[0][remove_count:]}{name_parts[1]}" if len(name_parts[0]) > remove_count else name_parts[1]
-            else:
-                return f"{name_parts[0][:-remove_count]}{name_parts[1]}" if len(name_parts[0]) > remove_count else name_parts[1]
-        
-        return self._process_rename_operation(files, remove_affix_func)
+    def show_rename_preview(self, plan):
+        # 确认后直接执行预览中的同一份计划，新名称不会重新计算
+        preview_dialog = PreviewDialog(RenamePlanModel(plan), self)
+        if preview_dialog.exec() == QDialog.DialogCode.Accepted:
+            self.execute_rename_plan(plan)
     
-    def _rename_sequence(self, files):
-        # 通过选项卡引用访问UI元素
-        start_num = self.sequence_tab.start_number.value()
-        digits = self.sequence_tab.digit_count.value()
-        
-        def sequence_func(file_name, i):
-            seq_num = start_num + i
-            seq_str = f"{seq_num:0{digits}d}"
-            name_parts = os.path.splitext(file_name)
-            
-            if self.sequence_tab.sequence_replace_radio.isChecked():
-                return f"{seq_str}{name_parts[1]}"
-            else:
-                return f"{name_parts[0]}_{seq_str}{name_parts[1]}"
-        
-        return self._process_rename_operation(files, sequence_func, with_index=True)
-    
-    def _process_rename_operation(self, files, name_func, with_index=False):
-        success_count = 0
-        canceled = False
-        
-        for i, file in enumerate(files):
-            if canceled:
-                break
-                
-            file_name = file['name']
-            file_path = file['path']
-            if not (output_path := self.get_output_path(file_path)):
-                return success_count, canceled
-            
-            new_name = name_func(file_name, i) if with_index else name_func(file_name)
-            
-            # 检查文件冲突
-            conflict_action = self.handle_file_conflict(file_path, new_name)
-            if conflict_action == "cancel":
-                canceled = True
-                break
-            elif conflict_action == "skip":
-                self.log_text.append(f"跳过文件: {file_name}")
-                continue
-            
-            success_count += self.process_rename(file_name, file_path, output_path, new_name, conflict_action == "replace")
-        
-        return success_count, canceled
+    def rename_files(self, rename_type):
+        self.create_rename_plan(rename_type, self.execute_rename_plan)
     
-    def process_rename(self, file_name, file_path, output_path, new_name, overwrite=False):
-        try:
-            if self.modify_directly.isChecked():
-                path_obj = Path(file_path)
-                new_path = path_obj.parent / new_name
-                
-                # 如果目标文件已存在且需要覆盖，先删除它
-                if overwrite and new_path.exists() and new_path != path_obj:
-                    os.remove(new_path)
-                
-                path_obj.rename(new_path)
-                self.file_list.update_file_name(file_name, new_name, str(new_path))
-            else:
-                output_dir = Path(output_path).parent
-                output_dir.mkdir(parents=True, exist_ok=True)
-                
-                # 如果目标文件已存在且需要覆盖，先删除它
-                if overwrite and os.path.exists(output_path):
-                    os.remove(output_path)
-                
-                shutil.copy2(file_path, output_path)
-                
-                output_path_obj = Path(output_path)
-                new_output_path = output_path_obj.parent / new_name
-                
-                # 如果目标文件已存在且需要覆盖，先删除它
-                if overwrite and new_output_path.exists() and new_output_path != output_path_obj:
-                    os.remove(new_output_path)
-                
-                output_path_obj.rename(new_output_path)
-                
-                # 在输出到新文件夹模式下，不更新文件列表中的文件路径
-                # 只记录操作日志
-                self.log_text.append(f"复制并重命名: {file_name} -> {new_name} (输出到: {new_output_path})")
-            
-            self.log_text.append(f"重命名成功: {file_name} -> {new_name}")
-            return 1
-        except Exception as e:
-            self.log_text.append(f"重命名失败 {file_path}: {str(e)}")
-            return 0
+    def execute_rename_plan(self, plan):
+        if self.current_job:
+            self.show_warning("已有任务正在运行，请等待完成或取消")
+            return
+        
+        # 冲突在后台线程的准备阶段一次性确定，之后再逐个改名
+        self.output_settings = plan.settings
+        transaction = RenameTransaction(plan, ConflictResolver())
+        self.start_job(plan.changes, transaction.execute,
+                       lambda count: QMessageBox.information(self, "完成", f"重命名完成，成功 {count} 个文件"),
+                       prepare=transaction.prepare, finish=transaction.finish)
     
     def export_filenames(self):
         files = self.get_files_to_process()
@@ -1032,56 +1696,46 @@ class FileProcessorApp(QMainWindow):
             self.show_warning("请输入导出文件名")
             return
         
-        export_enc = self.export_encoding.currentText()
-        
-        if self.modify_directly.isChecked():
-            export_path = export_filename
-        else:
-            if not (output_dir := self.output_dir_edit.text().strip()):
-                self.show_warning("请先设置输出文件夹")
-                return
-            
-            os.makedirs(output_dir, exist_ok=True)
-            export_path = os.path.join(output_dir, export_filename)
-        
-        # 检查文件冲突
-        if os.path.exists(export_path):
-            dialog = FileConflictDialog(export_filename, self)
-            if dialog.exec() == QDialog.DialogCode.Accepted:
-                result, apply_to_all = dialog.get_result()
-                if result in ["no", "no_to_all", "cancel"]:
-                    self.log_text.append("导出操作已取消")
-                    return
+        if not self.prepare_batch():
+            return
         
-        try:
-            # 获取所有文件名并用逗号分隔
-            filenames = [file['name'] for file in files]
-            content = ','.join(filenames)
-            
-            if export_enc.startswith('utf-16'):
-                with open(export_path, 'wb') as f:
-                    if export_enc == 'utf-16-be':
-                        f.write(codecs.BOM_UTF16_BE)
-                    elif export_enc in ['utf-16-le', 'utf-16']:
-                        f.write(codecs.BOM_UTF16_LE)
-                        if export_enc == 'utf-16':
-                            export_enc = 'utf-16-le'
-                    
-                    f.write(content.encode(export_enc))
+        export_enc = self.export_encoding.currentText()
+        export_path = get_export_path(export_filename, self.output_settings)
+        # 获取所有文件名并用逗号分隔
+        filenames = [file['name'] for file in files]
+        errors = []
+        
+        def export_done(count):
+            if count:
+                QMessageBox.information(self, "完成", f"文件名已导出到 {export_path} (编码: {export_enc})")
             else:
-                with open(export_path, 'w', encoding=export_enc) as f:
-                    f.write(content)
-            
-            self.log_text.append(f"文件名已导出到: {export_path} (编码: {export_enc})")
-            QMessageBox.information(self, "完成", f"文件名已导出到 {export_path} (编码: {export_enc})")
-        except Exception as e:
-            self.log_text.append(f"导出失败: {str(e)}")
-            QMessageBox.critical(self, "错误", f"导出失败: {str(e)}")
+                QMessageBox.critical(self, "错误", f"导出失败: {errors[0] if errors else ''}")
+        
+        task = make_export_task(filenames, export_enc, ConflictResolver(), errors)
+        self.start_job([export_path], task, export_done)
 
 def main():
+    # --profile-startup 在窗口首次绘制后输出导入和初始化各阶段的耗时
+    profiler = None
+    if "--profile-startup" in sys.argv:
+        sys.argv.remove("--profile-startup")
+        profiler = StartupProfiler(STARTUP_MARKS)
+    # --profile-jobs cprofile|sample 分析每个批处理任务，结果保存在当前目录
+    job_profile = None
+    if "--profile-jobs" in sys.argv:
+        position = sys.argv.index("--profile-jobs")
+        job_profile = sys.argv[position + 1] if position + 1 < len(sys.argv) else ""
+        del sys.argv[position:position + 2]
+        if job_profile not in PROFILE_MODES:
+            sys.exit(f"--profile-jobs 只支持: {', '.join(PROFILE_MODES)}")
+    
     app = QApplication(sys.argv)
-    window = FileProcessorApp()
+    if profiler:
+        profiler.mark("创建 QApplication")
+    window = FileProcessorApp(profiler, job_profile)
     window.show()
+    if profiler:
+        profiler.mark("显示窗口")
     sys.exit(app.exec())
 
 if __name__ == "__main__":
@@ -0,0 +1,3267 @@
+"""文本处理器的核心逻辑，不依赖 PyQt6
+
+编码检测与转换、目录扫描、文件登记表、重命名计划、文件名导出和批处理执行器都在这里，
+图形界面和命令行共用这些接口。无界面环境下可直接运行本模块：
+
+    python 文本处理核心.py convert --to utf-8 文件或文件夹...
+    python 文本处理核心.py rename --replace 旧 新 --dry-run 文件或文件夹...
+    python 文本处理核心.py rename --regex "\\s+" _ --template "{parent}_{n:03}{ext}" 文件或文件夹...
+    python 文本处理核心.py export --name page.txt 文件或文件夹...
+    python 文本处理核心.py watch --to utf-8 --output-dir 输出 文件夹...
+"""
+from __future__ import annotations
+
+import sys
+import os
+import io
+import re
+import string
+import shutil
+import codecs
+import uuid
+import errno
+import time
+import math
+import array
+import threading
+import collections
+import mmap
+import queue
+import fnmatch
+import itertools
+import importlib.util
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, CancelledError, BrokenExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+# chardet、sqlite3、多进程和命令行解析等较重的模块在首次使用时才导入，以缩短启动时间
+if TYPE_CHECKING:
+    import argparse
+
+# 流式转换时每次读取的字节数
+CONVERT_CHUNK_SIZE = 1024 * 1024
+
+def _utf16_codec(source_enc, head):
+    """根据文件头的BOM确定 utf-16 源文件的字节序，返回 utf-16-le 或 utf-16-be"""
+    actual_encoding = 'utf-16-be' if head.startswith(codecs.BOM_UTF16_BE) else \
+                      'utf-16-le' if head.startswith(codecs.BOM_UTF16_LE) else source_enc
+    if actual_encoding == 'utf-16':
+        # 无BOM时整块解码按本机字节序处理，而 utf-16 增量解码器会直接报错
+        actual_encoding = 'utf-16-le' if sys.byteorder == 'little' else 'utf-16-be'
+    return actual_encoding
+
+def _make_stream_decoder(source_enc, head):
+    """创建增量解码器，行为与整文件读取保持一致"""
+    if source_enc.startswith('utf-16'):
+        # utf-16 按字节解码：根据BOM确定字节序，不做换行转换
+        return codecs.getincrementaldecoder(_utf16_codec(source_enc, head))('strict')
+    
+    # 其他编码等同于文本模式读取：忽略错误并统一换行符
+    decoder = codecs.getincrementaldecoder(source_enc)('ignore')
+    return io.IncrementalNewlineDecoder(decoder, translate=True)
+
+def _make_stream_encoder(target_enc):
+    """创建增量编码器，返回 (编码器, 文件头BOM, 换行符)"""
+    if target_enc.startswith('utf-16'):
+        # utf-16 按字节写入：BOM只在文件头写一次，utf-16 默认使用小端序
+        if target_enc == 'utf-16-be':
+            return codecs.getincrementalencoder('utf-16-be')('strict'), codecs.BOM_UTF16_BE, '\n'
+        return codecs.getincrementalencoder('utf-16-le')('strict'), codecs.BOM_UTF16_LE, '\n'
+    
+    # 其他编码等同于文本模式写入：忽略错误并使用系统换行符
+    return codecs.getincrementalencoder(target_enc)('ignore'), b'', os.linesep
+
+# 落盘方式：none 交给操作系统缓存；fsync 每个文件写完后同步文件内容和所在目录；
+# group 同步每个文件的内容，目录项由 GroupCommit 按组同步
+DURABILITY_MODES = ("none", "fsync", "group")
+DURABILITY_NAMES = {"none": "不强制落盘", "fsync": "逐个文件落盘", "group": "分组落盘"}
+
+def fsync_directory(directory):
+    """把目录中的新建和改名写入磁盘，无法打开目录的平台（Windows）直接跳过"""
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class GroupCommit:
+    """分组落盘：累计 max_files 个文件或距本组第一个文件超过 max_delay 秒时，
+    对本组涉及的每个目录执行一次 fsync，任务结束时 finish() 同步剩余的文件。
+    
+    文件内容在替换前已单独同步，崩溃时尚未同步目录的文件保持替换前的内容。
+    """
+    MAX_FILES = 64
+    MAX_DELAY = 0.2
+    
+    def __init__(self, max_files: int = MAX_FILES, max_delay: float = MAX_DELAY):
+        self.max_files = max(1, max_files)
+        self.max_delay = max_delay
+        self.directories = set()
+        self.count = 0
+        self.first_time = None
+        self.commits = 0
+    
+    def add(self, path: str):
+        self.directories.add(os.path.dirname(os.path.abspath(path)))
+        self.count += 1
+        now = time.monotonic()
+        if self.first_time is None:
+            self.first_time = now
+        if self.count >= self.max_files or now - self.first_time >= self.max_delay:
+            self.commit()
+    
+    def commit(self):
+        for directory in self.directories:
+            fsync_directory(directory)
+        if self.directories:
+            self.commits += 1
+        self.directories.clear()
+        self.count = 0
+        self.first_time = None
+    
+    def finish(self, runner=None):
+        self.commit()
+
+def chain_finish(*hooks):
+    """把多个 finish(runner) 钩子合并为一个，按顺序调用，None 被忽略"""
+    def finish(runner):
+        for hook in hooks:
+            if hook is not None:
+                hook(runner)
+    return finish
+
+def stream_convert_file(src_path, dst_path, source_enc, target_enc, chunk_size=CONVERT_CHUNK_SIZE, timings=None,
+                        durability="none"):
+    """按固定大小分块转换文件编码，内存占用与文件大小无关
+    
+    输出先写入目标目录下的临时文件，完成后再用 os.replace 原子地替换目标文件，
+    因此源文件与目标文件相同时（直接修改模式）也可以边读边写，中途失败不会留下写了一半的目标文件。
+    durability 见 DURABILITY_MODES。
+    传入 timings 字典时累计 read/decode/encode/write 各阶段的 [秒数, 字节数]。
+    """
+    timings = {} if timings is None else timings
+    for stage in ("read", "decode", "encode", "write"):
+        timings.setdefault(stage, [0.0, 0])
+    clock = time.perf_counter
+    
+    def record(stage, start, nbytes):
+        now = clock()
+        timings[stage][0] += now - start
+        timings[stage][1] += nbytes
+        return now
+    
+    encoder, bom, newline = _make_stream_encoder(target_enc)
+    dst_dir, dst_name = os.path.split(os.path.abspath(dst_path))
+    temp_path = os.path.join(dst_dir, f".{dst_name}.{uuid.uuid4().hex[:8]}.tmp")
+    
+    try:
+        with open(src_path, 'rb') as src, open(temp_path, 'xb') as dst:
+            start = clock()
+            chunk = src.read(chunk_size)
+            start = record("read", start, len(chunk))
+            decoder = _make_stream_decoder(source_enc, chunk)
+            dst.write(bom)
+            # 源文件自带的BOM解码为开头的 U+FEFF，输出已写入BOM时去掉，避免每次转换多一个BOM
+            strip_bom = bool(bom)
+            
+            final = False
+            while not final:
+                final = not chunk
+                # 跨块边界被截断的多字节序列和 \r\n 由增量解码器缓存到下一块
+                text = decoder.decode(chunk, final=final)
+                if strip_bom and text:
+                    text = text.removeprefix('\ufeff')
+                    strip_bom = False
+                if newline != '\n':
+                    text = text.replace('\n', newline)
+                start = record("decode", start, len(chunk))
+                data = encoder.encode(text, final=final)
+                start = record("encode", start, len(data))
+                dst.write(data)
+                start = record("write", start, len(data))
+                if not final:
+                    chunk = src.read(chunk_size)
+                    start = record("read", start, len(chunk))
+            
+            # 替换前先把内容写入磁盘，崩溃后目标文件要么是旧内容，要么是完整的新内容
+            if durability != "none":
+                dst.flush()
+                os.fsync(dst.fileno())
+        
+        # 覆盖已有文件时保留其权限
+        start = clock()
+        if os.path.exists(dst_path):
+            shutil.copymode(dst_path, temp_path)
+        os.replace(temp_path, dst_path)
+        if durability == "fsync":
+            fsync_directory(dst_dir)
+        record("write", start, 0)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _codec_name(encoding):
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return encoding
+
+def _is_ascii_compatible(encoding):
+    """ASCII 字符按原字节读写且不写BOM的编码，如 utf-8、gbk、latin-1"""
+    ascii_bytes = bytes(range(128))
+    try:
+        return (ascii_bytes.decode('ascii').encode(encoding) == ascii_bytes
+                and ascii_bytes.decode(encoding) == ascii_bytes.decode('ascii'))
+    except (LookupError, UnicodeError):
+        return False
+
+# (源编码, 目标编码)：源编码的每个字符在目标编码中字节相同
+_ENCODING_SUBSETS = {('gb2312', 'gbk'), ('gb2312', 'gb18030')}
+
+def byte_splice_plan(path, source_enc, target_enc, chunk_size=CONVERT_CHUNK_SIZE) -> tuple[int, bytes] | None:
+    """判断按 stream_convert_file 的规则转换的结果能否直接由原字节得到
+    
+    能时返回 (跳过的字节数, 前缀)，即转换结果等于 前缀 + 原文件[跳过的字节数:]；
+    (0, b"") 表示与原文件逐字节相同，无法判断或需要重新编码时返回 None。
+    适用于 utf-8 与 utf-8-sig 互转（只添加或去掉BOM）、字节序相同的 utf-16、
+    同一ASCII兼容编码、gb2312 转为 gbk/gb18030，以及纯ASCII内容在ASCII兼容编码间转换。
+    读取时确认内容能严格解码，并且没有会被统一换行符改写的 \r。
+    """
+    source, target = _codec_name(source_enc), _codec_name(target_enc)
+    
+    if target.startswith('utf-16'):
+        # 输出总是以BOM开头，源文件已有同字节序的BOM时转换结果与原文件相同，
+        # 没有BOM时为 BOM + 原文件；字节序不同需要重新编码
+        if not source.startswith('utf-16'):
+            return None
+        bom, codec = (codecs.BOM_UTF16_BE, 'utf-16-be') if target == 'utf-16-be' else (codecs.BOM_UTF16_LE, 'utf-16-le')
+        with open(path, 'rb') as f:
+            chunk = head = f.read(chunk_size)
+            if _utf16_codec(source, chunk) != codec:
+                return None
+            decoder = codecs.getincrementaldecoder(codec)('strict')
+            try:
+                while chunk:
+                    decoder.decode(chunk)
+                    chunk = f.read(chunk_size)
+                decoder.decode(b"", final=True)
+            except UnicodeDecodeError:
+                return None
+        return 0, b"" if head.startswith(bom) else bom
+    
+    # utf-8-sig 解码时去掉开头的一个BOM，编码时在开头写一个BOM，其余与 utf-8 相同
+    source_base = 'utf-8' if source == 'utf-8-sig' else source
+    target_base = 'utf-8' if target == 'utf-8-sig' else target
+    if not (_is_ascii_compatible(source_base) and _is_ascii_compatible(target_base)):
+        return None
+    # 编码不等价时只有纯ASCII内容才能保持原字节
+    same_bytes = (source_base == target_base or source == 'ascii'
+                  or (source_base, target_base) in _ENCODING_SUBSETS)
+    
+    # 非 utf-16 输出以系统换行符写出，Windows 上只有不含换行的文件保持不变
+    forbidden = (b"\r",) if os.linesep == "\n" else (b"\r", b"\n")
+    with open(path, 'rb') as f:
+        head = f.read(chunk_size)
+        skip = len(codecs.BOM_UTF8) if source == 'utf-8-sig' and head.startswith(codecs.BOM_UTF8) else 0
+        prefix = codecs.BOM_UTF8 if target == 'utf-8-sig' else b""
+        decoder = codecs.getincrementaldecoder(source_base)('strict')
+        chunk = head[skip:]
+        decoding = False
+        try:
+            while chunk:
+                if any(mark in chunk for mark in forbidden):
+                    return None
+                # 在遇到非ASCII字节之前无需解码；此后多字节字符可能跨块，每块都要解码
+                if decoding or not chunk.isascii():
+                    if not same_bytes:
+                        return None
+                    decoding = True
+                    decoder.decode(chunk)
+                chunk = f.read(chunk_size)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return None
+    
+    # 源文件的BOM原样保留时不必重写
+    if skip and prefix:
+        return 0, b""
+    return skip, prefix
+
+def file_digest(path, chunk_size=CONVERT_CHUNK_SIZE) -> str:
+    import hashlib
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _sync_output(path, durability):
+    if durability == "none":
+        return
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    if durability == "fsync":
+        fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+def convert_file_worker(src_path, dst_path, source_enc, target_enc, durability="none", want_digest=False):
+    """进程池中执行的单文件转换，失败时返回错误信息而不抛出异常
+    
+    转换结果与原文件相同时不重新编码：直接修改模式下不写文件，状态为 unchanged；
+    输出到新文件夹时复制原文件。只需添加或去掉BOM时按字节拼接，见 byte_splice_plan。
+    返回 (状态, 源文件字节数, 错误信息, 附加信息)，状态为 ok / unchanged / failed，
+    附加信息包含各阶段的 [秒数, 字节数] 和写出方式 method（copy / splice / convert，未写文件时为 None），
+    want_digest 为 True 时还包含输出文件的 (大小, 修改时间, 摘要)。
+    """
+    timings = {}
+    info = {'timings': timings, 'output': None, 'method': None}
+    try:
+        file_size = os.path.getsize(src_path)
+        start = time.perf_counter()
+        plan = byte_splice_plan(src_path, source_enc, target_enc)
+        timings['read'] = [time.perf_counter() - start, file_size if plan else 0]
+        
+        if plan == (0, b"") and os.path.abspath(src_path) == os.path.abspath(dst_path):
+            status = "unchanged"
+        elif plan == (0, b""):
+            start = time.perf_counter()
+            materialize_file(src_path, dst_path, overwrite=True)
+            _sync_output(dst_path, durability)
+            timings['write'] = [time.perf_counter() - start, file_size]
+            status, info['method'] = "ok", "copy"
+        elif plan:
+            start = time.perf_counter()
+            splice_file(src_path, dst_path, *plan, durability)
+            timings['write'] = [time.perf_counter() - start, file_size]
+            status, info['method'] = "ok", "splice"
+        else:
+            stream_convert_file(src_path, dst_path, source_enc, target_enc, timings=timings, durability=durability)
+            status, info['method'] = "ok", "convert"
+        
+        if want_digest:
+            st = os.stat(dst_path)
+            info['output'] = (st.st_size, st.st_mtime_ns, file_digest(dst_path))
+        return status, file_size, None, info
+    except Exception as e:
+        return "failed", 0, str(e), info
+
+# 输出到新文件夹时生成文件的方式，按顺序尝试，平台或文件系统不支持时退回下一种
+MATERIALIZE_CHAINS = {
+    'auto': ('reflink', 'kernel', 'copy'),
+    'reflink': ('reflink', 'kernel', 'copy'),
+    'hardlink': ('hardlink', 'reflink', 'kernel', 'copy'),
+    'kernel': ('kernel', 'copy'),
+    'copy': ('copy',),
+}
+MATERIALIZE_NAMES = {
+    'auto': "自动", 'reflink': "写时复制", 'hardlink': "硬链接",
+    'kernel': "内核复制", 'copy': "普通复制",
+}
+# Linux 克隆文件的 ioctl 请求号 FICLONE
+_FICLONE = 0x40049409
+
+def _reflink_fd(src_fd, dst_fd, size):
+    """写时复制克隆，Btrfs、XFS 等文件系统上只复制元数据"""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.ENOTSUP, "当前平台不支持 reflink")
+    fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+
+def _kernel_copy_fd(src_fd, dst_fd, size):
+    """由内核从两个文件的当前位置起直接复制数据，优先 copy_file_range，其次 sendfile"""
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size and (count := os.copy_file_range(src_fd, dst_fd, size - copied)):
+                copied += count
+            return
+        except OSError:
+            if copied:
+                raise
+    if not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOTSUP, "当前平台不支持内核复制")
+    offset = os.lseek(src_fd, 0, os.SEEK_CUR)
+    while copied < size and (count := os.sendfile(dst_fd, src_fd, offset + copied, min(size - copied, 1 << 30))):
+        copied += count
+
+def _plain_copy_fd(src_fd, dst_fd, size):
+    while chunk := os.read(src_fd, CONVERT_CHUNK_SIZE):
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+_MATERIALIZERS = {'reflink': _reflink_fd, 'kernel': _kernel_copy_fd, 'copy': _plain_copy_fd}
+
+def splice_file(src_path, dst_path, skip=0, prefix=b"", durability="none"):
+    """不经解码，把 prefix 和源文件 skip 字节之后的内容写入目标文件
+    
+    用于只需添加或去掉BOM的转换，数据由内核直接复制，不支持时退回普通复制。
+    与 stream_convert_file 一样先写入临时文件再原子地替换目标文件，源文件与目标文件可以相同。
+    """
+    dst_dir, dst_name = os.path.split(os.path.abspath(dst_path))
+    temp_path = os.path.join(dst_dir, f".{dst_name}.{uuid.uuid4().hex[:8]}.tmp")
+    binary = getattr(os, 'O_BINARY', 0)
+    src_fd = os.open(src_path, os.O_RDONLY | binary)
+    dst_fd = None
+    try:
+        size = max(0, os.fstat(src_fd).st_size - skip)
+        dst_fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | binary, 0o666)
+        for method in ('kernel', 'copy'):
+            os.ftruncate(dst_fd, 0)
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+            os.lseek(src_fd, skip, os.SEEK_SET)
+            view = memoryview(prefix)
+            while view:
+                view = view[os.write(dst_fd, view):]
+            try:
+                _MATERIALIZERS[method](src_fd, dst_fd, size)
+                break
+            except OSError:
+                if method == 'copy':
+                    raise
+        if durability != "none":
+            os.fsync(dst_fd)
+        os.close(dst_fd)
+        dst_fd = None
+        
+        # 覆盖已有文件时保留其权限
+        if os.path.exists(dst_path):
+            shutil.copymode(dst_path, temp_path)
+        os.replace(temp_path, dst_path)
+        if durability == "fsync":
+            fsync_directory(dst_dir)
+    except BaseException:
+        if dst_fd is not None:
+            os.close(dst_fd)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        os.close(src_fd)
+
+def materialize_file(src_path, dst_path, strategy='auto', overwrite=False):
+    """直接在 dst_path 生成 src_path 的副本或硬链接，返回实际使用的方式
+    
+    内容不变时无需经过用户态缓冲区：同一卷上的 reflink 和硬链接几乎不复制数据。
+    overwrite 为 False 时目标已存在会抛出 FileExistsError；复制方式失败时清空目标后退回下一种。
+    覆盖已有目标时先生成同目录下的临时文件再替换，不截断目标：目标可能就是源文件或其硬链接。
+    """
+    if overwrite and os.path.lexists(dst_path):
+        if os.path.exists(dst_path) and os.path.samefile(src_path, dst_path):
+            raise FileExistsError(errno.EEXIST, "目标与源文件是同一个文件", dst_path)
+        directory, name = os.path.split(os.path.abspath(dst_path))
+        temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            method = materialize_file(src_path, temp_path, strategy)
+            os.replace(temp_path, dst_path)
+        except BaseException:
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+            raise
+        return method
+    
+    methods = MATERIALIZE_CHAINS.get(strategy, MATERIALIZE_CHAINS['auto'])
+    if methods[0] == 'hardlink':
+        try:
+            os.link(src_path, dst_path)
+            return 'hardlink'
+        except FileExistsError:
+            raise
+        except OSError:
+            # 跨卷或文件系统不支持硬链接
+            methods = methods[1:]
+    
+    binary = getattr(os, 'O_BINARY', 0)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | binary
+    src_fd = os.open(src_path, os.O_RDONLY | binary)
+    dst_fd = None
+    try:
+        size = os.fstat(src_fd).st_size
+        dst_fd = os.open(dst_path, flags, 0o666)
+        for method in methods:
+            try:
+                _MATERIALIZERS[method](src_fd, dst_fd, size)
+                break
+            except OSError:
+                if method == methods[-1]:
+                    raise
+                os.ftruncate(dst_fd, 0)
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+        os.close(dst_fd)
+        dst_fd = None
+        # 与 shutil.copy2 一样保留修改时间和权限
+        shutil.copystat(src_path, dst_path)
+        return method
+    except BaseException:
+        if dst_fd is not None:
+            os.close(dst_fd)
+            os.remove(dst_path)
+        raise
+    finally:
+        os.close(src_fd)
+
+def default_cache_dir():
+    """返回本工具的用户缓存目录"""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, '文本处理器')
+
+class EncodingCache:
+    """持久化的编码检测缓存，以 (设备, inode, 大小, 修改时间) 识别文件
+    
+    同一文件按检测设置（后端、置信度阈值等，见 EncodingDetector.cache_key）分别缓存，
+    更换设置后不会读到旧设置的结果。文件被改写后大小或修改时间发生变化，旧记录自动失效；
+    原子替换产生新 inode 后旧记录不会再命中，条目数超过上限时与其他最久未使用的记录一起淘汰。
+    缓存不可用时所有查询都视为未命中。
+    """
+    MAX_ENTRIES = 500000
+    
+    def __init__(self, db_path=None, max_entries=MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.open_lock = threading.Lock()
+        self.pending_hits = []
+        self.opened = False
+        self._conn = None
+    
+    @property
+    def conn(self):
+        """数据库在首次查询时才打开，不拖慢程序启动"""
+        if not self.opened:
+            with self.open_lock:
+                if not self.opened:
+                    self._conn = self.connect()
+                    self.opened = True
+        return self._conn
+    
+    def connect(self):
+        import sqlite3
+        try:
+            db_path = self.db_path or os.path.join(default_cache_dir(), 'encoding_cache.sqlite3')
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            # 旧版本的表不区分检测设置，直接丢弃
+            conn.execute("DROP TABLE IF EXISTS encodings")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS detections ("
+                "file_id TEXT, detector TEXT, size INTEGER, mtime_ns INTEGER, "
+                "encoding TEXT, confidence REAL, last_used INTEGER, PRIMARY KEY (file_id, detector))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS detections_last_used ON detections(last_used)")
+            self.evict(conn)
+            return conn
+        except (OSError, sqlite3.Error):
+            return None
+    
+    @staticmethod
+    def file_id(st):
+        # Windows 上的 inode 可能超出 SQLite 整数范围，因此以文本保存
+        return f"{st.st_dev}:{st.st_ino}"
+    
+    def get(self, st, detector: str = ""):
+        """返回该检测设置下的 (编码, 置信度)，未缓存或文件已变化时返回 None"""
+        if self.conn is None:
+            return None
+        
+        key = (self.file_id(st), detector)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, encoding, confidence FROM detections WHERE file_id = ? AND detector = ?", key
+            ).fetchone()
+            if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+                return None
+            # 使用时间在 flush 时批量写回
+            self.pending_hits.append(key)
+        return row[2], row[3]
+    
+    def put(self, st, encoding, confidence, detector: str = ""):
+        if self.conn is None:
+            return
+        
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.file_id(st), detector, st.st_size, st.st_mtime_ns, encoding, confidence, int(time.time()))
+            )
+    
+    def flush(self):
+        """写回使用时间并提交"""
+        if self.conn is None:
+            return
+        
+        with self.lock:
+            if self.pending_hits:
+                now = int(time.time())
+                self.conn.executemany(
+                    "UPDATE detections SET last_used = ? WHERE file_id = ? AND detector = ?",
+                    [(now, *key) for key in self.pending_hits]
+                )
+                self.pending_hits.clear()
+            self.conn.commit()
+    
+    def evict(self, conn):
+        """条目超过上限时淘汰最久未使用的记录，一次清理到上限的90%以免频繁触发"""
+        with self.lock:
+            count = conn.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM detections WHERE rowid IN "
+                    "(SELECT rowid FROM detections ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries * 9 // 10,)
+                )
+                conn.commit()
+    
+    def close(self):
+        # 从未使用过的缓存无需打开数据库
+        if not self.opened or self._conn is None:
+            self.opened = True
+            return
+        
+        self.flush()
+        self.evict(self._conn)
+        self._conn.close()
+        self._conn = None
+
+class ConversionManifest:
+    """记录上次转换的输出，增量转换时跳过源文件和输出都没有变化的文件
+    
+    以 (源文件, 目标编码, 输出位置) 为键，保存源文件的大小和修改时间，以及输出文件的
+    大小、修改时间和内容摘要。大小和修改时间都未变时不读取文件；只有修改时间变化时
+    计算摘要比对，内容相同则仍然跳过。源文件有变化时重新写入上次的输出文件，不另起新名称。
+    数据库在首次查询时才打开，不可用时所有文件都视为需要转换。
+    """
+    
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.open_lock = threading.Lock()
+        self.opened = False
+        self._conn = None
+    
+    @property
+    def conn(self):
+        if not self.opened:
+            with self.open_lock:
+                if not self.opened:
+                    self._conn = self.connect()
+                    self.opened = True
+        return self._conn
+    
+    def connect(self):
+        import sqlite3
+        try:
+            db_path = self.db_path or os.path.join(default_cache_dir(), 'conversion_manifest.sqlite3')
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outputs ("
+                "source TEXT, target_encoding TEXT, destination TEXT, "
+                "source_size INTEGER, source_mtime_ns INTEGER, output TEXT, "
+                "output_size INTEGER, output_mtime_ns INTEGER, digest TEXT, updated INTEGER, "
+                "PRIMARY KEY (source, target_encoding, destination))"
+            )
+            return conn
+        except (OSError, sqlite3.Error):
+            return None
+    
+    @staticmethod
+    def key(source_path, target_enc, settings):
+        destination = "" if settings.modify_directly else path_key(os.path.abspath(settings.output_dir))
+        return path_key(os.path.abspath(source_path)), _codec_name(target_enc), destination
+    
+    def lookup(self, source_path, target_enc, settings):
+        if self.conn is None:
+            return None
+        key = self.key(source_path, target_enc, settings)
+        with self.lock:
+            return self.conn.execute(
+                "SELECT source_size, source_mtime_ns, output, output_size, output_mtime_ns, digest FROM outputs "
+                "WHERE source = ? AND target_encoding = ? AND destination = ?", key
+            ).fetchone()
+    
+    def previous_output(self, source_path, target_enc, settings) -> str | None:
+        """上次转换到新文件夹的输出文件仍然存在时返回其路径，否则返回 None"""
+        if settings.modify_directly or (row := self.lookup(source_path, target_enc, settings)) is None:
+            return None
+        output = row[2]
+        return output if os.path.isfile(output) else None
+    
+    def is_current(self, source_path, target_enc, settings) -> str | None:
+        """源文件和上次的输出都没有变化时返回输出路径，否则返回 None"""
+        if (row := self.lookup(source_path, target_enc, settings)) is None:
+            return None
+        
+        source_size, source_mtime_ns, output, output_size, output_mtime_ns, digest = row
+        try:
+            source_st = os.stat(source_path)
+            output_st = source_st if settings.modify_directly else os.stat(output)
+        except OSError:
+            return None
+        if not settings.modify_directly and (source_st.st_size, source_st.st_mtime_ns) != (source_size, source_mtime_ns):
+            return None
+        if output_st.st_size != output_size:
+            return None
+        if output_st.st_mtime_ns != output_mtime_ns:
+            # 只有修改时间变化（如被复制或 touch）时比对内容
+            try:
+                if file_digest(output) != digest:
+                    return None
+            except OSError:
+                return None
+            self.record(source_path, target_enc, settings, output, (output_st.st_size, output_st.st_mtime_ns, digest))
+        return output
+    
+    def record(self, source_path, target_enc, settings, output_path, output_info):
+        """记录一次成功的转换，output_info 为输出文件的 (大小, 修改时间, 摘要)"""
+        if self.conn is None or output_info is None:
+            return
+        try:
+            source_st = os.stat(source_path)
+        except OSError:
+            return
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*self.key(source_path, target_enc, settings), source_st.st_size, source_st.st_mtime_ns,
+                 os.path.abspath(output_path), *output_info, int(time.time()))
+            )
+    
+    def finish(self, runner=None):
+        """提交并关闭数据库，在任务结束时调用"""
+        with self.lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+            self.opened = True
+
+def _chardet_backend(raw_data):
+    import chardet
+    result = chardet.detect(raw_data)
+    return result['encoding'], result['confidence'] or 0.0
+
+def _charset_normalizer_backend(raw_data):
+    import charset_normalizer
+    if (best := charset_normalizer.from_bytes(raw_data).best()) is None:
+        return None, 0.0
+    return best.encoding, 1.0 - best.chaos
+
+class UniversalDetectorBackend:
+    """复用 chardet 的 UniversalDetector 增量检测，检测器已确定结果时提前结束"""
+    FEED_SIZE = 1024
+    
+    def __init__(self):
+        # UniversalDetector 不是线程安全的，每个检测线程各用一个
+        self.local = threading.local()
+    
+    def __call__(self, raw_data):
+        if (detector := getattr(self.local, 'detector', None)) is None:
+            from chardet.universaldetector import UniversalDetector
+            detector = self.local.detector = UniversalDetector()
+        
+        detector.reset()
+        for start in range(0, len(raw_data), self.FEED_SIZE):
+            detector.feed(raw_data[start:start + self.FEED_SIZE])
+            if detector.done:
+                break
+        result = detector.close()
+        return result['encoding'], result['confidence'] or 0.0
+
+# 统计检测后端，均为 backend(raw_data) -> (编码, 置信度)
+DETECTION_BACKENDS = {
+    'chardet': _chardet_backend,
+    'charset-normalizer': _charset_normalizer_backend,
+    'universal': UniversalDetectorBackend(),
+}
+
+def available_detection_backends():
+    """返回当前环境可用的检测后端名称"""
+    names = ['chardet', 'universal']
+    # 只查找模块而不导入，避免启动时加载
+    if importlib.util.find_spec('charset_normalizer') is not None:
+        names.insert(1, 'charset-normalizer')
+    return names
+
+class EncodingDetector:
+    """分级编码检测器
+    
+    依次尝试：缓存 → BOM → 纯ASCII/合法UTF-8快速校验 → 统计检测后端，
+    并记录每一级的命中次数和耗时。
+    
+    大文件从头部、中部、尾部各取一个窗口采样，避免开头的ASCII内容掩盖正文编码；
+    统计检测的置信度低于阈值时窗口逐轮加倍，总采样量不超过 max_sample_size。
+    采样窗口判定为纯ASCII或合法UTF-8时还要确认窗口之外的内容：不超过 FULL_CONFIRM_SIZE
+    的文件逐块校验全文，更大的文件只抽查 CONFIRM_WINDOWS 个均匀分布的窗口，通过时
+    置信度降为 SAMPLED_CONFIDENCE。发现其他编码的内容时在该位置补一个窗口，改用统计检测。
+    """
+    SAMPLE_SIZE = 4096
+    MAX_SAMPLE_SIZE = 1024 * 1024
+    CONFIDENCE_THRESHOLD = 0.8
+    FULL_CONFIRM_SIZE = 8 * 1024 * 1024
+    CONFIRM_WINDOWS = 16
+    SAMPLED_CONFIDENCE = 0.5
+    TIERS = ('cache', 'bom', 'ascii', 'utf-8', 'statistical', 'error')
+    TIER_NAMES = {
+        'cache': "缓存", 'bom': "BOM", 'ascii': "ASCII",
+        'utf-8': "UTF-8校验", 'statistical': "统计检测", 'error': "失败",
+    }
+    BOM_ENCODINGS = [
+        (codecs.BOM_UTF8, 'utf-8-sig'),
+        (codecs.BOM_UTF16_LE, 'utf-16-le'),
+        (codecs.BOM_UTF16_BE, 'utf-16-be')
+    ]
+    
+    def __init__(self, cache=None, backend='chardet', confidence_threshold=CONFIDENCE_THRESHOLD,
+                 max_sample_size=MAX_SAMPLE_SIZE):
+        self.cache = cache
+        self.backend = backend
+        self.confidence_threshold = confidence_threshold
+        self.max_sample_size = max_sample_size
+        self.lock = threading.Lock()
+        self.reset_stats()
+    
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {tier: [0, 0.0] for tier in self.TIERS}
+    
+    def record(self, tier, start):
+        with self.lock:
+            counter = self.stats[tier]
+            counter[0] += 1
+            counter[1] += time.perf_counter() - start
+    
+    def format_stats(self):
+        with self.lock:
+            parts = [f"{self.TIER_NAMES[tier]} {hits} 次/{seconds * 1000:.0f} ms"
+                     for tier, (hits, seconds) in self.stats.items() if hits]
+        return "，".join(parts)
+    
+    def cache_key(self) -> str:
+        """影响检测结果的设置，缓存按此区分；后端可在运行中切换，因此每次检测时生成"""
+        return f"{self.backend}:{self.confidence_threshold}:{self.max_sample_size}"
+    
+    def detect(self, file_path):
+        """返回 (编码, 置信度)，文件无法读取或检测后端出错时编码为 None
+        
+        检测失败不能当作 utf-8：转换会忽略无法解码的字节，把其他编码的文件写成空文件。
+        """
+        start = time.perf_counter()
+        try:
+            # 缓存命中时不再读取文件
+            st = os.stat(file_path)
+            if self.cache and (cached := self.cache.get(st, self.cache_key())):
+                self.record('cache', start)
+                return cached
+            
+            with open(file_path, 'rb') as f:
+                if st.st_size <= self.SAMPLE_SIZE:
+                    tier, encoding, confidence = self.detect_windows([f.read()], True)
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        tier, encoding, confidence = self.detect_adaptive(mm)
+            
+            if self.cache:
+                self.cache.put(st, encoding, confidence, self.cache_key())
+            self.record(tier, start)
+            return encoding, confidence
+        except Exception:
+            self.record('error', start)
+            return None, 0.0
+    
+    def detect_adaptive(self, mm):
+        """对映射的文件逐轮扩大采样窗口，直到结果足够可信"""
+        window = self.SAMPLE_SIZE
+        # 窗口之外第一个不是ASCII/UTF-8的位置，找到后只做统计检测
+        mismatch = None
+        while True:
+            windows = self.read_windows(mm, window)
+            complete = len(windows) == 1
+            if mismatch is not None and not complete:
+                start = max(0, mismatch - window // 2) & ~1
+                windows.append(mm[start:start + window])
+            tier, encoding, confidence = self.detect_windows(windows, complete, mismatch is None)
+            
+            if tier in ('ascii', 'utf-8') and not complete:
+                # 快速校验只看了采样窗口，确认窗口之外的内容后才采信
+                if (mismatch := self.confirm_fast_tier(mm, tier, window)) is None:
+                    if len(mm) > self.FULL_CONFIRM_SIZE:
+                        confidence = min(confidence, self.SAMPLED_CONFIDENCE)
+                    return tier, encoding, confidence
+                continue
+            if (tier != 'statistical' or confidence >= self.confidence_threshold or complete
+                    or window * 6 > self.max_sample_size):
+                return tier, encoding, confidence
+            window *= 2
+    
+    def confirm_fast_tier(self, mm, tier, window):
+        """返回窗口之外第一个不是纯ASCII（tier 为 ascii）或合法UTF-8的偏移，都符合时返回 None
+        
+        大文件只抽查均匀分布的窗口，读取量与文件大小无关。
+        """
+        if len(mm) <= self.FULL_CONFIRM_SIZE:
+            return self.find_mismatch(mm, tier)
+        
+        step = len(mm) // (self.CONFIRM_WINDOWS + 1)
+        for index in range(1, self.CONFIRM_WINDOWS + 1):
+            start = index * step & ~1
+            probe = mm[start:start + window]
+            valid = probe.isascii() if tier == 'ascii' else self.is_valid_utf8(probe, True, False)
+            if not valid or b'\x1b' in probe:
+                # 返回窗口中点，补充的统计检测窗口正好覆盖这段内容
+                return start + window // 2
+        return None
+    
+    @staticmethod
+    def find_mismatch(mm, tier, chunk_size=CONVERT_CHUNK_SIZE):
+        """逐块校验全文是否为纯ASCII（tier 为 ascii）或合法UTF-8，返回第一个不符合的偏移，全部符合时返回 None"""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        pending = 0
+        for start in range(0, len(mm), chunk_size):
+            chunk = mm[start:start + chunk_size]
+            final = start + chunk_size >= len(mm)
+            try:
+                if tier == 'ascii':
+                    # ESC 可能是 ISO-2022 系列编码
+                    if (escape := chunk.find(b'\x1b')) >= 0:
+                        return start + escape
+                    chunk.decode('ascii')
+                else:
+                    decoder.decode(chunk, final=final)
+                    pending = len(decoder.getstate()[0])
+            except UnicodeDecodeError as e:
+                # 增量解码器的错误位置包含上一块末尾未解码的字节
+                return max(0, start - pending + e.start) if tier != 'ascii' else start + e.start
+        return None
+    
+    @staticmethod
+    def read_windows(mm, window):
+        """读取头、中、尾三个窗口，偏移按偶数对齐以免破坏 UTF-16 码元"""
+        file_size = len(mm)
+        if window * 3 >= file_size:
+            return [mm[:]]
+        
+        middle = (file_size - window) // 2 & ~1
+        tail = (file_size - window) & ~1
+        return [mm[:window], mm[middle:middle + window], mm[tail:tail + window]]
+    
+    def detect_windows(self, windows, complete, fast=True):
+        """检测采样窗口的编码，complete 表示唯一的窗口包含文件的全部内容
+        
+        fast 为 False 时跳过ASCII/UTF-8快速校验，直接统计检测。返回 (级别, 编码, 置信度)
+        """
+        # 检测BOM标记
+        for bom, enc in self.BOM_ENCODINGS:
+            if windows[0].startswith(bom):
+                return 'bom', enc, 1.0
+        
+        if not any(windows):
+            return 'ascii', 'utf-8', 0.0
+        
+        # ESC 可能是 ISO-2022 系列编码，交给统计检测
+        if fast and not any(b'\x1b' in window for window in windows):
+            if all(window.isascii() for window in windows):
+                return 'ascii', 'ascii', 1.0
+            if all(self.is_valid_utf8(window, index > 0, complete) for index, window in enumerate(windows)):
+                return 'utf-8', 'utf-8', 0.99
+        
+        backend = DETECTION_BACKENDS.get(self.backend, _chardet_backend)
+        encoding, confidence = backend(b'\n'.join(windows))
+        return 'statistical', encoding or 'utf-8', confidence
+    
+    @staticmethod
+    def is_valid_utf8(window, cut_head, complete):
+        if cut_head:
+            # 窗口从字符中间开始时跳过开头最多3个续字节
+            skip = 0
+            while skip < 3 and skip < len(window) and 0x80 <= window[skip] <= 0xBF:
+                skip += 1
+            window = window[skip:]
+        try:
+            # 窗口末尾被截断的多字节字符不视为错误
+            codecs.getincrementaldecoder('utf-8')().decode(window, final=complete)
+            return True
+        except UnicodeDecodeError:
+            return False
+
+def split_patterns(text):
+    """将以分号或逗号分隔的通配符文本拆分为元组"""
+    return tuple(p.strip() for p in text.replace(',', ';').split(';') if p.strip())
+
+class FolderScanner:
+    """基于 os.scandir 的并行目录扫描器
+    
+    子目录由线程池并行遍历，文件名需匹配 include 中的任一通配符，
+    名称匹配 exclude 的文件和目录被跳过。max_depth 为向下进入的子目录层数，
+    None 表示不限；通过记录已访问目录的 (设备, inode) 防止符号链接循环。
+    """
+    DEFAULT_INCLUDE = ("*.txt",)
+    DEFAULT_EXCLUDE = (".git", "node_modules")
+    BATCH_SIZE = 500
+    # 不足一批时最长等待多久就先交付已找到的文件（秒）
+    BATCH_INTERVAL = 0.1
+    
+    def __init__(self, include=DEFAULT_INCLUDE, exclude=DEFAULT_EXCLUDE, max_depth=None,
+                 workers=4, follow_symlinks=True):
+        self.include = tuple(include) or ("*",)
+        self.exclude = tuple(exclude)
+        self.max_depth = max_depth
+        self.workers = workers
+        self.follow_symlinks = follow_symlinks
+    
+    def is_included(self, name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.include)
+    
+    def is_excluded(self, name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude)
+    
+    def iter_batches(self, root, cancel_event=None):
+        """遍历目录树，按批产出匹配的文件路径列表；同一目录内的文件按名称排序"""
+        results = queue.Queue()
+        visited = set()
+        lock = threading.Lock()
+        outstanding = [0]
+        stop = threading.Event()
+        
+        def mark_visited(path):
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            key = (st.st_dev, st.st_ino) if st.st_ino else os.path.realpath(path)
+            with lock:
+                if key in visited:
+                    return False
+                visited.add(key)
+                outstanding[0] += 1
+                return True
+        
+        def scan_dir(path, depth):
+            files = []
+            try:
+                if stop.is_set():
+                    return
+                subdirs = []
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if self.is_excluded(entry.name):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                                if self.max_depth is None or depth < self.max_depth:
+                                    subdirs.append(entry.path)
+                            elif entry.is_file() and self.is_included(entry.name):
+                                files.append(entry.path)
+                        except OSError:
+                            continue
+                
+                for subdir in sorted(subdirs):
+                    if mark_visited(subdir):
+                        pool.submit(scan_dir, subdir, depth + 1)
+            except OSError:
+                pass
+            finally:
+                files.sort()
+                results.put(files)
+                with lock:
+                    outstanding[0] -= 1
+                    if outstanding[0] == 0:
+                        results.put(None)
+        
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            if not mark_visited(root):
+                return
+            pool.submit(scan_dir, str(root), 0)
+            
+            batch = []
+            last_yield = time.monotonic()
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                try:
+                    files = results.get(timeout=self.BATCH_INTERVAL)
+                except queue.Empty:
+                    files = []
+                if files is None:
+                    break
+                
+                batch.extend(files)
+                now = time.monotonic()
+                if batch and (len(batch) >= self.BATCH_SIZE or now - last_yield >= self.BATCH_INTERVAL):
+                    yield batch
+                    batch = []
+                    last_yield = now
+            
+            if batch:
+                yield batch
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+# 监视文件夹的方式：auto 在 Linux 上优先使用 inotify，不可用时退回轮询
+WATCH_BACKENDS = ("auto", "inotify", "poll")
+
+# inotify 事件掩码，见 inotify(7)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_EXCL_UNLINK = 0x04000000
+_IN_ISDIR = 0x40000000
+_IN_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+                  | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR | _IN_EXCL_UNLINK)
+
+class _Inotify:
+    """通过 ctypes 调用 libc 的 inotify 接口，一个文件描述符上登记所有目录"""
+    EVENT_HEADER = "iIII"
+    READ_SIZE = 256 * 1024
+    
+    def __init__(self):
+        import ctypes
+        import struct
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify 仅在 Linux 上可用")
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.header = struct.Struct(self.EVENT_HEADER)
+        self.get_errno = ctypes.get_errno
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = self.get_errno()
+            raise OSError(err, os.strerror(err))
+    
+    def add_watch(self, path) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), _IN_WATCH_MASK)
+        if wd < 0:
+            err = self.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+    
+    def remove_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+    
+    def read_events(self, timeout):
+        """等待至多 timeout 秒，返回已到达的全部事件 [(wd, mask, 名称)]"""
+        import select
+        events = []
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return events
+        
+        while True:
+            try:
+                data = os.read(self.fd, self.READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = self.header.unpack_from(data, offset)
+                offset += self.header.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, name))
+        return events
+    
+    def close(self):
+        os.close(self.fd)
+
+class FolderWatcher:
+    """监视文件夹，把新出现且已经写完的文件分批交给 on_files(文件路径列表)
+    
+    Linux 上使用 inotify，只处理内核报告的目录项变化；其他平台或 inotify 不可用时
+    定期检查各目录的修改时间，只重新列出有变化的目录，不会反复扫描整棵目录树。
+    事件先合并到待定表，文件在 settle 秒内没有新事件、且前后两次检查的大小和修改时间
+    一致才算写完，因此一次写入产生的大量事件只会让文件被处理一次。
+    
+    只有新建或移入的文件会被交出，已有文件被修改不算新文件；已交出的文件记录在案，
+    原地转换用 os.replace 替换文件时不会再次触发。ignore_dirs 中的文件夹（如输出文件夹）不被监视。
+    on_files 和 on_log(消息, 级别) 在监视线程中调用，应尽快返回。
+    """
+    # 文件最后一次变化后至少等待的秒数
+    SETTLE = 0.5
+    # 轮询方式检查目录的间隔（秒）
+    POLL_INTERVAL = 1.0
+    # inotify 方式等待事件的最长时间，决定 stop() 的响应速度（秒）
+    WAKE_INTERVAL = 0.2
+    # 每次交出的最多文件数
+    MAX_BATCH = 500
+    
+    def __init__(self, roots, on_files, scanner: FolderScanner | None = None, settle: float = SETTLE,
+                 backend: str = "auto", ignore_dirs=(), on_log=None, poll_interval: float = POLL_INTERVAL):
+        if backend not in WATCH_BACKENDS:
+            raise ValueError(f"不支持的监视方式: {backend}")
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.on_files = on_files
+        self.scanner = scanner or FolderScanner()
+        self.settle = settle
+        self.requested_backend = backend
+        # 实际使用的监视方式，启动后确定
+        self.backend = None
+        self.ignore_dirs = tuple(path_key(path) for path in ignore_dirs if path)
+        self.on_log = on_log
+        self.poll_interval = poll_interval
+        for root in self.roots:
+            if self.is_ignored_dir(root):
+                raise ValueError(f"监视的文件夹位于排除的文件夹中: {root}")
+        
+        # 待定文件: 路径键 -> [最后一次事件时间, 大小, 修改时间, 路径]，大小为 None 表示尚未检查
+        self.pending = {}
+        self.next_check = None
+        # 已交出或被忽略的文件键
+        self.seen = set()
+        self.lock = threading.Lock()
+        # 初始目录登记完成后置位，此后新建的文件都会被发现
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_ns = 0
+    
+    def log(self, message, level="info"):
+        if self.on_log:
+            self.on_log(message, level)
+    
+    def is_ignored_dir(self, path):
+        key = path_key(path)
+        return any(key == ignored or key.startswith(ignored + os.sep) for ignored in self.ignore_dirs)
+    
+    def ignore(self, paths):
+        """把文件登记为已处理，之后出现的同名文件事件不会再交出"""
+        with self.lock:
+            for path in paths:
+                key = path_key(path)
+                self.seen.add(key)
+                self.pending.pop(key, None)
+    
+    def start(self):
+        self._stop.clear()
+        self.ready.clear()
+        self._start_ns = time.time_ns()
+        self._thread = threading.Thread(target=self._run, name="FolderWatcher", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def _run(self):
+        try:
+            if self.requested_backend != "poll":
+                try:
+                    inotify = _Inotify()
+                except (OSError, AttributeError) as e:
+                    self.log(f"inotify 不可用，改为轮询: {e}", "warning")
+                else:
+                    try:
+                        if self._run_inotify(inotify):
+                            return
+                    finally:
+                        inotify.close()
+            self._run_poll()
+        except Exception as e:
+            self.log(f"监视文件夹失败: {e}", "error")
+        finally:
+            self.ready.set()
+    
+    def walk(self, path, depth, on_dir, collect):
+        """遍历目录树，on_dir(目录, 层数) 返回 False 时不再进入该目录；collect 为真时返回其中匹配的文件"""
+        files = []
+        visited = set()
+        stack = [(path, depth)]
+        while stack:
+            directory, depth = stack.pop()
+            try:
+                st = os.stat(directory)
+            except OSError:
+                continue
+            # 记录 (设备, inode) 防止符号链接循环
+            key = (st.st_dev, st.st_ino) if st.st_ino else os.path.realpath(directory)
+            if key in visited or self.is_ignored_dir(directory) or not on_dir(directory, depth):
+                continue
+            visited.add(key)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if self.scanner.is_excluded(entry.name):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=self.scanner.follow_symlinks):
+                                if self.scanner.max_depth is None or depth < self.scanner.max_depth:
+                                    stack.append((entry.path, depth + 1))
+                            elif collect and entry.is_file() and self.scanner.is_included(entry.name):
+                                files.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return files
+    
+    def file_created(self, path, now):
+        """新文件出现：加入待定表，已处理过的文件忽略"""
+        key = path_key(path)
+        with self.lock:
+            if key not in self.seen:
+                self.pending[key] = [now, None, None, path]
+                if self.next_check is None:
+                    self.next_check = now + self.settle
+    
+    def file_changed(self, path, now):
+        """待定文件仍在写入，推迟检查"""
+        key = path_key(path)
+        with self.lock:
+            if (entry := self.pending.get(key)) is not None:
+                entry[0] = now
+    
+    def file_removed(self, path):
+        key = path_key(path)
+        with self.lock:
+            self.pending.pop(key, None)
+            self.seen.discard(key)
+    
+    def dispatch_ready(self, now):
+        """检查到期的待定文件，把已经写完的文件分批交出"""
+        if self.next_check is None or now < self.next_check:
+            return
+        
+        ready = []
+        next_check = None
+        with self.lock:
+            for key, entry in list(self.pending.items()):
+                last_event, size, mtime_ns, path = entry
+                due = last_event + self.settle
+                if now < due:
+                    next_check = due if next_check is None else min(next_check, due)
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    del self.pending[key]
+                    continue
+                if (st.st_size, st.st_mtime_ns) == (size, mtime_ns):
+                    del self.pending[key]
+                    self.seen.add(key)
+                    ready.append(path)
+                    continue
+                # 首次检查或仍有变化：记录当前状态，再等待一个周期确认
+                entry[:3] = [now, st.st_size, st.st_mtime_ns]
+                due = now + self.settle
+                next_check = due if next_check is None else min(next_check, due)
+            self.next_check = next_check
+        
+        ready.sort()
+        for start in range(0, len(ready), self.MAX_BATCH):
+            self.on_files(ready[start:start + self.MAX_BATCH])
+    
+    def _run_inotify(self, inotify):
+        self.backend = "inotify"
+        watches = {}
+        
+        def add_dir(directory, depth):
+            try:
+                wd = inotify.add_watch(directory)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    self.log(f"inotify 监视数已达上限，无法监视: {directory}", "warning")
+                return False
+            # 目录在树内移动后 inotify 返回原来的 wd，路径随之更新
+            watches[wd] = (directory, depth)
+            return True
+        
+        for root in self.roots:
+            self.walk(root, 0, add_dir, collect=False)
+        if not watches:
+            self.log("无法用 inotify 监视文件夹，改为轮询", "warning")
+            return False
+        self.log(f"正在监视 {len(watches)} 个文件夹（inotify）")
+        self.ready.set()
+        
+        while not self._stop.is_set():
+            timeout = self.WAKE_INTERVAL
+            if self.next_check is not None:
+                timeout = max(0.0, min(timeout, self.next_check - time.monotonic()))
+            events = inotify.read_events(timeout)
+            now = time.monotonic()
+            
+            for wd, mask, name in events:
+                if mask & _IN_Q_OVERFLOW:
+                    self.log("inotify 事件队列溢出，重新检查所有文件夹", "warning")
+                    for root in self.roots:
+                        self.recover(self.walk(root, 0, add_dir, collect=True), now)
+                    continue
+                if mask & _IN_IGNORED:
+                    watches.pop(wd, None)
+                    continue
+                if wd not in watches:
+                    continue
+                directory, depth = watches[wd]
+                if mask & _IN_DELETE_SELF:
+                    continue
+                if mask & _IN_MOVE_SELF:
+                    # 移出监视范围的目录不再监视；在树内移动的目录已按新位置登记
+                    if not os.path.isdir(directory):
+                        inotify.remove_watch(wd)
+                        watches.pop(wd, None)
+                    continue
+                if not name or self.scanner.is_excluded(name):
+                    continue
+                
+                path = os.path.join(directory, name)
+                if mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO) and (
+                            self.scanner.max_depth is None or depth < self.scanner.max_depth):
+                        # 新目录登记之前其中可能已经写入了文件
+                        for file_path in self.walk(path, depth + 1, add_dir, collect=True):
+                            self.file_created(file_path, now)
+                elif not self.scanner.is_included(name):
+                    continue
+                elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                    self.file_created(path, now)
+                elif mask & (_IN_MODIFY | _IN_CLOSE_WRITE):
+                    self.file_changed(path, now)
+                elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    self.file_removed(path)
+            
+            self.dispatch_ready(now)
+        return True
+    
+    def recover(self, paths, now):
+        """事件丢失后，把监视开始后修改过、尚未处理的文件加入待定表"""
+        for path in paths:
+            key = path_key(path)
+            if key in self.pending or key in self.seen:
+                continue
+            try:
+                if os.stat(path).st_mtime_ns >= self._start_ns:
+                    self.file_created(path, now)
+            except OSError:
+                continue
+    
+    def _run_poll(self):
+        self.backend = "poll"
+        # 目录 -> [修改时间, {名称: 是否为目录}, 层数]
+        dirs = {}
+        
+        def list_dir(directory):
+            names = {}
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if self.scanner.is_excluded(entry.name):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=self.scanner.follow_symlinks):
+                            names[entry.name] = True
+                        elif entry.is_file() and self.scanner.is_included(entry.name):
+                            names[entry.name] = False
+                    except OSError:
+                        continue
+            return names
+        
+        def add_dir(directory, depth):
+            if directory in dirs:
+                return False
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+                dirs[directory] = [mtime_ns, list_dir(directory), depth]
+            except OSError:
+                return False
+            return True
+        
+        def remove_tree(directory):
+            prefix = directory + os.sep
+            for path in [path for path in dirs if path == directory or path.startswith(prefix)]:
+                del dirs[path]
+        
+        for root in self.roots:
+            self.walk(root, 0, add_dir, collect=False)
+        self.log(f"正在监视 {len(dirs)} 个文件夹（轮询）")
+        self.ready.set()
+        
+        next_poll = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= next_poll:
+                next_poll = now + self.poll_interval
+                for directory, state in list(dirs.items()):
+                    if directory not in dirs:
+                        continue
+                    try:
+                        mtime_ns = os.stat(directory).st_mtime_ns
+                        if mtime_ns == state[0]:
+                            continue
+                        names = list_dir(directory)
+                    except OSError:
+                        remove_tree(directory)
+                        continue
+                    
+                    old_names = state[1]
+                    state[0], state[1] = mtime_ns, names
+                    for name, is_dir in names.items():
+                        if old_names.get(name) == is_dir:
+                            continue
+                        path = os.path.join(directory, name)
+                        if not is_dir:
+                            self.file_created(path, now)
+                        elif self.scanner.max_depth is None or state[2] < self.scanner.max_depth:
+                            for file_path in self.walk(path, state[2] + 1, add_dir, collect=True):
+                                self.file_created(file_path, now)
+                    for name, is_dir in old_names.items():
+                        if name not in names:
+                            path = os.path.join(directory, name)
+                            if is_dir:
+                                remove_tree(path)
+                            else:
+                                self.file_removed(path)
+            
+            self.dispatch_ready(now)
+            wait = next_poll - time.monotonic()
+            if self.next_check is not None:
+                wait = min(wait, self.next_check - time.monotonic())
+            self._stop.wait(max(0.0, wait))
+
+# 日志级别及其数值，低于设定级别的日志不显示也不写入文件
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LOG_LEVEL_NAMES = {"debug": "调试", "info": "信息", "warning": "警告", "error": "错误"}
+LOG_FORMATS = ("text", "jsonl")
+
+class LogFile:
+    """追加写入的日志文件，可写为文本或 JSON Lines，超过 max_bytes 时轮转
+    
+    轮转后旧日志依次保存为 .1、.2 …，最多保留 backups 个。
+    文件在第一次写入时才打开，警告和错误立即刷新到磁盘；write_many 一次写入一批日志。
+    """
+    
+    def __init__(self, path: str, fmt: str | None = None, level: str = "info",
+                 max_bytes: int = 10 * 1024 * 1024, backups: int = 3):
+        self.path = path
+        self.format = fmt or ("jsonl" if path.lower().endswith(".jsonl") else "text")
+        if self.format not in LOG_FORMATS:
+            raise ValueError(f"不支持的日志格式: {self.format}")
+        self.threshold = LOG_LEVELS[level]
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.stream = None
+        self.size = 0
+        self.lock = threading.Lock()
+        if self.format == "jsonl":
+            import json
+            self.dumps = json.dumps
+    
+    def format_line(self, message, level, moment):
+        if self.format == "jsonl":
+            return self.dumps({'time': moment, 'level': level, 'message': message}, ensure_ascii=False) + "\n"
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(moment))
+        return f"{stamp} {level.upper():<7} {message}\n"
+    
+    def set_level(self, level: str):
+        self.threshold = LOG_LEVELS[level]
+    
+    def write(self, message: str, level: str = "info", moment: float | None = None):
+        self.write_many([(message, level, time.time() if moment is None else moment)])
+    
+    def write_many(self, records):
+        """写入一批 (消息, 级别, 时间) 日志，低于记录级别的跳过，其中有警告或错误时写完后刷新"""
+        records = [record for record in records if LOG_LEVELS[record[1]] >= self.threshold]
+        if not records:
+            return
+        with self.lock:
+            for message, level, moment in records:
+                line = self.format_line(message, level, moment)
+                size = len(line.encode('utf-8'))
+                if self.stream is None:
+                    self.open()
+                elif self.size and self.size + size > self.max_bytes:
+                    self.rotate()
+                self.stream.write(line)
+                self.size += size
+            if any(LOG_LEVELS[level] >= LOG_LEVELS["warning"] for _, level, _ in records):
+                self.stream.flush()
+    
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.stream = open(self.path, 'a', encoding='utf-8')
+        self.size = self.stream.tell()
+    
+    def rotate(self):
+        self.stream.close()
+        for number in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{number}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{number + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.open()
+    
+    def close(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+def format_duration(seconds):
+    """将秒数格式化为 H:MM:SS"""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}"
+
+class PendingResult:
+    """已提交到进程池、等待按列表顺序收集的文件结果，保留调用参数以便进程池崩溃后重新提交"""
+    __slots__ = ('future', 'on_done', 'started', 'fn', 'args', 'executor')
+    
+    def __init__(self, future, on_done, fn=None, args=(), executor=None):
+        self.future = future
+        self.on_done = on_done
+        self.started = time.perf_counter()
+        self.fn = fn
+        self.args = args
+        self.executor = executor
+    
+    def broken(self) -> bool:
+        """等待完成，返回是否因进程池失效而失败"""
+        return not self.future.cancelled() and isinstance(self.future.exception(), BrokenExecutor)
+    
+    def collect(self):
+        if self.future.cancelled():
+            return False, 0
+        try:
+            result = self.future.result()
+        except Exception as e:
+            # 工作进程异常退出等情况只影响当前文件，返回值格式与 convert_file_worker 相同
+            result = ("failed", 0, str(e), {'timings': {}, 'output': None, 'method': None})
+        return self.on_done(result)
+
+class FileRecord:
+    """文件列表中的一条记录，检测完成前 encoding 为 None、detection 为检测任务"""
+    __slots__ = ('file_id', 'name', 'path', 'encoding', 'detection', 'row')
+    
+    _ids = itertools.count(1)
+    
+    def __init__(self, path):
+        self.file_id = next(self._ids)
+        self.path = path
+        self.name = os.path.basename(path)
+        self.encoding = None
+        self.detection = None
+        self.row = -1
+    
+    def info(self):
+        """返回交给批处理任务的文件信息，检测尚未完成时 encoding 为 None，需要编码的操作通过 detection.result() 等待该文件"""
+        return {
+            'id': self.file_id,
+            'name': self.name,
+            'path': self.path,
+            'encoding': self.encoding if self.detection is None else None,
+            'detection': self.detection
+        }
+
+def path_key(path):
+    """用于比较的路径键，Windows 下不区分大小写"""
+    return os.path.normcase(os.path.abspath(path))
+
+class FileRegistry:
+    """文件记录的集中登记表
+    
+    records 按显示顺序保存记录（行号 → 记录），另以文件ID和完整路径建立索引，
+    同名但位于不同目录的文件互不影响。记录的行号在结构变化后惰性重建一次，
+    之后按ID查询、重命名和更新编码均为 O(1)。
+    """
+    
+    def __init__(self):
+        self.records = []
+        self.by_id = {}
+        self.by_path = {}
+        self.rows_valid = True
+    
+    def __len__(self):
+        return len(self.records)
+    
+    def get(self, file_id):
+        return self.by_id.get(file_id)
+    
+    def find_path(self, path):
+        return self.by_path.get(path_key(path))
+    
+    def create_records(self, paths):
+        """为尚未登记的路径创建记录，已在列表中的文件不会重复添加"""
+        records = []
+        seen = set()
+        for path in paths:
+            key = path_key(path)
+            if key in self.by_path or key in seen:
+                continue
+            seen.add(key)
+            records.append(FileRecord(path))
+        return records
+    
+    def append(self, records):
+        start = len(self.records)
+        for offset, record in enumerate(records):
+            record.row = start + offset
+            self.by_id[record.file_id] = record
+            self.by_path[path_key(record.path)] = record
+        self.records.extend(records)
+    
+    def row_of(self, record):
+        if not self.rows_valid:
+            for row, item in enumerate(self.records):
+                item.row = row
+            self.rows_valid = True
+        return record.row
+    
+    def remove_rows(self, rows):
+        """一次线性遍历移除任意多行，返回被移除的记录"""
+        row_set = set(rows)
+        kept = []
+        removed = []
+        for row, record in enumerate(self.records):
+            (removed if row in row_set else kept).append(record)
+        
+        for record in removed:
+            self.by_id.pop(record.file_id, None)
+            self.by_path.pop(path_key(record.path), None)
+        self.records = kept
+        self.rows_valid = False
+        return removed
+    
+    def shift_rows(self, rows, step):
+        """将选中的行各自上移(step=-1)或下移(step=1)一行，相邻的选中行作为整体移动
+        
+        有选中行已在边界时不做任何移动，返回是否移动
+        """
+        rows = sorted(rows, reverse=step > 0)
+        if not rows or not 0 <= rows[0] + step < len(self.records):
+            return False
+        
+        records = self.records
+        for row in rows:
+            records[row + step], records[row] = records[row], records[row + step]
+        self.rows_valid = False
+        return True
+    
+    def move_rows(self, rows, target):
+        """将一组行按原有顺序整体移动到 target 之前（target 为移动前的行号），返回移动后的行号范围"""
+        row_set = set(rows)
+        moving = [self.records[row] for row in sorted(row_set)]
+        remaining = [record for row, record in enumerate(self.records) if row not in row_set]
+        insert_at = target - sum(1 for row in row_set if row < target)
+        
+        self.records = remaining[:insert_at] + moving + remaining[insert_at:]
+        self.rows_valid = False
+        return range(insert_at, insert_at + len(moving))
+    
+    def rename(self, file_id, new_name, new_path, encoding=None):
+        """更新记录的名称和路径（文件被改写时同时更新编码），返回该记录，记录已移除时返回 None"""
+        if (record := self.by_id.get(file_id)) is None:
+            return None
+        
+        self.by_path.pop(path_key(record.path), None)
+        record.name = new_name
+        record.path = new_path
+        if encoding:
+            record.encoding = encoding
+        self.by_path[path_key(new_path)] = record
+        return record
+    
+    def clear(self):
+        self.records = []
+        self.by_id = {}
+        self.by_path = {}
+        self.rows_valid = True
+
+
+class StageStats:
+    """单个阶段的累计耗时、字节数、次数和耗时分布
+    
+    直方图只能给出分位数所在桶的上界；keep_samples 为 True 时还保留每次的耗时（每个样本 8 字节），
+    分位数按原始样本精确计算，供基准测试、--stats 和图形界面的统计比较较小的性能变化。
+    """
+    # 耗时直方图各桶的上界（毫秒），超过最后一个上界的计入末尾的桶
+    BUCKETS_MS = (0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000, 10000)
+    
+    def __init__(self, keep_samples: bool = False):
+        self.seconds = 0.0
+        self.bytes = 0
+        self.count = 0
+        self.max_seconds = 0.0
+        self.histogram = [0] * (len(self.BUCKETS_MS) + 1)
+        self.samples = array.array('d') if keep_samples else None
+        self._sorted_samples = None
+    
+    def add(self, seconds: float, nbytes: int = 0):
+        self.seconds += seconds
+        self.bytes += nbytes
+        self.count += 1
+        self.max_seconds = max(self.max_seconds, seconds)
+        if self.samples is not None:
+            self.samples.append(seconds)
+        milliseconds = seconds * 1000
+        bucket = next((i for i, bound in enumerate(self.BUCKETS_MS) if milliseconds <= bound), len(self.BUCKETS_MS))
+        self.histogram[bucket] += 1
+    
+    def percentile(self, fraction: float) -> float:
+        """分位数（毫秒）：保留了样本时取第 ⌈fraction × 次数⌉ 小的耗时，否则返回直方图中所在桶的上界"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        if self.samples is not None:
+            if self._sorted_samples is None or len(self._sorted_samples) != len(self.samples):
+                self._sorted_samples = sorted(self.samples)
+            return self._sorted_samples[max(0, math.ceil(rank) - 1)] * 1000
+        seen = 0
+        for bound, count in zip(self.BUCKETS_MS, self.histogram):
+            seen += count
+            if seen >= rank:
+                return min(float(bound), self.max_seconds * 1000)
+        return self.max_seconds * 1000
+    
+    def summary(self) -> dict:
+        return {
+            'seconds': round(self.seconds, 6),
+            'bytes': self.bytes,
+            'count': self.count,
+            'mean_ms': round(self.seconds * 1000 / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.5), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            # exact：按样本计算；bucket_bound：只是分位数所在直方图桶的上界
+            'percentiles': "exact" if self.samples is not None else "bucket_bound",
+            'max_ms': round(self.max_seconds * 1000, 3),
+            'histogram_ms': {f"<={bound}": count for bound, count in zip(self.BUCKETS_MS, self.histogram)}
+                            | {f">{self.BUCKETS_MS[-1]}": self.histogram[-1]},
+        }
+
+class RunStats:
+    """一次批处理各阶段的耗时统计，只在执行任务的线程中更新
+    
+    file 阶段是每个文件从开始处理到收集结果的总耗时，并行时包含排队时间。
+    """
+    STAGES = ("detect", "conflict", "read", "decode", "encode", "write", "file")
+    STAGE_NAMES = {
+        "detect": "编码检测", "conflict": "冲突检查", "read": "读取", "decode": "解码",
+        "encode": "编码", "write": "写入", "file": "单个文件",
+    }
+    
+    def __init__(self, keep_samples: bool = False):
+        self.stages = {stage: StageStats(keep_samples) for stage in self.STAGES}
+        self.start_time = time.perf_counter()
+        self.elapsed = 0.0
+        self.files = 0
+        self.failed = 0
+    
+    def add(self, stage: str, seconds: float, nbytes: int = 0):
+        self.stages[stage].add(seconds, nbytes)
+    
+    def merge(self, timings: dict):
+        """合并 stream_convert_file 记录的 {阶段: [秒数, 字节数]}"""
+        for stage, (seconds, nbytes) in timings.items():
+            self.add(stage, seconds, nbytes)
+    
+    def timed(self, stage: str):
+        """with runner.stats.timed("conflict"): ... 记录代码块耗时"""
+        return _StageTimer(self, stage)
+    
+    def file_done(self, ok: bool, seconds: float, nbytes: int):
+        self.files += 1
+        self.failed += not ok
+        self.add("file", seconds, nbytes)
+    
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.start_time
+    
+    def summary(self) -> dict:
+        return {
+            'elapsed': round(self.elapsed, 6),
+            'files': self.files,
+            'failed': self.failed,
+            'stages': {stage: stats.summary() for stage, stats in self.stages.items() if stats.count},
+        }
+    
+    def format_summary(self) -> str:
+        lines = [f"共 {self.files} 个文件（失败 {self.failed} 个），用时 {self.elapsed:.3f} 秒"]
+        for stage, stats in self.stages.items():
+            if not stats.count:
+                continue
+            # 没有样本时分位数只是桶上界，标为 ≤
+            bound = "" if stats.samples is not None else "≤"
+            line = (f"  {self.STAGE_NAMES[stage]}: {stats.seconds:.3f} 秒，{stats.count} 次，"
+                    f"p50 {bound}{stats.percentile(0.5):.1f} ms，p95 {bound}{stats.percentile(0.95):.1f} ms，"
+                    f"最长 {stats.max_seconds * 1000:.1f} ms")
+            if stats.bytes:
+                line += f"，{stats.bytes / (1024 * 1024):.1f} MB"
+            lines.append(line)
+        return "\n".join(lines)
+    
+    def export_json(self, path: str):
+        import json
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+class _StageTimer:
+    __slots__ = ('stats', 'stage', 'start')
+    
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+    
+    def __exit__(self, *exc_info):
+        self.stats.add(self.stage, time.perf_counter() - self.start)
+
+PROFILE_MODES = ("cprofile", "sample")
+
+class RunProfiler:
+    """可选的批处理性能分析：cprofile 记录执行任务线程的函数调用，结果保存为 pstats 文件；
+    sample 每隔 interval 秒采样一次该线程的调用栈，保存为火焰图工具使用的折叠栈文本。
+    
+    进程池中的转换不在分析范围内，只能看到等待结果的时间。
+    """
+    
+    def __init__(self, mode: str, path: str, interval: float = 0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的分析方式: {mode}")
+        self.mode = mode
+        self.path = path
+        self.interval = interval
+        self.profile = None
+        self.sampler = None
+        self.stacks = collections.Counter()
+        self.stop_event = threading.Event()
+    
+    def start(self):
+        if self.mode == "cprofile":
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            thread_id = threading.get_ident()
+            self.sampler = threading.Thread(target=self.sample, args=(thread_id,), daemon=True)
+            self.sampler.start()
+    
+    def sample(self, thread_id):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+    
+    def stop(self):
+        """停止分析并写入结果文件"""
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.path)
+        elif self.sampler is not None:
+            self.stop_event.set()
+            self.sampler.join()
+            with open(self.path, 'w', encoding='utf-8') as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+class BatchRunner:
+    """逐个处理文件的批处理执行器，支持进程池并行、进度报告和取消
+    
+    task(runner, index, item) 在调用 run() 的线程中执行，返回 (是否成功, 处理字节数)，
+    或返回 runner.submit() 的结果以便在进程池中并行处理耗时部分。
+    日志、文件更新、进度、单个文件的结果和冲突询问都通过回调交给宿主（图形界面或命令行）。
+    """
+    # 进度回调的最小间隔（秒）
+    PROGRESS_INTERVAL = 0.1
+    # 每个工作进程最多排队的文件数，保证取消能及时生效
+    PENDING_PER_WORKER = 4
+    
+    def __init__(self, items, task, workers: int = 1, on_log=None, on_file_updated=None,
+                 on_progress=None, on_result=None, ask_conflict=None, prepare=None, finish=None,
+                 profiler: RunProfiler | None = None, keep_samples: bool = False, keep_executor: bool = False):
+        self.items = items
+        self.task = task
+        self.workers = workers
+        # prepare(runner) 在处理第一个文件前调用，返回 False 时取消任务；finish(runner) 在结束时总会调用
+        self.prepare = prepare
+        self.finish = finish
+        self.executor = None
+        # keep_executor 为 True 时 run() 结束后保留进程池，下次 run() 继续使用，用完后调用 close()
+        self.keep_executor = keep_executor
+        # 已提交到进程池、尚未收集的结果
+        self.pending = collections.deque()
+        # on_log(消息, 级别)，级别见 LOG_LEVELS
+        self.on_log = on_log
+        # on_file_updated(文件ID, 新文件名, 新路径, 新编码)，编码没有改变时新编码为空字符串
+        self.on_file_updated = on_file_updated
+        # on_progress(已完成数, 总数, 文件/秒, MB/秒, 预计剩余秒数)
+        self.on_progress = on_progress
+        # on_result(FileResult)
+        self.on_result = on_result
+        # ask_conflict(文件名) -> (处理方式, 是否应用于所有冲突文件)
+        self.ask_conflict_callback = ask_conflict
+        # 各阶段耗时统计，任务中通过 runner.stats 记录；keep_samples 为 True 时保留每次耗时，分位数精确计算
+        self.keep_samples = keep_samples
+        self.stats = RunStats(keep_samples)
+        self.profiler = profiler
+        self._cancel_event = threading.Event()
+    
+    def load(self, items, task, prepare=None, finish=None):
+        """换成新的一批文件和任务，用于多次 run() 共用同一个进程池"""
+        self.items = items
+        self.task = task
+        self.prepare = prepare
+        self.finish = finish
+    
+    def close(self):
+        """关闭保留的进程池"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+    
+    def cancel(self):
+        """请求取消，当前文件处理完后停止"""
+        self._cancel_event.set()
+    
+    def is_canceled(self) -> bool:
+        return self._cancel_event.is_set()
+    
+    def log(self, message: str, level: str = "info"):
+        if self.on_log:
+            self.on_log(message, level)
+    
+    def file_updated(self, file_id: int, new_name: str, new_path: str, encoding: str = ""):
+        if self.on_file_updated:
+            self.on_file_updated(file_id, new_name, new_path, encoding)
+    
+    def result(self, path: str, status: str, output: str = "", error: str = ""):
+        """报告单个文件的处理结果，status 为 ok / unchanged / skipped / failed"""
+        if self.on_result:
+            self.on_result(FileResult(path, status, output, error))
+    
+    def ask_conflict(self, file_name: str) -> tuple[str, bool]:
+        """询问冲突处理方式，没有可询问的对象时取消"""
+        if self.ask_conflict_callback is None:
+            return "cancel", False
+        return self.ask_conflict_callback(file_name)
+    
+    def submit(self, fn, args, on_done):
+        """执行耗时的文件处理，on_done(fn的返回值) 按列表顺序在任务线程中调用
+        
+        未启用进程池时直接执行；fn 必须是可被子进程导入的模块级函数。
+        """
+        if self.executor is None:
+            return on_done(fn(*args))
+        try:
+            future = self.executor.submit(fn, *args)
+        except BrokenExecutor:
+            # 进程池已经失效：先收集并恢复排队中的文件，再提交到新的进程池
+            broken = self.executor
+            while self.pending:
+                self.collect(self.pending.popleft())
+            self.restart_executor(broken)
+            future = self.executor.submit(fn, *args)
+        return PendingResult(future, on_done, fn, args, self.executor)
+    
+    def start_executor(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # 使用 spawn 避免在带有Qt线程的进程中 fork
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+    
+    def restart_executor(self, broken):
+        """替换已失效的进程池，同一个进程池只替换一次"""
+        if broken is self.executor:
+            self.executor.shutdown(wait=True)
+            self.start_executor()
+    
+    def run(self) -> tuple[int, bool]:
+        """处理所有文件，返回 (成功数, 是否已取消)"""
+        self.success_count = 0
+        self.done_count = 0
+        self.processed_bytes = 0
+        self.start_time = self.last_report = time.monotonic()
+        self.stats = RunStats(self.keep_samples)
+        self.pending = pending = collections.deque()
+        if self.profiler is not None:
+            self.profiler.start()
+        
+        if self.workers > 1 and self.executor is None:
+            self.start_executor()
+        
+        try:
+            if self.prepare is not None and not self.prepare(self):
+                self.cancel()
+            
+            for index, item in enumerate(self.items):
+                if self.is_canceled():
+                    break
+                
+                started = time.perf_counter()
+                try:
+                    result = self.task(self, index, item)
+                except Exception as e:
+                    self.log(f"处理失败: {str(e)}", "error")
+                    result = (False, 0)
+                
+                if not isinstance(result, PendingResult):
+                    self.finish_item(*result, started)
+                    continue
+                
+                result.started = started
+                pending.append(result)
+                # 按列表顺序收集已完成的结果，排队过多时等待最早的文件
+                while pending and (pending[0].future.done() or len(pending) > self.workers * self.PENDING_PER_WORKER):
+                    self.collect(pending.popleft())
+            
+            if self.is_canceled():
+                # 放弃尚未开始的文件，正在处理的文件等待完成
+                for pending_result in pending:
+                    pending_result.future.cancel()
+            while pending:
+                self.collect(pending.popleft())
+        finally:
+            if not self.keep_executor:
+                self.close()
+            if self.finish is not None:
+                self.finish(self)
+            self.stats.stop()
+            if self.profiler is not None:
+                self.profiler.stop()
+        
+        return self.success_count, self.is_canceled()
+    
+    def collect(self, pending_result):
+        if pending_result.executor is not None and pending_result.broken():
+            # 工作进程崩溃（内存不足、编解码器段错误等）会使整个进程池失效，池中未完成的文件一起失败。
+            # 重建进程池后这些文件逐个单独重试，单独执行仍然崩溃的才是出问题的文件
+            self.restart_executor(pending_result.executor)
+            pending_result.executor = self.executor
+            pending_result.future = self.executor.submit(pending_result.fn, *pending_result.args)
+            if pending_result.broken():
+                self.log("工作进程异常退出，已重建进程池", "warning")
+                self.restart_executor(pending_result.executor)
+        self.finish_item(*pending_result.collect(), pending_result.started)
+    
+    def finish_item(self, ok, nbytes, started=None):
+        if started is not None:
+            self.stats.file_done(ok, time.perf_counter() - started, nbytes)
+        self.success_count += ok
+        self.processed_bytes += nbytes
+        self.done_count += 1
+        
+        now = time.monotonic()
+        if now - self.last_report >= self.PROGRESS_INTERVAL or self.done_count == len(self.items):
+            self.last_report = now
+            self.report_progress(self.done_count, len(self.items), self.processed_bytes, now - self.start_time)
+    
+    def report_progress(self, done, total, processed_bytes, elapsed):
+        if not self.on_progress:
+            return
+        elapsed = max(elapsed, 1e-6)
+        files_per_sec = done / elapsed
+        mb_per_sec = processed_bytes / elapsed / (1024 * 1024)
+        eta = (total - done) / files_per_sec if files_per_sec else 0.0
+        self.on_progress(done, total, files_per_sec, mb_per_sec, eta)
+
+@dataclass
+class FileResult:
+    """单个文件的处理结果"""
+    path: str
+    # ok / skipped / failed
+    status: str
+    output: str = ""
+    error: str = ""
+
+@dataclass
+class OutputSettings:
+    """批处理的输出设置：直接修改源文件，或输出到 output_dir"""
+    modify_directly: bool = True
+    output_dir: str = ""
+    # 输出到新文件夹时生成文件的方式，见 MATERIALIZE_CHAINS
+    materialize: str = "auto"
+    # 改写文件后的落盘方式，见 DURABILITY_MODES
+    durability: str = "none"
+
+class OutputNameIndex:
+    """输出文件夹的文件名索引，每个批次只列举一次目录，分配文件名后随之更新
+    
+    重名时沿用 名称_N 的编号规则（名称已以 _数字 结尾时递增该数字），
+    并按 (前缀, 扩展名) 记住下一个候选编号，同名文件再多分配也是均摊 O(1)。
+    分配到的路径以独占方式创建占位文件，其他进程抢先写入同名文件时
+    该名称记入索引并继续尝试下一个编号；finish() 删除最终没有写入的占位文件。
+    """
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.names = None
+        self.next_numbers = {}
+        self.placeholders = set()
+        self.lock = threading.Lock()
+    
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.names = {os.path.normcase(name) for name in os.listdir(self.directory)}
+    
+    def add(self, name: str):
+        with self.lock:
+            if self.names is not None:
+                self.names.add(os.path.normcase(name))
+    
+    def candidates(self, file_name: str):
+        yield file_name
+        
+        stem, ext = os.path.splitext(file_name)
+        name_parts = stem.split('_')
+        if name_parts[-1].isdigit():
+            prefix = stem[:len(stem) - len(name_parts[-1])]
+            number = int(name_parts[-1]) + 1
+        else:
+            prefix = f"{stem}_"
+            number = 1
+        
+        key = (os.path.normcase(prefix), os.path.normcase(ext))
+        number = max(number, self.next_numbers.get(key, number))
+        while True:
+            self.next_numbers[key] = number + 1
+            yield f"{prefix}{number}{ext}"
+            number += 1
+    
+    def allocate(self, file_name: str) -> str:
+        """返回输出文件夹中未被占用的路径，并创建占位文件"""
+        with self.lock:
+            if self.names is None:
+                self.load()
+            
+            for name in self.candidates(file_name):
+                key = os.path.normcase(name)
+                if key in self.names:
+                    continue
+                
+                self.names.add(key)
+                path = os.path.join(self.directory, name)
+                try:
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+                except FileExistsError:
+                    # 其他进程在列举目录后写入了同名文件
+                    continue
+                self.placeholders.add(path)
+                return path
+    
+    def written(self, path: str):
+        """输出文件已写入，占位文件不再需要清理"""
+        with self.lock:
+            self.placeholders.discard(path)
+    
+    def finish(self, runner=None):
+        with self.lock:
+            for path in self.placeholders:
+                try:
+                    if os.path.getsize(path) == 0:
+                        os.remove(path)
+                except OSError:
+                    pass
+            self.placeholders.clear()
+
+def get_output_path(original_path: str, settings: OutputSettings, names: OutputNameIndex) -> str:
+    """返回输出路径，输出到新文件夹时由 names 分配不重名的文件名"""
+    if settings.modify_directly:
+        return original_path
+    return names.allocate(os.path.basename(original_path))
+
+# 文件冲突时可选的处理方式
+CONFLICT_POLICIES = ("skip", "replace", "cancel")
+
+class ConflictResolver:
+    """决定目标文件已存在时的处理方式：replace、skip 或 cancel
+    
+    policy 为固定的处理方式，为 None 时通过 ask(文件名) 询问，
+    选择“应用于所有冲突文件”后本批次的其余冲突不再询问。
+    """
+    
+    def __init__(self, policy: str | None = None):
+        self.policy = policy
+    
+    def decide(self, name: str, ask=None) -> str:
+        if self.policy:
+            return self.policy
+        if ask is None:
+            return "cancel"
+        
+        action, apply_to_all = ask(name)
+        if apply_to_all and action != "cancel":
+            self.policy = action
+        return action
+
+def resolve_encoding(file: dict, detector: EncodingDetector) -> str | None:
+    """返回文件的编码：已知的直接使用，后台检测中的等待结果，检测被取消或尚未提交时当场检测"""
+    encoding = file.get('encoding')
+    if not encoding and (detection := file.get('detection')) is not None:
+        try:
+            encoding = detection.result()
+        except CancelledError:
+            encoding = None
+    return encoding or detector.detect(file['path'])[0]
+
+def make_convert_task(settings: OutputSettings, target_enc: str, names: OutputNameIndex,
+                      source_enc: str | None = None, detector: EncodingDetector | None = None,
+                      cache: EncodingCache | None = None, group: GroupCommit | None = None,
+                      manifest: ConversionManifest | None = None):
+    """返回编码转换任务，source_enc 为 None 时使用文件的检测结果
+    
+    输出文件名由 names 分配，不会与已有文件冲突；任务结束后应调用 names.finish()。
+    settings.durability 为 group 时转换成功的文件交给 group，任务结束后应调用 group.finish()。
+    传入 manifest 时跳过上次已转换且没有变化的文件，任务结束后应调用 manifest.finish()。
+    """
+    if source_enc is None and detector is None:
+        detector = EncodingDetector(cache)
+    
+    def convert_file(runner, index, file):
+        file_name = file['name']
+        file_path = file['path']
+        # 增量转换：源文件和上次的输出都没有变化时不再分配输出名称
+        if manifest is not None:
+            with runner.stats.timed("conflict"):
+                previous_output = manifest.is_current(file_path, target_enc, settings)
+            if previous_output:
+                runner.log(f"未变化，跳过: {file_path}")
+                runner.result(file_path, "unchanged", previous_output)
+                return True, 0
+        
+        if source_enc is not None:
+            file_enc = source_enc
+        else:
+            # 只等待当前文件的后台检测结果，未提交、已取消或检测失败的文件就地检测
+            with runner.stats.timed("detect"):
+                file_enc = resolve_encoding(file, detector)
+            if file_enc is None:
+                runner.log(f"无法检测文件编码，未转换: {file_path}", "error")
+                runner.result(file_path, "failed", error="编码检测失败")
+                return False, 0
+            runner.log(f"检测到文件 {file_name} 的编码: {file_enc}", "debug")
+        
+        # 并行转换时输出文件写入有先后，已分配的名称在索引中立即占用；
+        # 增量转换时已转换过的文件原子地替换上次的输出，不留下过期的副本
+        with runner.stats.timed("conflict"):
+            output_path = manifest and manifest.previous_output(file_path, target_enc, settings)
+            output_path = output_path or get_output_path(file_path, settings, names)
+        
+        def convert_done(result):
+            status, file_size, error, info = result
+            runner.stats.merge(info['timings'])
+            if status == "failed":
+                runner.log(f"转换失败 {file_path}: {error}", "error")
+                runner.result(file_path, "failed", output_path, error)
+                return False, 0
+            if manifest is not None:
+                manifest.record(file_path, target_enc, settings, output_path, info['output'])
+            if status == "unchanged":
+                runner.log(f"内容无需改变，跳过: {file_path}")
+                runner.result(file_path, "unchanged", output_path)
+                return True, file_size
+            
+            if settings.modify_directly:
+                # 原地改写后文件已是目标编码，再次转换时以此为源编码
+                runner.file_updated(file['id'], file_name, output_path, target_enc)
+            else:
+                names.written(output_path)
+            if group is not None:
+                with runner.stats.timed("write"):
+                    group.add(output_path)
+            
+            if info['method'] != "convert":
+                runner.log(f"内容无需重新编码，按字节写出: {file_path}", "debug")
+            runner.log(f"转换成功: {file_path} -> {output_path}")
+            runner.result(file_path, "ok", output_path)
+            return True, file_size
+        
+        return runner.submit(convert_file_worker,
+                             (file_path, output_path, file_enc, target_enc, settings.durability, manifest is not None),
+                             convert_done)
+    
+    return convert_file
+
+# 命名函数：name_func(原文件名, 序号) -> 新文件名，序号为文件在批次中的位置
+# 命名函数接收 (文件名, 序号) 返回新文件名；带 prepare(files) 方法的命名函数
+# 在计算整批名称之前调用一次，用于一次性收集文件元数据
+NameFunc = Callable[[str, int], str]
+
+def replace_rule(find_str: str, replace_str: str) -> NameFunc:
+    if not find_str:
+        raise ValueError("请输入要查找的文本")
+    return lambda file_name, index: file_name.replace(find_str, replace_str)
+
+def affix_rule(prefix: str, suffix: str) -> NameFunc:
+    if not prefix and not suffix:
+        raise ValueError("请至少输入前缀或后缀")
+    
+    def add_affix(file_name, index):
+        stem, ext = os.path.splitext(file_name)
+        return f"{prefix}{stem}{suffix}{ext}"
+    return add_affix
+
+def remove_affix_rule(remove_count: int, remove_prefix: bool = True) -> NameFunc:
+    if remove_count < 1:
+        raise ValueError("删除字符个数必须大于0")
+    
+    def remove_affix(file_name, index):
+        stem, ext = os.path.splitext(file_name)
+        # 文件名长度不足时只保留扩展名
+        if len(stem) <= remove_count:
+            return ext
+        return f"{stem[remove_count:]}{ext}" if remove_prefix else f"{stem[:-remove_count]}{ext}"
+    return remove_affix
+
+def sequence_rule(start_num: int = 1, digits: int = 3, replace_name: bool = False) -> NameFunc:
+    def add_sequence(file_name, index):
+        seq_str = f"{start_num + index:0{digits}d}"
+        stem, ext = os.path.splitext(file_name)
+        # 替换模式完全用序号替换原始名称，追加模式在原始名称后追加序号
+        return f"{seq_str}{ext}" if replace_name else f"{stem}_{seq_str}{ext}"
+    return add_sequence
+
+def compile_pattern(pattern: str, ignore_case: bool = False) -> re.Pattern:
+    if not pattern:
+        raise ValueError("请输入正则表达式")
+    try:
+        return re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+    except re.error as e:
+        raise ValueError(f"正则表达式无效: {e}") from None
+
+def regex_rule(pattern: str, replacement: str, ignore_case: bool = False) -> NameFunc:
+    """正则查找替换，替换文本中可用 \\1、\\g<name> 引用分组"""
+    regex = compile_pattern(pattern, ignore_case)
+    # 对空字符串替换一次，提前发现引用了不存在分组的替换文本
+    try:
+        regex.sub(replacement, "")
+    except re.error as e:
+        raise ValueError(f"替换文本无效: {e}") from None
+    return lambda file_name, index: regex.sub(replacement, file_name)
+
+def stat_files(paths: list[str]) -> list[os.stat_result | None]:
+    """一次性读取整批文件的元数据，无法访问的文件为 None"""
+    results = []
+    for path in paths:
+        try:
+            results.append(os.stat(path))
+        except OSError:
+            results.append(None)
+    return results
+
+class TemplateRule:
+    """按模板生成新文件名，模板在创建时解析一次
+    
+    可用字段：{name} 原文件名、{stem} 不含扩展名的部分、{ext} 扩展名（含点）、
+    {n} 序号、{parent} 所在文件夹名、{mtime} 修改时间、{size} 字节数、
+    {encoding} 检测到的编码。{n:03} 等格式说明同 Python 格式化，
+    {mtime:%Y%m%d} 使用 strftime 格式。指定正则表达式时可用 {1}、{name} 等
+    引用分组，不匹配的文件保持原名。使用 {encoding} 时 prepare 会等待后台检测，
+    尚未检测的文件用 detector 当场检测，因此界面应在后台线程中生成计划。
+    """
+    FIELDS = ("name", "stem", "ext", "n", "parent", "mtime", "size", "encoding")
+    STAT_FIELDS = ("mtime", "size")
+    DEFAULT_TIME_FORMAT = "%Y%m%d"
+    
+    def __init__(self, template: str, pattern: str = "", start: int = 1, ignore_case: bool = False,
+                 detector: EncodingDetector | None = None):
+        if not template:
+            raise ValueError("请输入命名模板")
+        self.regex = compile_pattern(pattern, ignore_case) if pattern else None
+        self.start = start
+        self.detector = detector
+        self.parts = self.parse(template)
+        self.needs_stat = any(field in self.STAT_FIELDS for _, field, _ in self.parts)
+        self.needs_encoding = any(field == "encoding" for _, field, _ in self.parts)
+        self.files = []
+        self.stats = []
+        self.encodings = []
+    
+    def parse(self, template):
+        """返回 [(文字, 字段, 格式说明)]，字段为分组序号时是 int"""
+        try:
+            parsed = list(string.Formatter().parse(template))
+        except ValueError as e:
+            raise ValueError(f"命名模板无效: {e}") from None
+        
+        group_names = self.regex.groupindex if self.regex else {}
+        group_count = self.regex.groups if self.regex else 0
+        parts = []
+        for literal, field, spec, conversion in parsed:
+            if field is None:
+                parts.append((literal, None, ""))
+                continue
+            if conversion or any(char in field for char in ".["):
+                raise ValueError(f"命名模板不支持该写法: {{{field}}}")
+            if field.isdigit():
+                if int(field) > group_count:
+                    raise ValueError(f"命名模板引用了不存在的分组: {{{field}}}")
+                field = int(field)
+            elif field not in group_names and field not in self.FIELDS:
+                raise ValueError(f"未知的模板字段: {{{field}}}")
+            self.check_spec(field, spec)
+            parts.append((literal, field, spec))
+        return parts
+    
+    def check_spec(self, field, spec):
+        if field == "mtime" or not spec:
+            return
+        try:
+            format(0 if field in ("n", "size") else "", spec)
+        except ValueError:
+            raise ValueError(f"格式说明无效: {{{field}:{spec}}}") from None
+    
+    def prepare(self, files: list[dict]):
+        self.files = files
+        self.stats = stat_files([file['path'] for file in files]) if self.needs_stat else []
+        self.encodings = self.detect_encodings(files) if self.needs_encoding else []
+    
+    def detect_encodings(self, files: list[dict]) -> list[str | None]:
+        detector = self.detector or EncodingDetector()
+        return [resolve_encoding(file, detector) for file in files]
+    
+    def field_value(self, field, spec, file_name, index, match):
+        if isinstance(field, int) or (match and field in match.re.groupindex):
+            return format(match.group(field) or "", spec)
+        if field == "name":
+            return format(file_name, spec)
+        if field in ("stem", "ext"):
+            return format(os.path.splitext(file_name)[field == "ext"], spec)
+        if field == "n":
+            return format(self.start + index, spec)
+        
+        file = self.files[index]
+        if field == "parent":
+            return format(os.path.basename(os.path.dirname(os.path.abspath(file['path']))), spec)
+        if field == "encoding":
+            return format(self.encodings[index] or "unknown", spec)
+        
+        stat = self.stats[index]
+        if stat is None:
+            raise ValueError(f"无法读取文件信息: {file['path']}")
+        if field == "size":
+            return format(stat.st_size, spec)
+        return time.strftime(spec or self.DEFAULT_TIME_FORMAT, time.localtime(stat.st_mtime))
+    
+    def __call__(self, file_name: str, index: int) -> str:
+        match = None
+        if self.regex and not (match := self.regex.search(file_name)):
+            return file_name
+        
+        new_name = "".join(
+            literal + (self.field_value(field, spec, file_name, index, match) if field is not None else "")
+            for literal, field, spec in self.parts
+        )
+        if not new_name or "/" in new_name or os.sep in new_name:
+            raise ValueError(f"模板生成的文件名无效: {file_name} → {new_name}")
+        return new_name
+
+def template_rule(template: str, pattern: str = "", start: int = 1, ignore_case: bool = False,
+                  detector: EncodingDetector | None = None) -> NameFunc:
+    return TemplateRule(template, pattern, start, ignore_case, detector)
+
+class RulePipeline:
+    """把多条命名规则串联为一个命名函数，前一条规则的结果作为后一条的输入"""
+    
+    def __init__(self, rules: list[NameFunc]):
+        if not rules:
+            raise ValueError("请至少指定一条重命名规则")
+        self.rules = list(rules)
+    
+    def prepare(self, files: list[dict]):
+        for rule in self.rules:
+            if prepare := getattr(rule, 'prepare', None):
+                prepare(files)
+    
+    def __call__(self, file_name: str, index: int) -> str:
+        for rule in self.rules:
+            file_name = rule(file_name, index)
+        return file_name
+
+def chain_rules(rules: list[NameFunc]) -> NameFunc:
+    return rules[0] if len(rules) == 1 else RulePipeline(rules)
+
+@dataclass
+class RenameChange:
+    """重命名计划中的一项，file 为 FileRecord.info() 返回的文件信息"""
+    file: dict
+    new_name: str
+    
+    @property
+    def old_name(self) -> str:
+        return self.file['name']
+
+def build_rename_plan(files: list[dict], name_func: NameFunc) -> list[RenameChange]:
+    """按文件顺序计算每个文件的新名称"""
+    if prepare := getattr(name_func, 'prepare', None):
+        prepare(files)
+    return [RenameChange(file, name_func(file['name'], index)) for index, file in enumerate(files)]
+
+class RenamePlan:
+    """只计算一次的重命名计划，预览和执行共用同一份新名称和目标路径
+    
+    statuses() 按磁盘当前状态标记每一项，供预览显示冲突；执行时 RenameTransaction
+    直接使用 changes 和 targets，不再重新计算名称。
+    """
+    # 预览中每一项的状态
+    STATUS_NAMES = {'ok': "", 'unchanged': "未改变", 'exists': "目标已存在", 'duplicate': "重名"}
+    PROBLEM_STATUSES = ('exists', 'duplicate')
+    
+    def __init__(self, files: list[dict], name_func: NameFunc, settings: OutputSettings):
+        self.settings = settings
+        self.changes = build_rename_plan(files, name_func)
+        self.targets = [self.target_path(change) for change in self.changes]
+        self._keys = None
+        self._statuses = None
+    
+    def __len__(self):
+        return len(self.changes)
+    
+    def target_path(self, change: RenameChange) -> str:
+        if self.settings.modify_directly:
+            return os.path.join(os.path.dirname(change.file['path']), change.new_name)
+        return os.path.join(self.settings.output_dir, change.new_name)
+    
+    def keys(self) -> tuple[list[str], list[str]]:
+        """返回 (源路径键列表, 目标路径键列表)，只计算一次"""
+        if self._keys is None:
+            self._keys = ([path_key(change.file['path']) for change in self.changes],
+                          [path_key(target) for target in self.targets])
+        return self._keys
+    
+    def is_noop(self, index: int) -> bool:
+        return self.settings.modify_directly and self.targets[index] == self.changes[index].file['path']
+    
+    def statuses(self) -> list[str]:
+        """标记每一项的状态，每个目录只列举一次"""
+        if self._statuses is not None:
+            return self._statuses
+        
+        source_keys, target_keys = self.keys()
+        existing = list_directories({os.path.dirname(target) or '.' for target in self.targets})
+        noop = [self.is_noop(index) for index in range(len(self.changes))]
+        # 直接修改模式下改名的源文件会让出原来的名称
+        if self.settings.modify_directly:
+            existing -= {key for key, unchanged in zip(source_keys, noop) if not unchanged}
+        wanted = collections.Counter(key for key, unchanged in zip(target_keys, noop) if not unchanged)
+        
+        self._statuses = [
+            'unchanged' if unchanged else
+            'duplicate' if wanted[key] > 1 else
+            'exists' if key in existing else 'ok'
+            for key, unchanged in zip(target_keys, noop)
+        ]
+        return self._statuses
+    
+    def problem_count(self) -> int:
+        return sum(status in self.PROBLEM_STATUSES for status in self.statuses())
+
+def materialize_renamed(runner, change: RenameChange, target: str, strategy: str, overwrite: bool = False) -> bool:
+    """输出到新文件夹模式：直接以新名称生成文件，源文件保持不变"""
+    file_name = change.old_name
+    file_path = change.file['path']
+    try:
+        # 目标已是源文件本身或其硬链接时内容已经就位，覆盖反而会破坏源文件
+        if os.path.exists(target) and os.path.samefile(file_path, target):
+            runner.log(f"目标即源文件，无需生成: {target}")
+            runner.result(file_path, "unchanged", target)
+            return True
+        method = materialize_file(file_path, target, strategy, overwrite)
+        
+        # 在输出到新文件夹模式下，不更新文件列表中的文件路径
+        # 只记录操作日志
+        runner.log(f"复制并重命名: {file_name} -> {change.new_name} (输出到: {target}，{MATERIALIZE_NAMES[method]})")
+        runner.log(f"重命名成功: {file_name} -> {change.new_name}")
+        runner.result(file_path, "ok", target)
+        return True
+    except Exception as e:
+        runner.log(f"重命名失败 {file_path}: {str(e)}", "error")
+        runner.result(file_path, "failed", error=str(e))
+        return False
+
+def list_directories(directories) -> set[str]:
+    """每个目录只列举一次，返回其中已有文件的路径键集合"""
+    existing = set()
+    for directory in directories:
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        prefix = os.path.join(os.path.abspath(directory), '')
+        existing.update(os.path.normcase(prefix + name) for name in names)
+    return existing
+
+class RenameTransaction:
+    """事务式执行一批重命名
+    
+    prepare() 先算出完整的 源路径 → 目标路径 映射，每个目录只列举一次并保存在内存中，
+    冲突检查只是集合查询；所有冲突都在改动任何文件之前确定，选择取消时不会修改文件。
+    直接修改模式下，名称会被本批次其他文件占用的源文件先改为同目录下的临时名称，
+    execute() 再逐个改为最终名称，因此互换（a→b、b→a）、轮换和链式重命名
+    既不会误报冲突，也不会覆盖文件。
+    
+    prepare、execute、finish 分别作为 BatchRunner 的准备、任务和收尾回调。
+    """
+    
+    def __init__(self, plan: RenamePlan, resolver: ConflictResolver):
+        self.plan = plan
+        self.changes = plan.changes
+        self.settings = plan.settings
+        self.targets = plan.targets
+        self.resolver = resolver
+        # 每一项的处理方式：rename / replace / skip / noop / failed
+        self.actions = []
+        self.errors = {}
+        # 序号 → 临时路径
+        self.staged = {}
+        # 暂存失败、仍被占用的源文件路径键
+        self.blocked = set()
+    
+    def prepare(self, runner) -> bool:
+        """确定每一项的处理方式并暂存需要让出名称的源文件，返回 False 表示已取消"""
+        modify_directly = self.settings.modify_directly
+        source_keys, target_keys = self.plan.keys()
+        if not modify_directly:
+            os.makedirs(self.settings.output_dir, exist_ok=True)
+        # 预览之后磁盘可能已经变化，执行前重新列举目录
+        with runner.stats.timed("conflict"):
+            existing = list_directories({os.path.dirname(target) or '.' for target in self.targets})
+        
+        self.actions = ["noop" if self.plan.is_noop(index) else "rename" for index in range(len(self.changes))]
+        # 直接修改模式下改名的源文件会让出原来的名称，其余已有文件保持占用
+        moving = {key for key, action in zip(source_keys, self.actions) if action == "rename"} \
+            if modify_directly else set()
+        staying = existing - moving
+        by_target = collections.defaultdict(list)
+        for index, key in enumerate(target_keys):
+            by_target[key].append(index)
+        
+        claimed = set()
+        pending = collections.deque(index for index, action in enumerate(self.actions) if action == "rename")
+        while pending:
+            index = pending.popleft()
+            if self.actions[index] != "rename":
+                continue
+            
+            key = target_keys[index]
+            # 目标被保留的文件或本批次前面的文件占用
+            if key in staying or key in claimed:
+                action = self.resolver.decide(self.changes[index].new_name, runner.ask_conflict)
+                if action == "cancel":
+                    return False
+                if action == "skip":
+                    self.actions[index] = "skip"
+                    if modify_directly:
+                        # 跳过的文件保留原名，以该名称为目标的文件随之冲突
+                        staying.add(source_keys[index])
+                        pending.extend(other for other in by_target.get(source_keys[index], ())
+                                       if self.actions[other] == "rename")
+                    continue
+                self.actions[index] = "replace"
+            claimed.add(key)
+        
+        if modify_directly:
+            with runner.stats.timed("write"):
+                self.stage(source_keys, target_keys)
+        return True
+    
+    def stage(self, source_keys, target_keys):
+        """将名称会被本批次其他文件占用的源文件改为临时名称"""
+        wanted = collections.Counter(key for key, action in zip(target_keys, self.actions)
+                                     if action in ("rename", "replace"))
+        for index, action in enumerate(self.actions):
+            if action not in ("rename", "replace"):
+                continue
+            
+            key = source_keys[index]
+            # 只改变大小写的重命名占用的是自身名称，可以直接改名
+            if wanted[key] - (target_keys[index] == key) <= 0:
+                continue
+            
+            path = self.changes[index].file['path']
+            directory, name = os.path.split(path)
+            temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.renaming")
+            try:
+                os.rename(path, temp_path)
+                self.staged[index] = temp_path
+            except OSError as e:
+                self.actions[index] = "failed"
+                self.errors[index] = str(e)
+                # 源文件已不存在时名称本就空闲
+                if not isinstance(e, FileNotFoundError):
+                    self.blocked.add(key)
+    
+    def execute(self, runner, index, change):
+        action = self.actions[index]
+        file_path = change.file['path']
+        if action == "skip":
+            runner.log(f"跳过文件: {change.old_name}", "warning")
+            runner.result(file_path, "skipped")
+            return False, 0
+        if action == "failed":
+            runner.log(f"重命名失败 {file_path}: {self.errors[index]}", "error")
+            runner.result(file_path, "failed", error=self.errors[index])
+            return False, 0
+        
+        if not self.settings.modify_directly:
+            # 输出到新文件夹模式需要复制文件内容，计入吞吐量
+            nbytes = os.path.getsize(file_path)
+            ok = materialize_renamed(runner, change, self.targets[index], self.settings.materialize,
+                                     action == "replace")
+            return ok, nbytes if ok else 0
+        return self.commit(runner, index), 0
+    
+    def commit(self, runner, index) -> bool:
+        """将文件（或其临时文件）改为最终名称，失败时尽量恢复原名"""
+        change = self.changes[index]
+        file = change.file
+        source = self.staged.pop(index, file['path'])
+        target = self.targets[index]
+        try:
+            if self.actions[index] == "replace":
+                os.replace(source, target)
+            elif path_key(target) in self.blocked:
+                raise FileExistsError(f"目标文件仍被占用: {target}")
+            elif self.actions[index] == "rename":
+                os.rename(source, target)
+        except OSError as e:
+            if source != file['path']:
+                try:
+                    # 原名可能已被本批次其他文件占用，不能覆盖
+                    if os.path.lexists(file['path']):
+                        raise FileExistsError(file['path'])
+                    os.rename(source, file['path'])
+                except OSError:
+                    runner.log(f"无法恢复文件名，文件保留为: {source}", "error")
+            runner.log(f"重命名失败 {file['path']}: {str(e)}", "error")
+            runner.result(file['path'], "failed", error=str(e))
+            return False
+        
+        runner.file_updated(file['id'], change.new_name, target)
+        runner.log(f"重命名成功: {change.old_name} -> {change.new_name}")
+        runner.result(file['path'], "ok", target)
+        return True
+    
+    def finish(self, runner):
+        """任务取消时已改为临时名称的文件继续完成重命名，避免留下临时文件"""
+        for index in list(self.staged):
+            self.commit(runner, index)
+
+def get_export_path(export_filename: str, settings: OutputSettings) -> str:
+    if settings.modify_directly:
+        return export_filename
+    
+    os.makedirs(settings.output_dir, exist_ok=True)
+    return os.path.join(settings.output_dir, export_filename)
+
+def write_name_export(file_names: list[str], export_path: str, export_enc: str) -> str:
+    """以逗号分隔写出文件名，返回实际使用的编码
+    
+    先写入同一目录下的临时文件再替换，覆盖已有文件时不会留下写了一半的内容。
+    """
+    content = ','.join(file_names)
+    directory, name = os.path.split(os.path.abspath(export_path))
+    temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    
+    try:
+        if export_enc.startswith('utf-16'):
+            with open(temp_path, 'xb') as f:
+                if export_enc == 'utf-16-be':
+                    f.write(codecs.BOM_UTF16_BE)
+                elif export_enc in ['utf-16-le', 'utf-16']:
+                    f.write(codecs.BOM_UTF16_LE)
+                    if export_enc == 'utf-16':
+                        export_enc = 'utf-16-le'
+                
+                f.write(content.encode(export_enc))
+        else:
+            with open(temp_path, 'x', encoding=export_enc) as f:
+                f.write(content)
+        os.replace(temp_path, export_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return export_enc
+
+def make_export_task(file_names: list[str], export_enc: str, resolver: ConflictResolver,
+                     errors: list[str] | None = None):
+    """返回导出文件名的任务，任务的唯一一项为导出路径"""
+    
+    def write_export(runner, index, export_path):
+        # 检查文件冲突
+        if os.path.exists(export_path) and \
+                resolver.decide(os.path.basename(export_path), runner.ask_conflict) != "replace":
+            runner.log("导出操作已取消", "warning")
+            runner.result(export_path, "skipped", export_path)
+            runner.cancel()
+            return False, 0
+        
+        try:
+            enc = write_name_export(file_names, export_path, export_enc)
+            runner.log(f"文件名已导出到: {export_path} (编码: {enc})")
+            runner.result(export_path, "ok", export_path)
+            return True, os.path.getsize(export_path)
+        except Exception as e:
+            if errors is not None:
+                errors.append(str(e))
+            runner.log(f"导出失败: {str(e)}", "error")
+            runner.result(export_path, "failed", export_path, str(e))
+            return False, 0
+    
+    return write_export
+
+def collect_files(paths: list[str], scanner: FolderScanner, log=None) -> list[FileRecord]:
+    """将命令行给出的文件和文件夹展开为文件记录，文件夹按扫描规则遍历，重复的文件只保留一个"""
+    registry = FileRegistry()
+    for path in paths:
+        if os.path.isfile(path):
+            registry.append(registry.create_records([path]))
+        elif os.path.isdir(path):
+            for batch in scanner.iter_batches(path):
+                registry.append(registry.create_records(batch))
+        elif log:
+            log(f"路径不存在: {path}", "warning")
+    return registry.records
+
+def build_cli_parser() -> argparse.ArgumentParser:
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="文本处理核心.py", description="批量重命名、转换文本编码和导出文件名（无界面）"
+    )
+    
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("paths", nargs="+", help="要处理的文件或文件夹")
+    common.add_argument("--output-dir", help="输出到该文件夹，不指定时直接修改源文件")
+    common.add_argument("--on-conflict", choices=CONFLICT_POLICIES, default="skip",
+                        help="目标文件已存在时的处理方式（默认 skip）")
+    common.add_argument("--include", default=";".join(FolderScanner.DEFAULT_INCLUDE),
+                        help="扫描文件夹时包含的文件，以分号分隔的通配符")
+    common.add_argument("--exclude", default=";".join(FolderScanner.DEFAULT_EXCLUDE),
+                        help="扫描文件夹时排除的文件和文件夹")
+    common.add_argument("--max-depth", type=int, help="向下扫描的子文件夹层数，不指定时不限")
+    common.add_argument("--json", action="store_true", help="以JSON输出结果，日志写入标准错误")
+    common.add_argument("--log-level", choices=list(LOG_LEVELS), default="info", help="显示和记录的最低日志级别")
+    common.add_argument("--log-file", help="同时把日志写入该文件，超过 10MB 时轮转")
+    common.add_argument("--log-format", choices=LOG_FORMATS,
+                        help="日志文件格式，不指定时 .jsonl 文件为 jsonl，其余为 text")
+    common.add_argument("--stats", metavar="文件", help="把各阶段耗时统计以JSON写入该文件")
+    common.add_argument("--profile", choices=PROFILE_MODES, help="分析执行任务线程的性能")
+    common.add_argument("--profile-output", metavar="文件",
+                        help="性能分析结果文件，默认为 profile.prof（cprofile）或 profile.folded（sample）")
+    
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    # convert 和 watch 共用的转换参数
+    convert = argparse.ArgumentParser(add_help=False)
+    convert.add_argument("--to", required=True, dest="target_encoding", help="目标编码")
+    convert.add_argument("--from", dest="source_encoding", help="源编码，不指定时自动检测")
+    convert.add_argument("--backend", choices=list(DETECTION_BACKENDS), default="chardet", help="编码检测引擎")
+    convert.add_argument("--workers", type=int, default=1, help="并行进程数")
+    convert.add_argument("--no-cache", action="store_true", help="不使用编码检测缓存")
+    convert.add_argument("--incremental", action="store_true",
+                         help="增量转换：跳过上次已转换且源文件和输出都没有变化的文件")
+    convert.add_argument("--manifest", help="增量转换记录的数据库文件，默认保存在用户缓存目录")
+    convert.add_argument("--durability", choices=DURABILITY_MODES, default="none",
+                         help="落盘方式：none 交给系统缓存，fsync 逐个文件同步，group 分组同步目录")
+    convert.add_argument("--group-files", type=int, default=GroupCommit.MAX_FILES, help="分组落盘时每组的文件数")
+    convert.add_argument("--group-ms", type=int, default=int(GroupCommit.MAX_DELAY * 1000),
+                         help="分组落盘时每组的最长间隔（毫秒）")
+    commands.add_parser("convert", parents=[common, convert], help="转换文本编码")
+    
+    watch = commands.add_parser("watch", parents=[common, convert],
+                                help="监视文件夹，转换其中新出现的文件，按 Ctrl+C 停止")
+    watch.add_argument("--settle", type=float, default=FolderWatcher.SETTLE,
+                       help="文件最后一次变化后等待多少秒才转换")
+    watch.add_argument("--watch-backend", choices=WATCH_BACKENDS, default="auto",
+                       help="监视方式：auto 在 Linux 上使用 inotify，其他情况轮询")
+    watch.add_argument("--poll-interval", type=float, default=FolderWatcher.POLL_INTERVAL, help="轮询间隔（秒）")
+    watch.add_argument("--initial", action="store_true", help="开始监视时先转换文件夹中已有的文件")
+    
+    class AppendRule(argparse.Action):
+        """按命令行中出现的顺序记录重命名规则"""
+        def __call__(self, parser, namespace, values, option_string=None):
+            rules = list(getattr(namespace, self.dest) or [])
+            rules.append((self.const, values))
+            setattr(namespace, self.dest, rules)
+    
+    rename = commands.add_parser("rename", parents=[common], help="批量重命名，多条规则按出现顺序依次应用")
+    rule_options = [
+        ("--replace", "replace", dict(nargs=2, metavar=("查找", "替换为"), help="关键字替换")),
+        ("--regex", "regex", dict(nargs=2, metavar=("正则", "替换为"), help="正则查找替换，替换文本可用 \\1 引用分组")),
+        ("--template", "template", dict(metavar="模板",
+                                        help="按模板命名，如 {stem}_{n:03}{ext}、{parent}_{mtime:%%Y%%m%%d}{ext}")),
+        ("--affix", "affix", dict(nargs=2, metavar=("前缀", "后缀"), help="添加前缀/后缀，不需要的一项传空字符串")),
+        ("--remove-prefix", "remove_prefix", dict(type=int, metavar="字符数", help="删除前缀字符")),
+        ("--remove-suffix", "remove_suffix", dict(type=int, metavar="字符数", help="删除后缀字符")),
+        ("--sequence", "sequence", dict(type=int, metavar="起始序号", help="序号重命名")),
+    ]
+    for option, kind, options in rule_options:
+        rename.add_argument(option, dest="rules", action=AppendRule, const=kind, **options)
+    rename.add_argument("--match", default="", metavar="正则",
+                        help="--template 只处理匹配的文件，模板中可用 {1}、{名称} 引用分组")
+    rename.add_argument("--ignore-case", action="store_true", help="正则匹配时忽略大小写")
+    rename.add_argument("--start", type=int, default=1, help="模板中 {n} 的起始值")
+    rename.add_argument("--digits", type=int, default=3, help="序号位数")
+    rename.add_argument("--sequence-mode", choices=("append", "replace"), default="append",
+                        help="追加序号或替换名称")
+    rename.add_argument("--materialize", choices=list(MATERIALIZE_CHAINS), default="auto",
+                        help="输出到新文件夹时生成文件的方式，不支持时自动退回普通复制")
+    rename.add_argument("--dry-run", action="store_true", help="只输出重命名计划，不修改文件")
+    
+    export = commands.add_parser("export", parents=[common], help="导出文件名")
+    export.add_argument("--name", default="page.txt", help="导出文件名")
+    export.add_argument("--encoding", default="utf-8", help="导出编码")
+    
+    return parser
+
+def rename_rule_from_args(args) -> NameFunc:
+    """把命令行中的重命名规则按顺序串联为一个命名函数，每条规则只编译一次"""
+    rules = []
+    for kind, value in args.rules or []:
+        if kind == "replace":
+            rules.append(replace_rule(*value))
+        elif kind == "regex":
+            rules.append(regex_rule(*value, args.ignore_case))
+        elif kind == "template":
+            rules.append(template_rule(value, args.match, args.start, args.ignore_case))
+        elif kind == "affix":
+            rules.append(affix_rule(*value))
+        elif kind in ("remove_prefix", "remove_suffix"):
+            rules.append(remove_affix_rule(value, kind == "remove_prefix"))
+        else:
+            rules.append(sequence_rule(value, args.digits, args.sequence_mode == "replace"))
+    return chain_rules(rules)
+
+def convert_task_from_args(args, settings: OutputSettings, cache: EncodingCache | None):
+    """按命令行参数创建编码转换任务及其收尾钩子，convert 和 watch 共用"""
+    detector = EncodingDetector(cache, args.backend)
+    names = OutputNameIndex(settings.output_dir)
+    group = GroupCommit(args.group_files, args.group_ms / 1000) if settings.durability == "group" else None
+    manifest = ConversionManifest(args.manifest) if args.incremental or args.manifest else None
+    task = make_convert_task(settings, args.target_encoding, names, args.source_encoding,
+                             detector, cache, group, manifest)
+    return task, {'finish': chain_finish(group and group.finish, names.finish, manifest and manifest.finish)}
+
+def cli_main(argv: list[str] | None = None) -> int:
+    """命令行入口，返回退出码：0 全部成功，1 有文件失败或跳过，2 参数错误，3 已取消"""
+    args = build_cli_parser().parse_args(argv)
+    # JSON 输出时标准输出只保留结果
+    log_stream = sys.stderr if args.json else sys.stdout
+    log_threshold = LOG_LEVELS[args.log_level]
+    log_file = LogFile(args.log_file, args.log_format, args.log_level) if args.log_file else None
+    
+    def log(message, level="info"):
+        if log_file:
+            log_file.write(message, level)
+        if LOG_LEVELS[level] >= log_threshold:
+            print(message, file=log_stream, flush=True)
+    
+    try:
+        return run_cli_command(args, log)
+    finally:
+        if log_file:
+            log_file.close()
+
+def run_cli_command(args, log) -> int:
+    import json
+    settings = OutputSettings(args.output_dir is None, args.output_dir or "",
+                              getattr(args, 'materialize', "auto"), getattr(args, 'durability', "none"))
+    scanner = FolderScanner(
+        include=split_patterns(args.include),
+        exclude=split_patterns(args.exclude),
+        max_depth=args.max_depth
+    )
+    if args.command == "watch":
+        return run_watch_command(args, settings, scanner, log)
+    
+    records = collect_files(args.paths, scanner, log)
+    if not records:
+        log("文件列表为空", "warning")
+        return 2
+    
+    files = [record.info() for record in records]
+    resolver = ConflictResolver(args.on_conflict)
+    cache = None
+    hooks = {}
+    summary = {'command': args.command}
+    
+    try:
+        if args.command == "convert":
+            if args.source_encoding is None and not args.no_cache:
+                cache = EncodingCache()
+            items = files
+            task, hooks = convert_task_from_args(args, settings, cache)
+            workers = max(1, args.workers)
+            done_message = "编码转换完成，成功 {} 个文件"
+        elif args.command == "rename":
+            try:
+                plan = RenamePlan(files, rename_rule_from_args(args), settings)
+            except ValueError as e:
+                log(str(e), "error")
+                return 2
+            
+            if args.dry_run:
+                changes = [{'path': change.file['path'], 'old_name': change.old_name, 'new_name': change.new_name,
+                            'target': target, 'status': status}
+                           for change, target, status in zip(plan.changes, plan.targets, plan.statuses())]
+                if args.json:
+                    print(json.dumps({**summary, 'dry_run': True, 'changes': changes}, ensure_ascii=False, indent=2))
+                else:
+                    for change, status in zip(plan.changes, plan.statuses()):
+                        marker = f"  [{RenamePlan.STATUS_NAMES[status]}]" if status != 'ok' else ""
+                        print(f"{change.old_name} → {change.new_name}{marker}")
+                return 0
+            
+            transaction = RenameTransaction(plan, resolver)
+            items = plan.changes
+            task = transaction.execute
+            hooks = {'prepare': transaction.prepare, 'finish': transaction.finish}
+            workers = 1
+            done_message = "重命名完成，成功 {} 个文件"
+        else:
+            items = [get_export_path(args.name, settings)]
+            task = make_export_task([file['name'] for file in files], args.encoding, resolver)
+            workers = 1
+            done_message = "文件名导出完成，成功 {} 个文件"
+        
+        profiler = None
+        if args.profile:
+            default_output = "profile.prof" if args.profile == "cprofile" else "profile.folded"
+            profiler = RunProfiler(args.profile, args.profile_output or default_output)
+        
+        results = []
+        runner = BatchRunner(items, task, workers, on_log=log, on_result=results.append, profiler=profiler,
+                             keep_samples=bool(args.stats), **hooks)
+        success_count, canceled = runner.run()
+    finally:
+        if cache is not None:
+            cache.close()
+    
+    log(runner.stats.format_summary(), "debug")
+    if args.stats:
+        runner.stats.export_json(args.stats)
+    if profiler is not None:
+        log(f"性能分析结果已保存到: {profiler.path}")
+    
+    if args.json:
+        summary.update(total=len(items), success=success_count, canceled=canceled,
+                       results=[vars(result) for result in results], stats=runner.stats.summary())
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print("任务已取消" if canceled else done_message.format(success_count))
+    
+    if canceled:
+        return 3
+    return 0 if success_count == len(items) else 1
+
+def run_watch_batch(runner: BatchRunner, args, settings: OutputSettings, scanner: FolderScanner,
+                    cache: EncodingCache | None, paths: list[str]) -> tuple[int, int]:
+    """用监视期间共用的 runner 转换一批文件并输出结果，返回 (文件数, 成功数)
+    
+    收尾钩子会关闭增量转换记录、清理输出文件名占位，因此每批重新创建任务；
+    runner 保留进程池，检测缓存也在各批之间共用。
+    """
+    import json
+    log = runner.log
+    files = [record.info() for record in collect_files(paths, scanner)]
+    task, hooks = convert_task_from_args(args, settings, cache)
+    results = []
+    runner.on_result = results.append
+    runner.load(files, task, **hooks)
+    success, _ = runner.run()
+    log(runner.stats.format_summary(), "debug")
+    if args.stats:
+        runner.stats.export_json(args.stats)
+    
+    if args.json:
+        print(json.dumps({'command': args.command, 'total': len(files), 'success': success,
+                          'results': [vars(result) for result in results]}, ensure_ascii=False), flush=True)
+    else:
+        print(f"转换了 {len(files)} 个新文件，成功 {success} 个", flush=True)
+    return len(files), success
+
+def run_watch_command(args, settings: OutputSettings, scanner: FolderScanner, log) -> int:
+    """监视文件夹，新文件写完后按转换参数分批转换，直到按 Ctrl+C 停止
+    
+    监视线程只负责发现文件，转换在当前线程中进行，转换期间到达的文件排队等待下一批。
+    """
+    folders = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            folders.append(path)
+        else:
+            log(f"不是文件夹，无法监视: {path}", "warning")
+    if not folders:
+        return 2
+    if args.profile:
+        log("watch 命令不支持性能分析，已忽略 --profile", "warning")
+    
+    batches = queue.Queue()
+    try:
+        # 输出文件夹位于监视范围内时不监视，否则输出文件会被再次转换
+        watcher = FolderWatcher(folders, batches.put, scanner, args.settle, args.watch_backend,
+                                [] if settings.modify_directly else [settings.output_dir], log, args.poll_interval)
+    except ValueError as e:
+        log(str(e), "error")
+        return 2
+    
+    cache = None
+    if args.source_encoding is None and not args.no_cache:
+        cache = EncodingCache()
+    total = success = 0
+    # 进程池在整个监视期间只创建一次，零散到来的文件不必每批都等待工作进程启动
+    runner = BatchRunner([], None, max(1, args.workers), on_log=log, keep_samples=bool(args.stats), keep_executor=True)
+    watcher.start()
+    try:
+        watcher.ready.wait()
+        if args.initial:
+            existing = [record.path for record in collect_files(folders, scanner, log)]
+            # 已有文件登记为已处理，原地转换替换文件时不会再次触发
+            watcher.ignore(existing)
+            if existing:
+                batches.put(existing)
+        log("正在监视文件夹，按 Ctrl+C 停止")
+        
+        while watcher.is_running():
+            try:
+                batch = batches.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            batch_total, batch_success = run_watch_batch(runner, args, settings, scanner, cache, batch)
+            total += batch_total
+            success += batch_success
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        runner.close()
+        if cache is not None:
+            cache.close()
+    
+    log(f"已停止监视，共转换 {total} 个文件，成功 {success} 个")
+    return 0 if success == total else 1
+
+if __name__ == "__main__":
+    sys.exit(cli_main())